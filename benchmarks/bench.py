@@ -0,0 +1,409 @@
+"""fsm benchmark suite
+
+Times machine construction, binding, perform and callback dispatch and
+saves the results as JSON so runs on different commits can be compared:
+
+    $ python benchmarks/bench.py --output before.json
+    $ python benchmarks/bench.py --output after.json --compare before.json
+
+Features newer than the first release are imported by the benchmarks
+using them, benchmarks of features missing from a commit are skipped.
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+
+import yaml
+
+from fsm import create_fsm, Fsm, FSM_SCHEMA
+from fsm.util import CallbackManager
+
+
+class Model:
+    def __init__(self):
+        self.count = 0
+
+    def on_callback(self):
+        self.count += 1
+
+
+class DescriptorModel(Model):
+    __slots__ = ("_fsm",)
+
+
+def ring_data(n_states, callbacks=False):
+    """Returns fsm data for a ring of n_states states, each with a `next`
+    action to the following state and a `stay` action to itself.
+    """
+    states = []
+    transitions = []
+    for i in range(n_states):
+        name = f"s{i}"
+        state = {"name": name}
+        if callbacks:
+            state["on_enter"] = "on_callback"
+            state["on_exit"] = "on_callback"
+        states.append(state)
+        transitions.append(
+            {
+                "action": "next",
+                "from_state": name,
+                "to_state": f"s{(i + 1) % n_states}",
+            }
+        )
+        transitions.append(
+            {"action": "stay", "from_state": name, "to_state": name}
+        )
+    if callbacks:
+        for t in transitions:
+            t["on_before"] = "on_callback"
+            t["on_after"] = "on_callback"
+    return {"start_state": "s0", "states": states, "transitions": transitions}
+
+
+def reset_data(n_states, wildcard):
+    """Returns ring_data() with a `reset` action to the first state from
+    every state, as one wildcard transition or one per state.
+    """
+    data = ring_data(n_states)
+    sources = ["*"] if wildcard else [s["name"] for s in data["states"]]
+    data["transitions"].extend(
+        {"action": "reset", "from_state": name, "to_state": "s0"}
+        for name in sources
+    )
+    return data
+
+
+def bench_import(modules):
+    if importlib.util.find_spec(modules) is None:
+        raise ImportError(f"No module named '{modules}'")
+    # a new interpreter per run, its startup time is included
+    command = [sys.executable, "-c", f"import {modules}"]
+
+    def run():
+        subprocess.run(command, check=True)
+
+    return run, 1
+
+
+def bench_yaml_load_validate(n_states):
+    doc = yaml.dump(ring_data(n_states))
+
+    def run():
+        FSM_SCHEMA(yaml.load(doc, Loader=yaml.Loader))
+
+    return run, 1
+
+
+def bench_load_data(n_states, cache=True):
+    from fsm.loader import load_data
+
+    doc = yaml.dump(ring_data(n_states))
+    load_data(doc=doc, cache=cache)
+
+    def run():
+        load_data(doc=doc, cache=cache)
+
+    return run, 1
+
+
+def bench_construct_fsm(n_states):
+    data = FSM_SCHEMA(ring_data(n_states))
+
+    def run():
+        Fsm(feedback=False, **data)
+
+    return run, 1
+
+
+def bench_construct_definition(n_states):
+    from fsm import FsmDefinition
+
+    data = FSM_SCHEMA(ring_data(n_states))
+
+    def run():
+        FsmDefinition(**data)
+
+    return run, 1
+
+
+def bench_construct_reset(n_states, wildcard):
+    from fsm import FsmDefinition
+
+    data = FSM_SCHEMA(reset_data(n_states, wildcard))
+
+    def run():
+        FsmDefinition(**data)
+
+    return run, 1
+
+
+def bench_fsm_set_model(n_models):
+    fsm = create_fsm(data=ring_data(10), feedback=False)
+    models = [Model() for _ in range(n_models)]
+
+    def run():
+        for model in models:
+            fsm.set_model(model)
+
+    return run, n_models
+
+
+def bench_definition_bind(n_models, descriptors=False):
+    from fsm import FsmDefinition
+
+    definition = FsmDefinition(**FSM_SCHEMA(ring_data(10)))
+    model_class = DescriptorModel if descriptors else Model
+    models = [model_class() for _ in range(n_models)]
+    bind = definition.bind
+
+    def run():
+        for model in models:
+            bind(model, descriptors=descriptors)
+
+    return run, n_models
+
+
+def bench_fsm_perform(steps, callbacks=False):
+    fsm = create_fsm(
+        data=ring_data(10, callbacks), model=Model(), feedback=False
+    )
+    perform = fsm.perform
+
+    def run():
+        for _ in range(steps):
+            perform("next")
+
+    return run, steps
+
+
+def bench_bound_perform(steps, callbacks=False):
+    from fsm import FsmDefinition
+
+    definition = FsmDefinition(**FSM_SCHEMA(ring_data(10, callbacks)))
+    perform = definition.bind(Model()).perform
+
+    def run():
+        for _ in range(steps):
+            perform("next")
+
+    return run, steps
+
+
+def bench_bound_perform_id(steps, callbacks=False):
+    from fsm import FsmDefinition
+
+    definition = FsmDefinition(**FSM_SCHEMA(ring_data(10, callbacks)))
+    perform_id = definition.bind(Model()).perform_id
+    action_id = definition.action_id("next")
+
+    def run():
+        for _ in range(steps):
+            perform_id(action_id)
+
+    return run, steps
+
+
+def bench_minimize(n_states):
+    from fsm import FsmDefinition
+    from fsm.analysis import minimize
+
+    definition = FsmDefinition(**FSM_SCHEMA(ring_data(n_states)))
+
+    def run():
+        minimize(definition)
+
+    return run, 1
+
+
+def bench_timeouts(n_machines):
+    from fsm import FsmDefinition
+    from fsm.timeout import TimeoutScheduler
+
+    definition = FsmDefinition(
+        states=[
+            {"name": "pending", "timeout": 30, "on_timeout": "expire"},
+            "expired",
+        ],
+        transitions=[
+            {
+                "action": "expire",
+                "from_state": "pending",
+                "to_state": "expired",
+            }
+        ],
+        start_state="pending",
+    )
+
+    def run():
+        scheduler = TimeoutScheduler(clock=lambda: 0.0)
+        for _ in range(n_machines):
+            scheduler.attach(definition.bind(Model()))
+        scheduler.run_due(now=30)
+
+    return run, n_machines
+
+
+def bench_get_actions(calls):
+    fsm = create_fsm(data=ring_data(10), feedback=False)
+    get_actions = fsm.get_actions
+
+    def run():
+        for _ in range(calls):
+            get_actions()
+
+    return run, calls
+
+
+def bench_available_actions(calls):
+    from fsm import FsmDefinition
+
+    machine = FsmDefinition(**FSM_SCHEMA(ring_data(10))).bind()
+
+    def run():
+        for _ in range(calls):
+            machine.available_actions
+
+    return run, calls
+
+
+def bench_call_on(calls):
+    cbm = CallbackManager(["on_callback", "missing"])
+    model = Model()
+    call_on = cbm.call_on
+
+    def run():
+        for _ in range(calls):
+            call_on(model)
+
+    return run, calls
+
+
+BENCHMARKS = {
+    "import_fsm": (bench_import, ("fsm",)),
+    "import_fsm_loader": (bench_import, ("fsm.loader",)),
+    "yaml_load_validate_small": (bench_yaml_load_validate, (10,)),
+    "yaml_load_validate_1k": (bench_yaml_load_validate, (1000,)),
+    "load_data_1k": (bench_load_data, (1000, False)),
+    "load_data_cached_1k": (bench_load_data, (1000,)),
+    "construct_fsm_small": (bench_construct_fsm, (10,)),
+    "construct_fsm_10k": (bench_construct_fsm, (10000,)),
+    "construct_definition_small": (bench_construct_definition, (10,)),
+    "construct_definition_10k": (bench_construct_definition, (10000,)),
+    "construct_reset_10k": (bench_construct_reset, (10000, False)),
+    "construct_reset_wildcard_10k": (bench_construct_reset, (10000, True)),
+    "fsm_set_model_1k": (bench_fsm_set_model, (1000,)),
+    "definition_bind_10k": (bench_definition_bind, (10000,)),
+    "definition_bind_descriptors_10k": (
+        bench_definition_bind,
+        (10000, True),
+    ),
+    "fsm_perform": (bench_fsm_perform, (10000,)),
+    "fsm_perform_callbacks": (bench_fsm_perform, (10000, True)),
+    "bound_perform": (bench_bound_perform, (10000,)),
+    "bound_perform_callbacks": (bench_bound_perform, (10000, True)),
+    "bound_perform_id": (bench_bound_perform_id, (10000,)),
+    "minimize_10k": (bench_minimize, (10000,)),
+    "timeouts_100k": (bench_timeouts, (100000,)),
+    "get_actions": (bench_get_actions, (10000,)),
+    "available_actions": (bench_available_actions, (10000,)),
+    "callback_manager_call_on": (bench_call_on, (10000,)),
+}
+
+
+def run_benchmark(run, ops, repeat, min_time):
+    """Times a benchmark, returns per operation timings in nanoseconds"""
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    # scale up to the minimum run time for more stable results
+    number = max(1, int(number * min_time / 0.2))
+    times = [t / number / ops * 1e9 for t in timer.repeat(repeat, number)]
+    return {
+        "ops": ops,
+        "loops": number,
+        "best_ns": min(times),
+        "median_ns": statistics.median(times),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Prints the change of each benchmark's best time against a baseline"""
+    print(f"\n{'benchmark':40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        change = result["best_ns"] / base["best_ns"] - 1
+        print(
+            f"{name:40} {base['best_ns']:12.1f} {result['best_ns']:12.1f}"
+            f" {change:+8.1%}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="save results to a JSON file")
+    parser.add_argument("--compare", help="baseline JSON results file")
+    parser.add_argument(
+        "-k", dest="filter", help="only run benchmarks containing this text"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="minimum seconds per timing repeat",
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, (factory, bench_args) in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            run, ops = factory(*bench_args)
+        except (ImportError, AttributeError) as error:
+            # the feature is missing from this commit
+            print(f"{name:40} skipped: {error}")
+            continue
+        result = run_benchmark(run, ops, args.repeat, args.min_time)
+        results[name] = result
+        print(
+            f"{name:40} {result['best_ns']:12.1f} ns/op"
+            f" (median {result['median_ns']:.1f})"
+        )
+
+    report = {
+        "commit": git_commit(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(report, fout, indent=2)
+    if args.compare:
+        with open(args.compare) as fin:
+            compare(results, json.load(fin))
+
+
+if __name__ == "__main__":
+    main()
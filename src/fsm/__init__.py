@@ -5,10 +5,22 @@ __license__ = "Apache 2.0"
 __summary__ = "A finite state machine in Python"
 __uri__ = "https://github.com/tantonb/fsm"
 
-from fsm.fsm import Fsm, FsmError, create_fsm
+from fsm.fsm import Fsm, FsmError, create_definition, create_fsm
 
-from fsm.schema import CB_SCHEMA, STATE_SCHEMA, TRANSITION_SCHEMA, FSM_SCHEMA
+from fsm.definition import BoundFsm, FsmDefinition
 
 from fsm.state import State
 
 from fsm.transition import Transition
+
+# the schemas import voluptuous, which is slow to import, so they are only
+# imported when used; yaml is imported by fsm.loader on first use too
+_SCHEMAS = ("CB_SCHEMA", "STATE_SCHEMA", "TRANSITION_SCHEMA", "FSM_SCHEMA")
+
+
+def __getattr__(name):
+    if name in _SCHEMAS:
+        from fsm import schema
+
+        return getattr(schema, name)
+    raise AttributeError(f"module 'fsm' has no attribute '{name}'")
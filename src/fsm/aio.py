@@ -0,0 +1,146 @@
+"""AsyncFsm
+An asyncio state machine whose callbacks may be coroutines.
+"""
+
+import asyncio
+from inspect import isawaitable
+from time import perf_counter
+
+from fsm.error import FsmError
+from fsm.fsm import Fsm
+from fsm.observer import callback_name
+
+
+async def _call_hooks(callbacks, model):
+    """Calls resolved callbacks in order, awaiting any awaitable results"""
+    for cb in callbacks:
+        result = cb(model)
+        if isawaitable(result):
+            await result
+
+
+async def _call_observed(machine, callbacks, hook, owner):
+    """_call_hooks() reporting each callback to the machine's observer,
+    also when it raises.
+    """
+    observer = machine.observer
+    model = machine.model
+    for cb in callbacks:
+        name = callback_name(cb)
+        observer.callback_started(machine, hook, name, owner)
+        start = perf_counter()
+        try:
+            result = cb(model)
+            if isawaitable(result):
+                await result
+        finally:
+            elapsed = perf_counter() - start
+            observer.callback_finished(machine, hook, name, owner, elapsed)
+
+
+class AsyncFsm(Fsm):
+    """A finite state machine for asyncio applications.
+
+    Transitions are performed with `await fsm.aperform(action)` and the
+    action methods added to the model return awaitables.  Callbacks may be
+    plain methods or coroutines, coroutines are awaited so the callback
+    order on_before, on_exit, on_enter, on_after is preserved.
+
+    Transitions of a machine, and so of its model, are serialized with an
+    asyncio lock while independent machines progress concurrently.
+    Performing an action on the same machine from within one of its
+    callbacks raises FsmError rather than deadlocking.  The inherited
+    synchronous perform() does not await callbacks.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._lock = asyncio.Lock()
+        self._owner = None
+        super().__init__(*args, **kwargs)
+
+    def trigger(self, action):
+        """Model action methods return the aperform() awaitable"""
+        return self.aperform(action)
+
+    async def aperform(self, action):
+        """Performs an action to trigger a state transition, awaiting
+        coroutine callbacks. Raises FsmError if action is not valid for the
+        current state.  Returns the Transition performed.
+        """
+        action_id = self._definition._table._action_ids.get(action)
+        if action_id is None:
+            raise self._invalid_action(action)
+        return await self.aperform_id(action_id)
+
+    async def aperform_id(self, action_id):
+        """Performs an action by id, see aperform()"""
+        return await self._aperform_locked(action_id, None)
+
+    async def aperform_if(self, expected_state, action):
+        """Performs an action only if the current state is expected_state
+        once the machine's lock is held.  Returns the Transition performed,
+        or None if the state differs.
+        """
+        action_id = self._definition._table._action_ids.get(action)
+        if action_id is None:
+            raise self._invalid_action(action)
+        return await self._aperform_locked(action_id, expected_state)
+
+    async def _aperform_locked(self, action_id, expected_state):
+        task = asyncio.current_task()
+        if self._owner is task:
+            raise FsmError(
+                "Cannot perform an action while a transition is in progress"
+            )
+        async with self._lock:
+            if expected_state is not None and self.state != expected_state:
+                return None
+            self._owner = task
+            try:
+                transition = await self._aperform_id(action_id)
+            finally:
+                self._owner = None
+        return transition
+
+    async def _aperform_id(self, action_id):
+        # the state is checked once the lock is held
+        tid, state_id = self._select_transition(action_id)
+        table = self._definition._table
+        transition = table._transitions[tid]
+        hooks = self._hooks
+        observer = self._observer
+
+        if observer is None:
+            model = self._model
+            await _call_hooks(hooks.on_before[tid], model)
+            if state_id != self._state:
+                exit_levels, enter_levels = self._chain_levels(state_id)
+                for _, callbacks in exit_levels:
+                    await _call_hooks(callbacks, model)
+                self._set_state_id(state_id)
+                for _, callbacks in enter_levels:
+                    await _call_hooks(callbacks, model)
+            await _call_hooks(hooks.on_after[tid], model)
+            return transition
+
+        from_state = table._state_names[self._state]
+        observer.transition_started(self, transition, from_state)
+        start = perf_counter()
+        try:
+            await _call_observed(
+                self, hooks.on_before[tid], "on_before", transition
+            )
+            if state_id != self._state:
+                exit_levels, enter_levels = self._chain_levels(state_id)
+                for state, callbacks in exit_levels:
+                    await _call_observed(self, callbacks, "on_exit", state)
+                self._set_state_id(state_id)
+                for state, callbacks in enter_levels:
+                    await _call_observed(self, callbacks, "on_enter", state)
+            await _call_observed(
+                self, hooks.on_after[tid], "on_after", transition
+            )
+        finally:
+            elapsed = perf_counter() - start
+            observer.transition_finished(self, transition, from_state, elapsed)
+        return transition
@@ -0,0 +1,331 @@
+"""Analysis
+Static analysis and minimization of compiled state machine definitions.
+Both work on the integer transition table, not on the State and Transition
+objects, so large definitions are analysed quickly.
+"""
+
+from collections import deque, namedtuple
+
+from fsm.definition import FsmDefinition
+from fsm.hooks import ancestors
+from fsm.table import GUARDED
+from fsm.transition import guard_source, Transition
+
+# state names of a definition by category, actions never performed from a
+# reachable state and states only named by transitions
+Analysis = namedtuple(
+    "Analysis",
+    "reachable unreachable dead_ends sinks unused_actions undefined",
+)
+
+# minimized definition and the mapping of each original state name to the
+# name of the state it was merged into
+Minimization = namedtuple("Minimization", "definition state_map")
+
+
+def _edges(table, state_id):
+    """Yields (action id, candidate position, next state id) tuples of a
+    state's transitions, every candidate of guarded transitions included.
+    """
+    stride = table._stride
+    next_state = table._next
+    base = state_id * stride
+    for aid in range(len(table._action_names)):
+        to_id = next_state[base + aid]
+        if to_id >= 0:
+            yield aid, 0, to_id
+        elif to_id == GUARDED:
+            for k, tid in enumerate(table._guarded[base + aid]):
+                to_state = table._transitions[tid].to_state
+                yield aid, k, table._state_ids[to_state]
+
+
+def _successors(table, state_id):
+    """Yields (action id, next state id) pairs of a state's transitions"""
+    for aid, _, to_id in _edges(table, state_id):
+        yield aid, to_id
+
+
+def _reachable_ids(definition):
+    """Returns a list of state ids reachable from the start state, in
+    breadth first order.
+    """
+    table = definition.table
+    start_id = definition.state_id(definition.start_state)
+    seen = {start_id}
+    order = [start_id]
+    queue = deque(order)
+    while queue:
+        for _, to_id in _successors(table, queue.popleft()):
+            if to_id not in seen:
+                seen.add(to_id)
+                order.append(to_id)
+                queue.append(to_id)
+    return order
+
+
+def reachable_states(definition):
+    """Returns a list of the state names reachable from the start state"""
+    names = definition.table._state_names
+    return [names[sid] for sid in _reachable_ids(definition)]
+
+
+def analyze(definition):
+    """Returns an Analysis of a definition.
+
+    Dead ends are states without transitions, sinks are states whose
+    transitions all lead back to themselves.  Unused actions have no
+    transition from a reachable state.  Undefined states are only named by
+    transitions, machines can not enter them.
+    """
+    table = definition.table
+    names = table._state_names
+    reachable = _reachable_ids(definition)
+    reachable_set = set(reachable)
+
+    dead_ends = []
+    sinks = []
+    used_actions = set()
+    for sid in range(len(names)):
+        successors = list(_successors(table, sid))
+        if not successors:
+            dead_ends.append(names[sid])
+        elif all(to_id == sid for _, to_id in successors):
+            sinks.append(names[sid])
+        if sid in reachable_set:
+            used_actions.update(aid for aid, _ in successors)
+
+    return Analysis(
+        reachable=[names[sid] for sid in reachable],
+        unreachable=[
+            names[sid] for sid in range(len(names)) if sid not in reachable_set
+        ],
+        dead_ends=dead_ends,
+        sinks=sinks,
+        unused_actions=[
+            name
+            for aid, name in enumerate(table._action_names)
+            if aid not in used_actions
+        ],
+        undefined=[
+            names[sid] for sid, s in enumerate(table._states) if s is None
+        ],
+    )
+
+
+def _signature(table, state_id, transition_behaviour):
+    """Returns the observable behaviour of a state which does not depend on
+    other states: its callbacks and the actions it accepts with the guards
+    and callbacks of their transitions.
+    """
+    state = table._states[state_id]
+    if state is None:
+        own = None
+    else:
+        own = (
+            tuple(state.on_enter.callbacks),
+            tuple(state.on_exit.callbacks),
+            state.timeout,
+            state.on_timeout,
+            tuple(ancestors(state)),
+        )
+    actions = []
+    for aid in range(len(table._action_names)):
+        tids = table.candidates(state_id, aid)
+        if tids:
+            actions.append(
+                (aid, tuple(transition_behaviour[tid] for tid in tids))
+            )
+    return own, tuple(actions)
+
+
+def _partition(definition, state_ids):
+    """Partitions states into blocks of equivalent states with Hopcroft's
+    algorithm.  Returns a dict of state id to block number.
+    """
+    table = definition.table
+    n_actions = len(table._action_names)
+
+    transition_behaviour = [
+        (
+            guard_source(t),
+            tuple(t.on_before.callbacks),
+            tuple(t.on_after.callbacks),
+        )
+        for t in table._transitions
+    ]
+
+    # initial blocks group states with the same signature
+    blocks = []
+    block_of = {}
+    by_signature = {}
+    for sid in state_ids:
+        signature = _signature(table, sid, transition_behaviour)
+        b = by_signature.get(signature)
+        if b is None:
+            b = by_signature[signature] = len(blocks)
+            blocks.append(set())
+        blocks[b].add(sid)
+        block_of[sid] = b
+
+    # inverse transitions: (target id * labels + label) to source ids, the
+    # label of an edge is its action id and candidate position
+    edges = [(sid, list(_edges(table, sid))) for sid in state_ids]
+    candidates = 1 + max(
+        (k for _, out in edges for _, k, _ in out), default=0
+    )
+    labels = n_actions * candidates
+    inverse = {}
+    for sid, out in edges:
+        for aid, k, to_id in out:
+            key = to_id * labels + k * n_actions + aid
+            inverse.setdefault(key, []).append(sid)
+
+    # states changing state observably: with callbacks, a timeout or
+    # enclosing composite states
+    observable = set()
+    for sid in state_ids:
+        state = table._states[sid]
+        if state is not None and (
+            state.on_enter.callbacks
+            or state.on_exit.callbacks
+            or state.timeout is not None
+            or state.parent is not None
+        ):
+            observable.add(sid)
+
+    # states of a block accept the same actions, so splitting by a block
+    # also splits by its complement and the largest block can be left out
+    work = set(range(len(blocks)))
+    work.discard(max(work, key=lambda b: len(blocks[b])))
+    while work:
+        while work:
+            splitter = list(blocks[work.pop()])
+            for label in range(labels):
+                # states moving into the splitter with this label, by block
+                touched = {}
+                for to_id in splitter:
+                    for sid in inverse.get(to_id * labels + label, ()):
+                        touched.setdefault(block_of[sid], []).append(sid)
+                for b, members in touched.items():
+                    block = blocks[b]
+                    if len(members) == len(block):
+                        continue
+                    # move the smaller part to the new block so each state
+                    # moves O(log n) times
+                    moved = set(members)
+                    if 2 * len(moved) > len(block):
+                        moved = block - moved
+                    block -= moved
+                    new = len(blocks)
+                    blocks.append(moved)
+                    for sid in moved:
+                        block_of[sid] = new
+                    # processing the smaller part is enough unless the
+                    # block still had to be processed as a whole
+                    work.add(new)
+
+        # a transition between two states of a block becomes a self
+        # transition once they are merged, which does not call on_exit and
+        # on_enter or restart timeouts, so such states are split off and
+        # the blocks refined again
+        for sid, out in edges:
+            for _, _, to_id in out:
+                if (
+                    to_id != sid
+                    and block_of[to_id] == block_of[sid]
+                    and (sid in observable or to_id in observable)
+                ):
+                    for split in (sid, to_id):
+                        b = block_of[split]
+                        if len(blocks[b]) > 1:
+                            blocks[b].discard(split)
+                            block_of[split] = len(blocks)
+                            blocks.append({split})
+                            work.update((b, block_of[split]))
+    return block_of
+
+
+def minimize(definition, reachable_only=True):
+    """Returns a Minimization with a new definition in which equivalent
+    states are merged.
+
+    States are equivalent if they accept the same actions, with the same
+    transition guards and callbacks, leading to equivalent states and have
+    the same on_enter and on_exit callbacks, timeouts and enclosing
+    composite states, so a minimized machine calls exactly the same
+    callbacks.  States with such callbacks are not merged with the states
+    they transition to or from, which would turn the transition into a self
+    transition.  Each group of equivalent states is replaced by its first
+    state, the start state if in the group.  Unreachable states are dropped
+    unless reachable_only is disabled.  The definition itself is returned
+    if it is already minimal.
+    """
+    table = definition.table
+    names = table._state_names
+    if reachable_only:
+        state_ids = _reachable_ids(definition)
+    else:
+        state_ids = range(len(names))
+    block_of = _partition(definition, state_ids)
+    if len(state_ids) == len(names) and len(set(block_of.values())) == len(
+        names
+    ):
+        # nothing to merge or drop
+        return Minimization(definition, {name: name for name in names})
+
+    start_id = definition.state_id(definition.start_state)
+    representative = {block_of[start_id]: start_id}
+    for sid in state_ids:
+        representative.setdefault(block_of[sid], sid)
+
+    # State and Transition objects are shared with the original definition
+    # unless a transition now leads from or to different states.  An
+    # unguarded transition alone in its table cells stays shared by the
+    # states it leads from to the same state, guarded candidates are kept
+    # per state to keep their order.
+    states = []
+    cells = []
+    shared = {}
+    for b, sid in sorted(representative.items(), key=lambda i: i[1]):
+        state = table._states[sid]
+        if state is not None:
+            states.append(state)
+        for aid in range(len(table._action_names)):
+            tids = table.candidates(sid, aid)
+            for tid in tids:
+                t = table._transitions[tid]
+                next_id = table._state_ids[t.to_state]
+                to_id = representative[block_of[next_id]]
+                if len(tids) > 1 or t.guard is not None:
+                    cells.append((t, to_id, [names[sid]]))
+                    continue
+                rows = shared.get((tid, to_id))
+                if rows is None:
+                    rows = shared[tid, to_id] = []
+                    cells.append((t, to_id, rows))
+                rows.append(names[sid])
+
+    transitions = []
+    for t, to_id, rows in cells:
+        from_state = rows[0] if len(rows) == 1 else tuple(rows)
+        if from_state != t.from_state or names[to_id] != t.to_state:
+            t = Transition(
+                t.action,
+                from_state,
+                names[to_id],
+                on_before=t.on_before.callbacks,
+                on_after=t.on_after.callbacks,
+                guard=guard_source(t),
+            )
+        transitions.append(t)
+
+    minimized = FsmDefinition(
+        states=states,
+        transitions=transitions,
+        start_state=names[representative[block_of[start_id]]],
+    )
+    state_map = {
+        names[sid]: names[representative[block_of[sid]]] for sid in state_ids
+    }
+    return Minimization(minimized, state_map)
@@ -0,0 +1,156 @@
+"""BatchFsm
+Vectorized state machine driving the states of many entities that share a
+single FsmDefinition.  Requires numpy.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from fsm.error import FsmError
+from fsm.table import GUARDED
+
+# action id meaning "no action" for an entity in a step
+NO_ACTION = -1
+
+
+class BatchResult:
+    """Outcome of a batch step.
+
+    success and invalid are boolean masks over the entities, entities that
+    were not stepped are in neither.  transition_ids holds the id of the
+    transition performed by each entity or -1.
+    """
+
+    __slots__ = ("success", "invalid", "transition_ids")
+
+    def __init__(self, success, invalid, transition_ids):
+        self.success = success
+        self.invalid = invalid
+        self.transition_ids = transition_ids
+
+    def groups(self):
+        """Returns a mapping of transition id to an array of the indices of
+        the entities that performed it, so callbacks can be run in bulk.
+        """
+        indices = np.flatnonzero(self.success)
+        tids = self.transition_ids[indices]
+        order = np.argsort(tids, kind="stable")
+        tids, indices = tids[order], indices[order]
+        keys, starts = np.unique(tids, return_index=True)
+        return {
+            int(tid): group
+            for tid, group in zip(keys, np.split(indices, starts[1:]))
+        }
+
+
+class BatchFsm:
+    """Holds the states of N entities as a numpy array of state ids and
+    applies actions to all of them in single vectorized steps using the
+    definition's transition table.
+
+    Callbacks are not called, invalid actions are reported in the returned
+    BatchResult instead of raising FsmError.  Guards need a model, so
+    guarded transitions are reported as invalid.
+    """
+
+    def __init__(self, definition, size=None, states=None):
+        if np is None:
+            raise ImportError("BatchFsm requires numpy")
+
+        table = definition.table
+        self._definition = definition
+        self._stride = table.stride
+        self._next = np.array(table._next, dtype=np.int32)
+        self._tran = np.array(table._tran, dtype=np.int32)
+
+        # transitions into states that are not declared can never succeed
+        undeclared = [i for i, s in enumerate(table._states) if s is None]
+        if undeclared:
+            self._tran[np.isin(self._next, undeclared)] = -1
+        self._tran[self._next == GUARDED] = -1
+
+        if states is None:
+            if size is None:
+                raise ValueError("Either size or states must be provided")
+            start = definition.state_id(definition.start_state)
+            states = np.full(size, start, dtype=np.int32)
+        else:
+            states = np.array(states, dtype=np.int32)
+            if states.size and (
+                states.min() < 0 or states.max() >= len(table._states)
+            ):
+                raise FsmError("Invalid state ids")
+        self._states = states
+
+    @property
+    def definition(self):
+        return self._definition
+
+    @property
+    def states(self):
+        """Returns the array of entity state ids"""
+        return self._states
+
+    def __len__(self):
+        return len(self._states)
+
+    def state_names(self, indices=None):
+        """Returns a list of the state names of all or selected entities"""
+        names = self._definition.state_names
+        states = self._states if indices is None else self._states[indices]
+        return [names[sid] for sid in states.tolist()]
+
+    def encode_actions(self, actions):
+        """Converts an iterable of action names into an array of action ids.
+        None maps to NO_ACTION, unknown names to an id that is always
+        invalid.
+        """
+        table = self._definition.table
+        unknown = self._stride
+        return np.array(
+            [
+                NO_ACTION if a is None else table._action_ids.get(a, unknown)
+                for a in actions
+            ],
+            dtype=np.int32,
+        )
+
+    def step(self, actions, mask=None):
+        """Applies an array of action ids, one per entity, in a single step.
+        Entities with NO_ACTION or excluded by the optional boolean mask are
+        left alone.  Returns a BatchResult.
+        """
+        actions = np.asarray(actions, dtype=np.int32)
+        if actions.shape != self._states.shape:
+            raise ValueError("One action is required per entity")
+
+        active = actions != NO_ACTION
+        if mask is not None:
+            active &= np.asarray(mask, dtype=bool)
+        in_range = (actions >= 0) & (actions < self._stride)
+
+        selected = np.flatnonzero(active & in_range)
+        index = self._states[selected] * self._stride + actions[selected]
+        tids = self._tran[index]
+        ok = tids >= 0
+        moved = selected[ok]
+        self._states[moved] = self._next[index[ok]]
+
+        success = np.zeros(len(self._states), dtype=bool)
+        success[moved] = True
+        invalid = active & ~in_range
+        invalid[selected[~ok]] = True
+        transition_ids = np.full(len(self._states), -1, dtype=np.int32)
+        transition_ids[moved] = tids[ok]
+        return BatchResult(success, invalid, transition_ids)
+
+    def perform(self, action, mask=None):
+        """Applies one action, by name or id, to all entities or to those
+        selected by a boolean mask.  Returns a BatchResult.
+        """
+        if isinstance(action, str):
+            action = self._definition.action_id(action)
+        actions = np.full(len(self._states), action, dtype=np.int32)
+        return self.step(actions, mask=mask)
@@ -0,0 +1,1072 @@
+"""FsmDefinition
+A compiled state machine definition that is built once and shared by any
+number of lightweight machines, each bound to a single model.
+"""
+
+from time import perf_counter
+
+from fsm.error import FsmError
+from fsm.hooks import ancestors, Hooks
+from fsm.model import install_model_class, set_machine, unset_machine
+from fsm.observer import callback_name, ObserverGroup
+from fsm.profiler import Profiler
+from fsm.state import State
+from fsm.table import GUARDED, NO_TRANSITION, TransitionTable
+from fsm.transition import guard_source, Transition, WILDCARD
+
+
+def as_objects(data):
+    """Returns valid data with states and transitions converted to new
+    State and Transition objects, which need no further validation.
+    Composite state data is left for the definition to build.
+    """
+    data = dict(data)
+    data["states"] = [
+        State(s) if isinstance(s, str) else s if "states" in s else State(**s)
+        for s in data["states"]
+    ]
+    data["transitions"] = [Transition(**t) for t in data["transitions"]]
+    return data
+
+
+class FsmDefinition:
+    """The states, transitions and start state of a state machine.
+
+    A definition is validated and built once, it is not changed afterwards
+    so it can be shared by any number of BoundFsm instances.  Binding a model
+    does not revalidate or rebuild anything, each bound machine only carries
+    a reference to the definition, the model and the current state.
+    """
+
+    def __init__(self, states=None, transitions=None, start_state=None):
+        self._start_state = start_state
+        self._states = {}
+        self._transitions = {}
+        self._table = TransitionTable()
+        self._model_classes = set()
+        self._hooks = {}
+        # composite states by name, the names of the states each encloses
+        # and the depth of the state declaring each (state, action, guard)
+        self._composites = {}
+        self._leaves = {}
+        self._declared = {}
+        # WILDCARD transitions in order, also applied to states added later
+        self._wildcards = []
+        self._reset_indexes()
+
+        # for now explicit start state is required
+        # but might be auto generated in the future
+        if start_state is None:
+            raise FsmError("No start state provided")
+
+        if states:
+            self._add_states(states)
+            self._start_state = self._initial_leaf(start_state)
+
+        if transitions:
+            self._add_transitions(transitions)
+            self._check_timeouts()
+
+    def __getstate__(self):
+        # model class caches are rebuilt on use, classes may not pickle
+        state = self.__dict__.copy()
+        state["_model_classes"] = set()
+        state["_hooks"] = {}
+        return state
+
+    @classmethod
+    def from_data(cls, data, validate=True):
+        """Builds a definition from fsm data, validated with FSM_SCHEMA.
+
+        Data known to be valid, such as generated data, can skip validation
+        and is then converted to State and Transition objects as is.  This
+        is much faster and does not import voluptuous unless there are
+        composite states, which are still checked.
+        """
+        if validate:
+            from fsm.schema import FSM_SCHEMA
+
+            data = FSM_SCHEMA(data)
+        return cls(**as_objects(data))
+
+    @property
+    def start_state(self):
+        return self._start_state
+
+    @property
+    def table(self):
+        """Returns the integer indexed TransitionTable"""
+        return self._table
+
+    @property
+    def state_names(self):
+        """Returns a tuple of state names indexed by state id"""
+        return self._table.state_names
+
+    @property
+    def action_names(self):
+        """Returns a tuple of action names indexed by action id"""
+        return self._table.action_names
+
+    def state_id(self, name):
+        """Returns the integer id of a state name"""
+        state_id = self._table.state_id(name)
+        if state_id is None:
+            raise FsmError("Invalid state", name)
+        return state_id
+
+    def action_id(self, name):
+        """Returns the integer id of an action name, for perform_id()"""
+        action_id = self._table.action_id(name)
+        if action_id is None:
+            raise FsmError("Invalid action", name)
+        return action_id
+
+    @property
+    def states(self):
+        """Returns a list of the State objects in the definition"""
+        return list(self._states.values())
+
+    @property
+    def composite_states(self):
+        """Returns a list of the composite State objects, machines are
+        never in these states but in the states they enclose.
+        """
+        return list(self._composites.values())
+
+    @property
+    def transitions(self):
+        """Returns a list of the Transition objects in the definition,
+        guarded candidates in evaluation order.  Transitions shared by
+        several states are listed once.
+        """
+        return list(dict.fromkeys(tran for _, tran in self._cells()))
+
+    @property
+    def actions(self):
+        """Returns a list of the distinct action names in the definition"""
+        return list(
+            dict.fromkeys(
+                action
+                for actions in self._transitions.values()
+                for action in actions
+            )
+        )
+
+    def get_actions(self, state):
+        """Returns a list of action names available in a state"""
+        return list(self.actions_of(state))
+
+    def actions_of(self, state):
+        """Returns a tuple of the action names available in a state.  The
+        tuples are maintained as transitions are added, not built per call.
+        """
+        state_id = self._table._state_ids.get(state)
+        if state_id is None or state_id >= len(self._state_actions):
+            return ()
+        return self._state_actions[state_id]
+
+    def states_accepting(self, action):
+        """Returns a frozenset of the names of states with a transition for
+        an action.
+        """
+        states = self._accepting.get(action)
+        if states is None:
+            states = frozenset(self._sources.get(action, ()))
+            if action in self._sources:
+                self._accepting[action] = states
+        return states
+
+    def incoming_transitions(self, state):
+        """Returns a tuple of the Transitions leading to a state"""
+        transitions = self._incoming_tuples.get(state)
+        if transitions is None:
+            # transitions shared by several states are listed once
+            transitions = tuple(
+                dict.fromkeys(self._incoming.get(state, {}).values())
+            )
+            if state in self._incoming:
+                self._incoming_tuples[state] = transitions
+        return transitions
+
+    def bind(
+        self,
+        model=None,
+        descriptors=False,
+        thread_safe=False,
+        run_to_completion=False,
+    ):
+        """Returns a new BoundFsm managing the state of the model.  The
+        machine will use itself as the model if none is provided.
+
+        With descriptors enabled the state property, is_<state> and action
+        methods are installed once on the model's class (see
+        install_model_class) and the model only gets a reference to its
+        machine.
+
+        With thread_safe enabled transitions of the machine are serialized
+        with a lock of its own, see fsm.threadsafe.
+
+        With run_to_completion enabled actions performed by callbacks are
+        queued until the current transition completes, see fsm.queued.
+        """
+        if thread_safe and run_to_completion:
+            from fsm.threadsafe import (
+                ThreadSafeRunToCompletionBoundFsm,
+                ThreadSafeRunToCompletionDescriptorBoundFsm,
+            )
+
+            if descriptors:
+                return ThreadSafeRunToCompletionDescriptorBoundFsm(self, model)
+            return ThreadSafeRunToCompletionBoundFsm(self, model)
+        if thread_safe:
+            from fsm.threadsafe import (
+                ThreadSafeBoundFsm,
+                ThreadSafeDescriptorBoundFsm,
+            )
+
+            if descriptors:
+                return ThreadSafeDescriptorBoundFsm(self, model)
+            return ThreadSafeBoundFsm(self, model)
+        if run_to_completion:
+            from fsm.queued import (
+                RunToCompletionBoundFsm,
+                RunToCompletionDescriptorBoundFsm,
+            )
+
+            if descriptors:
+                return RunToCompletionDescriptorBoundFsm(self, model)
+            return RunToCompletionBoundFsm(self, model)
+        if descriptors:
+            return DescriptorBoundFsm(self, model)
+        return BoundFsm(self, model)
+
+    def install_model_class(self, model_class):
+        """Installs the definition's states and actions on a model class,
+        classes already installed are skipped.
+        """
+        if model_class not in self._model_classes:
+            install_model_class(
+                model_class,
+                states=list(self._states),
+                actions=self.actions,
+            )
+            self._model_classes.add(model_class)
+
+    def resolve_hooks(self, model_class, refresh=False):
+        """Returns the callbacks resolved against a model class as Hooks.
+        Resolved hooks are cached per class and shared by bound machines,
+        use refresh to resolve again after the model class has changed.
+        """
+        hooks = None if refresh else self._hooks.get(model_class)
+        if hooks is None:
+            hooks = Hooks(self._table, model_class)
+            self._hooks[model_class] = hooks
+        return hooks
+
+    def _add_state(self, state, parent=None):
+        """Adds a new state, returns the State object.  Composite state data
+        also adds the states it encloses.
+        """
+        children = None
+
+        # ensure state has type State (can convert from str name)
+        if isinstance(state, str):
+            state = State(state, parent=parent)
+        elif not isinstance(state, State):
+            # schemas are imported on first use, see fsm.schema
+            from voluptuous import MultipleInvalid
+            from fsm.schema import STATE_SCHEMA
+
+            try:
+                data = STATE_SCHEMA(state)
+            except MultipleInvalid:
+                raise ValueError("Invalid state data", state)
+            children = data.pop("states", None)
+            if children:
+                first = children[0]
+                if not isinstance(first, str):
+                    first = first["name"]
+                data.setdefault("initial", first)
+            elif "initial" in data:
+                raise ValueError(
+                    "Only composite states have an initial", state
+                )
+            state = State(parent=parent, **data)
+
+        if state.name == WILDCARD:
+            raise ValueError("Reserved state name", state.name)
+        if children:
+            self._add_composite(state, children)
+            return state
+        if state.name in self._composites:
+            raise ValueError("Duplicate state name", state.name)
+        self._states[state.name] = state
+        self._table.add_state(state)
+        self._index_ancestors(state)
+        for transition in self._wildcards:
+            self._add_flat_transition(transition, (state.name,))
+        return state
+
+    def _add_composite(self, state, children):
+        """Adds a composite state and the states it encloses"""
+        if state.timeout is not None:
+            raise ValueError("Composite states can not time out", state.name)
+        if state.name in self._states or state.name in self._composites:
+            raise ValueError("Duplicate state name", state.name)
+        self._composites[state.name] = state
+        self._leaves[state.name] = []
+        names = [self._add_state(child, state).name for child in children]
+        if state.initial not in names:
+            raise ValueError(
+                "Initial state is not enclosed", state.name, state.initial
+            )
+
+    def _index_ancestors(self, state):
+        """Records the composite states enclosing a state"""
+        for composite in ancestors(state):
+            self._composites.setdefault(composite.name, composite)
+            self._leaves.setdefault(composite.name, []).append(state.name)
+
+    def _initial_leaf(self, name):
+        """Returns the name of the state entered for a state name, following
+        the initial states of composite states.
+        """
+        composite = self._composites.get(name)
+        while composite is not None:
+            name = composite.initial
+            composite = self._composites.get(name)
+        return name
+
+    def _check_timeouts(self):
+        """Raises ValueError if the on_timeout action of a state has no
+        transition from it.
+        """
+        for state in self._states.values():
+            action = state.on_timeout
+            if action is not None and action not in self.actions_of(
+                state.name
+            ):
+                raise ValueError(
+                    "Timeout action has no transition from state",
+                    state.name,
+                    action,
+                )
+
+    def _add_states(self, states):
+        """Adds states from an iterable"""
+        if not isinstance(states, (list, tuple)):
+            raise TypeError(f"Invalid states {states}, must be iterable")
+        for s in states:
+            self._add_state(s)
+
+    def _add_transition(self, transition):
+        """Adds a transition. The transition parameter may be a Transition
+        object or valid transition data according to the Transition data
+        validator.  Returns the Transition object.
+        """
+        if not isinstance(transition, Transition):
+            from voluptuous import MultipleInvalid
+            from fsm.schema import TRANSITION_SCHEMA
+
+            try:
+                transition = Transition(**TRANSITION_SCHEMA(transition))
+            except MultipleInvalid:
+                raise ValueError("Invalid transition data", transition)
+        if self._composites or transition.multi_source:
+            transition = self._add_sourced(transition)
+        elif (
+            transition.guard is None
+            and self._table.add_unguarded(transition) is not None
+        ):
+            self._index_first(transition)
+        else:
+            self._add_flat_transition(transition, (transition.from_state,))
+        return transition
+
+    def _add_sourced(self, transition):
+        """Adds a transition to the states it applies to: every state for
+        WILDCARD, including the states added afterwards, the named states
+        of a list and the states enclosed by a composite source.  The
+        initial state of a composite target is entered.  A transition
+        declared by a state takes precedence over the ones it inherits from
+        enclosing states, which take precedence over wildcard transitions,
+        whatever their order.  All the states share one Transition object,
+        which is returned.
+        """
+        action = transition.action
+        guard = guard_source(transition)
+        to_state = self._initial_leaf(transition.to_state)
+        if to_state != transition.to_state:
+            transition = Transition(
+                action,
+                transition.from_state,
+                to_state,
+                on_before=transition.on_before.callbacks,
+                on_after=transition.on_after.callbacks,
+                guard=guard,
+            )
+
+        from_state = transition.from_state
+        rows = {}
+        if from_state == WILDCARD:
+            self._wildcards = [
+                t
+                for t in self._wildcards
+                if t.action != action or guard_source(t) != guard
+            ]
+            self._wildcards.append(transition)
+            for name in self._states:
+                if not any(
+                    guard_source(t) == guard and t.from_state != WILDCARD
+                    for t in self._candidates(name, action)
+                ):
+                    rows[name] = None
+        else:
+            if isinstance(from_state, str):
+                from_state = (from_state,)
+            for name in from_state:
+                source = self._states.get(name) or self._composites.get(name)
+                depth = 0 if source is None else len(ancestors(source))
+                for leaf in self._leaves.get(name, (name,)):
+                    key = (leaf, action, guard)
+                    if self._declared.get(key, depth) > depth:
+                        continue
+                    if self._composites:
+                        self._declared[key] = depth
+                    rows[leaf] = None
+        if rows:
+            self._add_flat_transition(transition, list(rows))
+        return transition
+
+    def _add_flat_transition(self, transition, from_states):
+        """Adds a transition to the table rows of from_states and to the
+        indexes.
+        """
+        table = self._table
+        action = transition.action
+        source = guard_source(transition)
+        # the transitions replaced for the same state, action and guard
+        replaced = {}
+        for from_state in from_states:
+            for tran in self._candidates(from_state, action):
+                if guard_source(tran) == source:
+                    replaced[from_state] = tran
+        table.add_transition(transition, from_states)
+        aid = table._action_ids[action]
+        for from_state in from_states:
+            # from_state -> actions -> Transition, the first candidate if
+            # guarded
+            index = table._state_ids[from_state] * table._stride + aid
+            first = table._tran[index]
+            self._transitions.setdefault(from_state, {})[
+                action
+            ] = table._transitions[first]
+            self._index_transition(
+                from_state, transition, replaced.get(from_state)
+            )
+
+    def _candidates(self, from_state, action):
+        """Returns the transitions for a state and action in evaluation
+        order.
+        """
+        table = self._table
+        state_id = table._state_ids.get(from_state)
+        action_id = table._action_ids.get(action)
+        if state_id is None or action_id is None:
+            return []
+        return [
+            table._transitions[tid]
+            for tid in table.candidates(state_id, action_id)
+        ]
+
+    def _cells(self):
+        """Yields (state name, Transition) pairs of the table cells,
+        guarded candidates in evaluation order.
+        """
+        for from_state, actions in self._transitions.items():
+            for action in actions:
+                for tran in self._candidates(from_state, action):
+                    yield from_state, tran
+
+    def _reset_indexes(self):
+        # action name tuples by state id
+        self._state_actions = []
+        # action -> source state names, state -> (from, action, guard) ->
+        # Transition with immutable copies cached until changed
+        self._sources = {}
+        self._accepting = {}
+        self._incoming = {}
+        self._incoming_tuples = {}
+
+    def _reindex(self):
+        """Rebuilds the composite state and query indexes from the current
+        states and transitions.
+        """
+        self._composites = {}
+        self._leaves = {}
+        self._declared = {}
+        for state in self._table._states:
+            if state is not None:
+                self._index_ancestors(state)
+        self._reset_indexes()
+        cells = {}
+        for from_state, transition in self._cells():
+            self._index_transition(from_state, transition, None)
+            cells[id(transition)] = None
+        self._wildcards = [
+            t
+            for t in self._table._transitions
+            if t.from_state == WILDCARD and id(t) in cells
+        ]
+
+    def _index_first(self, transition):
+        """Indexes the first transition of its from_state and action, the
+        fast path of _index_transition() where nothing is replaced.
+        """
+        from_state = transition.from_state
+        action = transition.action
+        actions = self._transitions.get(from_state)
+        if actions is None:
+            actions = self._transitions[from_state] = {}
+        actions[action] = transition
+        sources = self._sources.get(action)
+        if sources is None:
+            sources = self._sources[action] = {}
+        sources[from_state] = None
+        if self._accepting:
+            self._accepting.pop(action, None)
+        state_actions = self._state_actions
+        state_id = self._table._state_ids[from_state]
+        if state_id >= len(state_actions):
+            state_actions.extend(
+                [()] * (len(self._table._state_names) - len(state_actions))
+            )
+        state_actions[state_id] += (action,)
+        to_state = transition.to_state
+        incoming = self._incoming.get(to_state)
+        if incoming is None:
+            incoming = self._incoming[to_state] = {}
+        incoming[from_state, action, None] = transition
+        if self._incoming_tuples:
+            self._incoming_tuples.pop(to_state, None)
+
+    def _index_transition(self, from_state, transition, replaced):
+        """Updates the query indexes for a transition added to a state,
+        replacing the transition for the same state, action and guard if
+        any.
+        """
+        action = transition.action
+        sources = self._sources.setdefault(action, {})
+        if from_state not in sources:
+            state_actions = self._state_actions
+            state_id = self._table._state_ids[from_state]
+            if state_id >= len(state_actions):
+                state_actions.extend(
+                    [()] * (len(self._table._state_names) - len(state_actions))
+                )
+            state_actions[state_id] += (action,)
+            sources[from_state] = None
+            self._accepting.pop(action, None)
+        key = (from_state, action, guard_source(transition))
+        if replaced is not None:
+            del self._incoming[replaced.to_state][key]
+            self._incoming_tuples.pop(replaced.to_state, None)
+        to_state = transition.to_state
+        self._incoming.setdefault(to_state, {})[key] = transition
+        self._incoming_tuples.pop(to_state, None)
+
+    def _add_transitions(self, transitions):
+        """Add multiple transitions from an iterable"""
+        if not isinstance(transitions, (list, tuple)):
+            raise TypeError(
+                f"Invalid transitions {transitions}, must be iterable"
+            )
+        for t in transitions:
+            self._add_transition(t)
+
+
+class BoundFsm:
+    """A state machine bound to a single model using a shared FsmDefinition.
+
+    The machine owns the current state, held as an integer state id, and
+    mirrors its name to the model's `state` attribute.  Bound machines are
+    deliberately small, they do not add methods to the model, use perform()
+    or perform_id() to trigger transitions.
+    """
+
+    __slots__ = (
+        "_definition",
+        "_model",
+        "_hooks",
+        "_observer",
+        "_timers",
+        "_state",
+    )
+
+    # state is copied to the model's state attribute on each change
+    _mirror_state = True
+
+    def __init__(self, definition, model=None):
+        self._definition = definition
+        self._model = self if model is None else model
+        self._hooks = definition.resolve_hooks(type(self._model))
+        self._observer = None
+        self._timers = None
+        if self._mirror_state and self._model is not self:
+            # a model may have been bound with descriptors before
+            unset_machine(self._model)
+        self._set_state(definition.start_state)
+
+    @property
+    def definition(self):
+        return self._definition
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def state(self):
+        """Returns the name of the current state"""
+        return self._definition._table._state_names[self._state]
+
+    @property
+    def state_id(self):
+        """Returns the id of the current state"""
+        return self._state
+
+    def is_state(self, state_name):
+        """Returns true if the current state matches the state_name"""
+        return self.state == state_name
+
+    def is_in(self, state_name):
+        """Returns true if the current state is state_name or is enclosed
+        in the composite state state_name.
+        """
+        state = self.get_state()
+        while state is not None:
+            if state.name == state_name:
+                return True
+            state = state.parent
+        return False
+
+    def resolve_callbacks(self):
+        """Resolves callbacks against the model again.  Callbacks are
+        resolved when the model is bound, call this after the model's
+        callback methods or the callback lists have changed.
+        """
+        self._hooks = self._definition.resolve_hooks(
+            type(self._model), refresh=True
+        )
+
+    @property
+    def observer(self):
+        """Returns the attached Observer, None if there is none"""
+        return self._observer
+
+    def add_observer(self, observer):
+        """Attaches an Observer, see fsm.observer.  Several observers are
+        dispatched through an ObserverGroup.
+        """
+        if self._observer is None:
+            self._observer = observer
+        elif isinstance(self._observer, ObserverGroup):
+            self._observer.add(observer)
+        else:
+            self._observer = ObserverGroup([self._observer, observer])
+
+    def remove_observer(self, observer):
+        """Detaches an Observer"""
+        current = self._observer
+        if current is observer:
+            self._observer = None
+        elif isinstance(current, ObserverGroup):
+            current.remove(observer)
+            if len(current) == 1:
+                (self._observer,) = current.observers
+        else:
+            raise ValueError("Observer not attached", observer)
+
+    def enable_profiling(self, profiler=None):
+        """Attaches a Profiler, a new one if none is provided, and returns
+        it.  Profiling can be toggled on a live machine.
+        """
+        profiler = Profiler() if profiler is None else profiler
+        self.add_observer(profiler)
+        return profiler
+
+    def disable_profiling(self):
+        """Detaches all attached Profilers"""
+        observer = self._observer
+        if isinstance(observer, ObserverGroup):
+            profilers = [
+                o for o in observer.observers if isinstance(o, Profiler)
+            ]
+        else:
+            profilers = [observer] if isinstance(observer, Profiler) else []
+        for profiler in profilers:
+            self.remove_observer(profiler)
+
+    def get_state(self):
+        """Retrieves the state object representing the current state."""
+        return self._definition._table._states[self._state]
+
+    def _set_state_id(self, state_id):
+        """Sets the current state by id, see _set_state()"""
+        table = self._definition._table
+        state = table._states[state_id]
+        if state is None:
+            raise FsmError("Invalid state", table._state_names[state_id])
+        self._state = state_id
+        if self._mirror_state and self._model is not self:
+            self._model.state = state.name
+        if self._timers is not None:
+            self._timers.state_changed(self, state)
+        return state
+
+    def _set_state(self, state_name):
+        """Sets the current state and mirrors it to the model. Invalid states
+        will raise an FsmError exception.  This can be used to set state
+        without triggering call backs (for example when initializing), see
+        _change_state().  Returns new State object.
+        """
+        state_id = self._definition._table._state_ids.get(state_name)
+        if state_id is None:
+            raise FsmError("Invalid state", state_name)
+        return self._set_state_id(state_id)
+
+    def _change_state_id(self, state_id):
+        """Changes state from one to another by id, see _change_state()"""
+
+        # make sure state is actually changing
+        if state_id == self._state:
+            return
+
+        # exit/enter callbacks made as state changes, along the precomputed
+        # chain of enclosing states in hierarchical definitions
+        model = self._model
+        hooks = self._hooks
+        chains = hooks.chains
+        if chains is None:
+            exits = hooks.on_exit[self._state]
+            enters = hooks.on_enter[state_id]
+        else:
+            chain = chains[self._state * chains.count + state_id]
+            exits = chain[0]
+            enters = chain[1]
+        for cb in exits:
+            cb(model)
+        self._set_state_id(state_id)
+        for cb in enters:
+            cb(model)
+
+    def _chain_levels(self, state_id):
+        """Returns the (exit levels, enter levels) of changing from the
+        current state to a state id, each a tuple of (State, callbacks)
+        pairs.  Used where each callback's owner is needed.
+        """
+        hooks = self._hooks
+        chains = hooks.chains
+        if chains is not None:
+            return chains[self._state * chains.count + state_id][2:]
+        states = self._definition._table._states
+        return (
+            ((states[self._state], hooks.on_exit[self._state]),),
+            ((states[state_id], hooks.on_enter[state_id]),),
+        )
+
+    def _change_state(self, new_state):
+        """Changes state from one to another.  This will invoke any
+        callbacks associated with the states (on_exit, on_enter) if
+        the state is changed.
+        """
+        state_id = self._definition._table._state_ids.get(new_state)
+        if state_id is None:
+            raise FsmError("Invalid state", new_state)
+        self._change_state_id(state_id)
+
+    def get_actions(self, state=None):
+        """Returns a list of action names for a state if provided, or for
+        the current state.
+        """
+        state = self.state if state is None else state
+        return self._definition.get_actions(state)
+
+    @property
+    def actions(self):
+        """Returns list of available actions for the current state"""
+        return self.get_actions()
+
+    @property
+    def available_actions(self):
+        """Returns a tuple of the actions available in the current state,
+        shared with every machine in the same state rather than built per
+        call.
+        """
+        state_actions = self._definition._state_actions
+        if self._state < len(state_actions):
+            return state_actions[self._state]
+        return ()
+
+    def _invalid_action(self, action):
+        """Returns the FsmError for an action not valid in the current
+        state.
+        """
+        from_state = self.state
+        if not self._definition._transitions.get(from_state):
+            error = FsmError(
+                f"No actions found for current state '{from_state}'"
+            )
+        else:
+            error = FsmError(
+                f"Cannot perform action '{action}' in state '{from_state}'"
+            )
+        if self._observer is not None:
+            self._observer.invalid_action(self, action, error)
+        return error
+
+    def _invalid_action_id(self, action_id):
+        """Returns the FsmError for an action id not valid in the current
+        state.
+        """
+        action_names = self._definition._table._action_names
+        if 0 <= action_id < len(action_names):
+            return self._invalid_action(action_names[action_id])
+        return self._invalid_action(action_id)
+
+    def _select_transition(self, action_id):
+        """Returns the (transition id, next state id) pair of an action id in
+        the current state, evaluating guards if any.  Raises FsmError if the
+        action is not valid for the current state.
+        """
+        table = self._definition._table
+        stride = table._stride
+        index = self._state * stride + action_id
+        if not 0 <= action_id < stride or table._tran[index] < 0:
+            raise self._invalid_action_id(action_id)
+        state_id = table._next[index]
+        if state_id == GUARDED:
+            return self._select_guarded(index, action_id)
+        return table._tran[index], state_id
+
+    def _select_guarded(self, index, action_id):
+        """Returns the (transition id, next state id) pair of the first
+        candidate at a table index whose guard passes.  Raises FsmError if
+        none passes.
+        """
+        table = self._definition._table
+        guards = self._hooks.guards
+        model = self._model
+        for tid in table._guarded[index]:
+            guard = guards[tid]
+            if guard is None or guard(model):
+                to_state = table._transitions[tid].to_state
+                return tid, table._state_ids[to_state]
+        action = table._action_names[action_id]
+        error = FsmError(
+            f"No guard passed for action '{action}' in state '{self.state}'"
+        )
+        if self._observer is not None:
+            self._observer.invalid_action(self, action, error)
+        raise error
+
+    def _call_observed(self, callbacks, hook, owner):
+        """Calls resolved callbacks reporting each to the observer, also
+        when it raises.
+        """
+        observer = self._observer
+        model = self._model
+        for cb in callbacks:
+            name = callback_name(cb)
+            observer.callback_started(self, hook, name, owner)
+            start = perf_counter()
+            try:
+                cb(model)
+            finally:
+                elapsed = perf_counter() - start
+                observer.callback_finished(self, hook, name, owner, elapsed)
+
+    def _perform_observed(self, action_id):
+        """perform_id() reporting the transition and each callback to the
+        observer.  A transition whose callback raises is still reported as
+        finished.
+        """
+        tid, state_id = self._select_transition(action_id)
+        table = self._definition._table
+        hooks = self._hooks
+        transition = table._transitions[tid]
+        from_state = table._state_names[self._state]
+        observer = self._observer
+        observer.transition_started(self, transition, from_state)
+        start = perf_counter()
+        try:
+            self._call_observed(hooks.on_before[tid], "on_before", transition)
+            if state_id != self._state:
+                exit_levels, enter_levels = self._chain_levels(state_id)
+                for state, callbacks in exit_levels:
+                    self._call_observed(callbacks, "on_exit", state)
+                self._set_state_id(state_id)
+                for state, callbacks in enter_levels:
+                    self._call_observed(callbacks, "on_enter", state)
+            self._call_observed(hooks.on_after[tid], "on_after", transition)
+        finally:
+            elapsed = perf_counter() - start
+            observer.transition_finished(self, transition, from_state, elapsed)
+        return transition
+
+    def perform_id(self, action_id):
+        """Performs an action by id to trigger a state transition, this is
+        the fast path used by perform().  Raises FsmError if action is not
+        valid for the current state.  Returns the Transition performed.
+        """
+        if self._observer is not None:
+            return self._perform_observed(action_id)
+
+        table = self._definition._table
+        stride = table._stride
+        index = self._state * stride + action_id
+        if not 0 <= action_id < stride or table._tran[index] < 0:
+            raise self._invalid_action_id(action_id)
+
+        # change state
+        tid = table._tran[index]
+        state_id = table._next[index]
+        if state_id == GUARDED:
+            tid, state_id = self._select_guarded(index, action_id)
+        model = self._model
+        hooks = self._hooks
+        for cb in hooks.on_before[tid]:
+            cb(model)
+        self._change_state_id(state_id)
+        for cb in hooks.on_after[tid]:
+            cb(model)
+        return table._transitions[tid]
+
+    def perform_if(self, expected_state, action):
+        """Performs an action only if the current state is expected_state.
+        Returns the Transition performed, or None if the state differs.
+        """
+        if self.state != expected_state:
+            return None
+        return self.perform(action)
+
+    def trigger(self, action):
+        """Performs an action on behalf of a model action method, see
+        perform().  Subclasses may override it to change what model action
+        methods do.
+        """
+        return self.perform(action)
+
+    def perform(self, action):
+        """Performs an action to trigger a state transition. Raises FsmError
+        if action is not valid for the current state.  Returns the
+        Transition performed.
+        """
+        action_id = self._definition._table._action_ids.get(action)
+        if action_id is None:
+            raise self._invalid_action(action)
+        return self.perform_id(action_id)
+
+    def _validate_path(self, actions, fallback=False):
+        """Returns the action ids of a sequence of actions, checking each
+        is valid in the state the previous ones lead to.  After a guarded
+        transition the following actions must be valid from every state it
+        may lead to.  With fallback enabled the guarded transitions after
+        the first action must have an unguarded fallback.  No callbacks are
+        called.  Raises FsmError for the first invalid action.
+        """
+        table = self._definition._table
+        action_ids = table._action_ids
+        stride = table._stride
+        next_state = table._next
+        states = table._states
+        state_ids = (self._state,)
+        path = []
+        for step, action in enumerate(actions):
+            action_id = action_ids.get(action)
+            if action_id is None:
+                raise self._invalid_step(action, step)
+            to_ids = {}
+            for state_id in state_ids:
+                to_id = next_state[state_id * stride + action_id]
+                if to_id == GUARDED:
+                    candidates = table.candidates(state_id, action_id)
+                    last = table._transitions[candidates[-1]]
+                    if fallback and step and last.guard is not None:
+                        raise FsmError(
+                            f"Action '{action}' at step {step} may fail its"
+                            " guards, use rollback"
+                        )
+                    for tid in candidates:
+                        to_state = table._transitions[tid].to_state
+                        to_ids[table._state_ids[to_state]] = None
+                elif to_id < 0 or states[to_id] is None:
+                    raise self._invalid_step(
+                        action, step, table._state_names[state_id]
+                    )
+                else:
+                    to_ids[to_id] = None
+            path.append(action_id)
+            state_ids = to_ids
+        return path
+
+    def _invalid_step(self, action, step, state=None):
+        """Returns the FsmError for an invalid step of an action path"""
+        if state is None:
+            error = FsmError(f"Invalid action '{action}' at step {step}")
+        else:
+            error = FsmError(
+                f"Cannot perform action '{action}' in state '{state}'"
+                f" at step {step}"
+            )
+        if self._observer is not None:
+            self._observer.invalid_action(self, action, error)
+        return error
+
+    def perform_many(self, actions, rollback=False):
+        """Performs a sequence of actions.  The whole path is validated
+        against the transition table first, so an action not valid in the
+        states the path leads to raises FsmError before any callback is
+        called or the state changes.  Guards are only evaluated as the
+        actions are performed, without rollback a path is rejected if a
+        guarded transition after the first action has no unguarded
+        fallback.  Actions performed by callbacks, such as queued actions
+        of run to completion machines, change the state the rest of the
+        path is performed from and may then make it fail part way.
+
+        With rollback enabled, if a callback or a guard raises an exception
+        the state the machine had before the first action is silently
+        restored and the exception re-raised.  Side effects of callbacks
+        already called are not undone.  Returns a list of the Transitions
+        performed.
+        """
+        path = self._validate_path(actions, fallback=not rollback)
+        perform_id = self.perform_id
+        if not rollback:
+            return [perform_id(action_id) for action_id in path]
+        state_id = self._state
+        try:
+            return [perform_id(action_id) for action_id in path]
+        except Exception:
+            self._set_state_id(state_id)
+            raise
+
+
+class DescriptorBoundFsm(BoundFsm):
+    """A BoundFsm whose model class has the machine's methods installed as
+    class attributes.  Binding only sets the model's MACHINE_ATTR attribute,
+    which also works for models using __slots__.
+    """
+
+    __slots__ = ()
+
+    # the installed state property reads state from the machine
+    _mirror_state = False
+
+    def __init__(self, definition, model):
+        if model is None:
+            raise FsmError("A model is required to install descriptors")
+        definition.install_model_class(type(model))
+        set_machine(model, self)
+        super().__init__(definition, model)
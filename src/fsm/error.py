@@ -0,0 +1,2 @@
+class FsmError(Exception):
+    """Exception type raised by Fsm"""
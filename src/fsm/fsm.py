@@ -5,20 +5,14 @@ model object to manage the model's state.
 
 from functools import partial
 
-from voluptuous import MultipleInvalid
-import yaml
-from yaml import Loader
+from fsm.definition import as_objects, BoundFsm, FsmDefinition
+from fsm.error import FsmError
+from fsm.hooks import Hooks
+from fsm.model import install_model_class, set_machine, unset_machine
+from fsm.observer import PrintObserver
 
-from fsm.schema import FSM_SCHEMA, STATE_SCHEMA, TRANSITION_SCHEMA
-from fsm.state import State
-from fsm.transition import Transition
 
-
-class FsmError(Exception):
-    """Exception type raised by Fsm"""
-
-
-class Fsm:
+class Fsm(BoundFsm):
     """Implementation of a finite state machine.
     
     Fsm maintains a list of known states.  It associates a state with a
@@ -30,6 +24,11 @@ class Fsm:
     are mapped to a Transition instance.  The Transition instance encapsulates
     the action, from_state and to_state of a transition allowing state to be
     changed from one to another via an action.
+
+    Unlike a BoundFsm the definition of an Fsm is private to it and can be
+    extended with add_state() and add_transition().  The model's state
+    attribute remains the current state, it may be assigned to restore a
+    state without calling callbacks.
     """
 
     def __init__(
@@ -39,29 +38,67 @@ class Fsm:
         transitions=None,
         start_state=None,
         feedback=True,
+        descriptors=False,
     ):
-        self._start_state = start_state
         self._model = None
-        self._states = {}
-        self._transitions = {}
-        self._feedback = feedback
+        self._callback_names = None
+        self._observer = None
+        self._timers = None
+        self._descriptors = False
+        self._definition = FsmDefinition(
+            states=states, transitions=transitions, start_state=start_state,
+        )
 
-        # for now explicit start state is required
-        # but might be auto generated in the future
-        if start_state is None:
-            raise FsmError("No start state provided")
+        # user feedback is printed by an observer
+        if feedback:
+            self.add_observer(PrintObserver())
 
         model = self if model is None else model
+        self.set_model(model, descriptors=descriptors)
+
+    @property
+    def _state(self):
+        # the model's state is read back as it may have been assigned
+        state_id = self._state_id
+        model = self._model
+        if self._mirror_state and model is not self:
+            name = getattr(model, "state", None)
+            table = self._definition._table
+            if name != table._state_names[state_id]:
+                synced = table._state_ids.get(name)
+                if synced is not None:
+                    self._set_state_id(synced)
+                    state_id = synced
+        return state_id
+
+    @_state.setter
+    def _state(self, state_id):
+        self._state_id = state_id
 
-        if states:
-            self.add_states(states)
+    @property
+    def state(self):
+        """Returns the name of the current state, assigning it sets the
+        state without calling callbacks.
+        """
+        return self._definition._table._state_names[self._state]
 
-        if transitions:
-            self.add_transitions(transitions)
+    @state.setter
+    def state(self, state_name):
+        self._set_state(state_name)
 
-        self.set_model(model)
+    @property
+    def definition(self):
+        """Returns a compiled copy of the current states and transitions
+        which can be shared by any number of bound machines.
+        """
+        definition = self._definition
+        return FsmDefinition(
+            states=definition.states,
+            transitions=definition.transitions,
+            start_state=definition.start_state,
+        )
 
-    def set_model(self, model):
+    def set_model(self, model, descriptors=False):
         """Associates a model object with this state machine.  
         
         On assignment all existing states and transitions will be associated
@@ -70,8 +107,20 @@ class Fsm:
         Models must allow attributes to be assigned to allow state, state
         functions and action functions to be set.
 
+        With descriptors enabled the state property, state functions and
+        action functions are instead installed once on the model's class and
+        the model only gets a reference to this machine, see
+        install_model_class().
+
         Model state are always initialized to the specified start state.
         """
+        if descriptors:
+            if model is self:
+                raise FsmError("A model is required to install descriptors")
+            self._definition.install_model_class(type(model))
+            set_machine(model, self)
+            self._bind_model(model, descriptors)
+            return
 
         # fsm relies on being able to assign new attributes to the model,
         # this makes sure attribute assignment is allowed
@@ -79,18 +128,47 @@ class Fsm:
             raise ValueError(
                 "Invalid model object, does not support dynamic attributes",
             )
+        unset_machine(model)
 
         # add state is_* methods to model
-        for state in self._states.values():
+        for state in self._definition.states:
             self._add_state_check_to_model(model, state.name)
 
-        # add transition methods to model
-        for actions in self._transitions.values():
-            for tran in actions.values():
-                self._add_transition_to_model(model, tran)
+        # add action methods to model
+        for action in self._definition._table._action_names:
+            self._add_action_to_model(model, action)
 
+        self._bind_model(model, descriptors)
+
+    def _bind_model(self, model, descriptors):
+        """Sets the model and initializes it to the start state"""
         self._model = model
-        self._set_state(self._start_state)
+        self._descriptors = descriptors
+        self._mirror_state = not descriptors
+        self._resolve_hooks(refresh=False)
+        self._set_state(self._definition.start_state)
+
+    def resolve_callbacks(self):
+        """Resolves callbacks against the model again.  Callbacks are
+        resolved when the model is set, call this after the model's
+        callback attributes or the callback lists have changed.
+        """
+        self._callback_names = None
+        self._resolve_hooks(refresh=True)
+
+    def _resolve_hooks(self, refresh):
+        """Resolves the hooks of the model.  Models without instance
+        attributes named as callbacks share the hooks of their class.
+        """
+        model = self._model
+        definition = self._definition
+        if self._callback_names is None:
+            self._callback_names = _callback_names(definition)
+        attrs = getattr(model, "__dict__", ())
+        if not any(name in attrs for name in self._callback_names):
+            self._hooks = definition.resolve_hooks(type(model), refresh)
+        else:
+            self._hooks = Hooks(definition._table, type(model), model)
 
     def _is_state(self, model, state_name):
         """Returns true if the model's state matches the state_name.
@@ -108,21 +186,23 @@ class Fsm:
 
     def add_state(self, state):
         """Adds a new state and adds is_<state> function to model."""
-
-        # ensure state has type State (can convert from str name)
-        if isinstance(state, str):
-            state = State(state)
-        elif not isinstance(state, State):
-            try:
-                state = State(**STATE_SCHEMA(state))
-            except MultipleInvalid:
-                raise ValueError("Invalid state data", state)
-
-        self._states[state.name] = state
+        state = self._definition._add_state(state)
+        self._callback_names = None
 
         # model may not be set yet...
-        if self._model:
+        if self._model is None:
+            return
+        if self._descriptors:
+            install_model_class(type(self._model), states=[state.name])
+        else:
             self._add_state_check_to_model(self._model, state.name)
+        # states already defined may have been replaced
+        definition = self._definition
+        names = definition._leaves.get(state.name, (state.name,))
+        state_ids = definition._table._state_ids
+        self._hooks.update(
+            definition._table, redefined=[state_ids[n] for n in names]
+        )
 
     def add_states(self, states):
         """Adds states from an iterable"""
@@ -131,64 +211,30 @@ class Fsm:
         for s in states:
             self.add_state(s)
 
-    def get_state(self):
-        """Retrieves the state object representing the current state 
-        in the model.
-        """
-        return self._states[self._model.state]
-
-    def _set_state(self, state_name):
-        """Sets the state in the model. Invalid states will raise an 
-        FsmError exception.  This can be used to set state without
-        triggering call backs (for example when initializing), see 
-        _change_state().  Returns new State object.
-        """
-        if not state_name in self._states:
-            raise FsmError("Invalid state", state_name)
-        setattr(self._model, "state", state_name)
-        return self._states[state_name]
-
-    def _change_state(self, new_state):
-        """Changes state from one to another.  This will invoke any
-        callbacks associated with the states (on_exit, on_enter) if
-        the state is changed.
-        """
-
-        # make sure state is actually changing
-        cur_state = self.get_state()
-        if cur_state.name == new_state:
-            return
-
-        # exit/enter callbacks made as state changes
-        cur_state.on_exit.call_on(self._model)
-        cur_state = self._set_state(new_state)
-        cur_state.on_enter.call_on(self._model)
-
     def _add_transition_to_model(self, model, transition):
         """Add action function to trigger state transition in the model"""
-        setattr(
-            model, transition.action, partial(self.perform, transition.action)
-        )
+        self._add_action_to_model(model, transition.action)
+
+    def _add_action_to_model(self, model, action):
+        """Add the function of an action to the model"""
+        setattr(model, action, partial(self.trigger, action))
 
     def add_transition(self, transition):
         """Adds a transition. The transition parameter may be a Transition 
         object or valid transition data according to the Transition data 
         validator.  
         """
-        if not isinstance(transition, Transition):
-            try:
-                transition = Transition(**TRANSITION_SCHEMA(transition))
-            except MultipleInvalid:
-                raise ValueError("Invalid transition data", transition)
-
-        # from_state -> actions -> Transition
-        actions = self._transitions.get(transition.from_state)
-        if actions is None:
-            actions = {}
-            self._transitions[transition.from_state] = actions
-        actions[transition.action] = transition
-        if self._model:
+        transition = self._definition._add_transition(transition)
+        self._callback_names = None
+        if self._model is None:
+            return
+        if self._descriptors:
+            install_model_class(
+                type(self._model), actions=[transition.action]
+            )
+        else:
             self._add_transition_to_model(self._model, transition)
+        self._hooks.update(self._definition._table)
 
     def add_transitions(self, transitions):
         """Add multiple transitions from an iterable"""
@@ -199,63 +245,61 @@ class Fsm:
         for t in transitions:
             self.add_transition(t)
 
-    def get_actions(self, state=None):
-        """Returns a list of action names for a state if provided, or for
-        the current state.
-        """
-        state = self._model.state if state is None else state
-        return list(self._transitions.get(state, {}).keys())
-
-    @property
-    def actions(self):
-        """Returns list of available actions for the current state"""
-        return self.get_actions()
-
-    def perform(self, action):
-        """Performs an action to trigger a state transition. Raises FsmError
-        if action is not valid for the current state.
-        """
-
-        # retrieve actions associated with current state
-        from_state = self._model.state
-        actions = self._transitions.get(from_state)
-        if not actions:
-            raise FsmError(f"No actions found for current state '{from_state}'")
-
-        # retrieve transition associated with the action
-        transition = actions.get(action)
-        if not transition:
-            raise FsmError(
-                f"Cannot perform action '{action}' in state '{from_state}'"
-            )
-
-        # change state
-        transition.on_before.call_on(self._model)
-        self._change_state(transition.to_state)
-        transition.on_after.call_on(self._model)
-
-        # user feedback
-        if self._feedback:
-            print(
-                f"Action '{action}' performed, state transitioned from"
-                f" '{transition.from_state}' to '{transition.to_state}'"
-            )
-
-
-def create_fsm(data=None, doc=None, filename=None, **kwargs):
-    """Generate state machine using provided initialization data"""
 
-    if filename:
-        with open(filename) as fin:
-            doc = fin.read()
-
-    # fsm configuration can be encoded in yaml (or json)
-    if doc:
-        data = yaml.load(doc, Loader=Loader)
+def _callback_names(definition):
+    """Returns a set of the callback and guard names of a definition"""
+    names = set()
+    for state in definition.states + definition.composite_states:
+        names.update(state.on_enter._callbacks, state.on_exit._callbacks)
+    for transition in definition._table._transitions:
+        names.update(
+            transition.on_before._callbacks, transition.on_after._callbacks
+        )
+        if transition.guard is not None:
+            names.add(transition.guard.source)
+    return names
+
+
+def create_fsm(
+    data=None,
+    doc=None,
+    filename=None,
+    fsm_class=Fsm,
+    cache=True,
+    disk_cache=False,
+    **kwargs,
+):
+    """Generate state machine using provided initialization data.  The
+    machine is an instance of fsm_class, Fsm or one of its subclasses.  See
+    load_data() for caching of loaded docs.
+    """
+    from fsm.loader import load_data
+
+    data = load_data(
+        data=data,
+        doc=doc,
+        filename=filename,
+        cache=cache,
+        disk_cache=disk_cache,
+    )
+    data = as_objects(data)
+    data.update(kwargs)
+    return fsm_class(**data)
 
-    if not data:
-        raise ValueError("No data provided for Fsm configuration")
 
-    data = FSM_SCHEMA(data)
-    data.update(kwargs)
-    return Fsm(**data)
+def create_definition(
+    data=None, doc=None, filename=None, cache=True, disk_cache=False
+):
+    """Generate a shareable state machine definition using provided
+    initialization data.  Use FsmDefinition.bind() to associate models.
+    """
+    from fsm.loader import load_data
+
+    data = load_data(
+        data=data,
+        doc=doc,
+        filename=filename,
+        cache=cache,
+        disk_cache=disk_cache,
+    )
+    return FsmDefinition(**as_objects(data))
@@ -0,0 +1,197 @@
+"""Guards
+Transition guard conditions compiled once into closures taking the model.
+
+A guard is either the name of a model method or attribute, or an expression
+over model attributes such as `balance >= amount and not is_locked()`.
+Expressions support literals, attribute access, method calls without
+arguments, comparisons, `in`, `and`, `or`, `not` and arithmetic.
+"""
+
+import ast
+from functools import lru_cache
+from inspect import getattr_static
+import operator
+from types import FunctionType
+
+_COMPARE = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+_BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+_UNARY = {
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+def _check_name(name):
+    if name.startswith("_"):
+        raise ValueError("Private names are not allowed in guards", name)
+
+
+def _constant(value):
+    return lambda model: value
+
+
+def _and(left, right):
+    return lambda model: left(model) and right(model)
+
+
+def _or(left, right):
+    return lambda model: left(model) or right(model)
+
+
+def _compile(node):
+    """Returns a closure evaluating an expression node on a model"""
+    if isinstance(node, ast.Constant):
+        return _constant(node.value)
+
+    if isinstance(node, ast.Name):
+        _check_name(node.id)
+        return operator.attrgetter(node.id)
+
+    if isinstance(node, ast.Attribute):
+        _check_name(node.attr)
+        value = _compile(node.value)
+        attr = operator.attrgetter(node.attr)
+        return lambda model: attr(value(model))
+
+    if isinstance(node, ast.Call):
+        if node.args or node.keywords:
+            raise ValueError("Guard calls can not take arguments")
+        if not isinstance(node.func, (ast.Name, ast.Attribute)):
+            raise ValueError("Guards can only call model methods")
+        func = _compile(node.func)
+        return lambda model: func(model)()
+
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        items = [_compile(e) for e in node.elts]
+        if all(isinstance(e, ast.Constant) for e in node.elts):
+            values = tuple(e.value for e in node.elts)
+            return _constant(values)
+        return lambda model: tuple(i(model) for i in items)
+
+    if isinstance(node, ast.BoolOp):
+        combine = _and if isinstance(node.op, ast.And) else _or
+        values = [_compile(v) for v in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = combine(result, value)
+        return result
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY:
+        op = _UNARY[type(node.op)]
+        operand = _compile(node.operand)
+        return lambda model: op(operand(model))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        op = _BINARY[type(node.op)]
+        left = _compile(node.left)
+        right = _compile(node.right)
+        return lambda model: op(left(model), right(model))
+
+    if isinstance(node, ast.Compare):
+        operands = [_compile(node.left)]
+        operands += [_compile(c) for c in node.comparators]
+        ops = []
+        for op in node.ops:
+            if type(op) not in _COMPARE:
+                raise ValueError("Unsupported comparison in guard")
+            ops.append(_COMPARE[type(op)])
+        if len(ops) == 1:
+            op = ops[0]
+            left, right = operands
+            return lambda model: op(left(model), right(model))
+
+        def compare(model):
+            left = operands[0](model)
+            for op, operand in zip(ops, operands[1:]):
+                right = operand(model)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+
+        return compare
+
+    raise ValueError("Unsupported guard expression", type(node).__name__)
+
+
+class Guard:
+    """A compiled guard condition.  Use compile_guard() to create one."""
+
+    __slots__ = ("_source", "_name", "_evaluate")
+
+    def __init__(self, source):
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError:
+            raise ValueError("Invalid guard", source)
+        self._source = source
+        body = tree.body
+        if isinstance(body, ast.Name):
+            # a bare name is a model method, or an attribute tested for truth
+            _check_name(body.id)
+            self._name = body.id
+            self._evaluate = None
+        else:
+            self._name = None
+            self._evaluate = _compile(body)
+
+    @property
+    def source(self):
+        return self._source
+
+    def resolve(self, target_class, target=None):
+        """Returns a callable taking the target and returning the guard's
+        value.  A method guard is resolved to the function defined by the
+        target class, as callbacks are, expressions do not depend on the
+        class.
+        """
+        if self._evaluate is not None:
+            return self._evaluate
+        name = self._name
+        attr = getattr_static(target_class, name, None)
+        if isinstance(attr, FunctionType) and name not in getattr(
+            target, "__dict__", ()
+        ):
+            return attr
+        getter = operator.attrgetter(name)
+
+        def evaluate(model):
+            value = getter(model)
+            return value() if callable(value) else value
+
+        return evaluate
+
+
+@lru_cache(maxsize=1024)
+def compile_guard(source):
+    """Compiles a guard, compiled guards are cached by source.  Raises
+    ValueError if the guard is invalid.
+    """
+    return Guard(source)
+
+
+def valid_guard(source):
+    """Voluptuous validator of guard sources"""
+    compile_guard(source)
+    return source
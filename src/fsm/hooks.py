@@ -0,0 +1,181 @@
+"""Hooks
+State machine callbacks resolved once against a model class.
+"""
+
+
+def ancestors(state):
+    """Returns a list of the composite states enclosing a state, innermost
+    first.
+    """
+    result = []
+    parent = state.parent
+    while parent is not None:
+        result.append(parent)
+        parent = parent.parent
+    return result
+
+
+class Chains(dict):
+    """The exit and enter callback chains of state changes in hierarchical
+    definitions, by `from_id * state count + to_id`.
+
+    Leaving a state exits it and its enclosing states up to the innermost
+    one also enclosing the next state, which are then entered outermost
+    first down to the next state.  Each chain is an (exits, enters,
+    exit levels, enter levels) tuple, exits and enters are flat tuples of
+    resolved callbacks and the levels are tuples of (State, callbacks)
+    pairs.  Chains are computed once, on first use.
+    """
+
+    def __init__(self, table, model_class, model=None):
+        super().__init__()
+        self._states = table._states
+        self.count = len(table._state_names)
+        self._model_class = model_class
+        self._model = model
+        # State to its resolved (on_exit, on_enter) callbacks
+        self._resolved = {}
+
+    def _callbacks(self, state):
+        resolved = self._resolved.get(state)
+        if resolved is None:
+            resolved = (
+                state.on_exit.resolve(self._model_class, self._model),
+                state.on_enter.resolve(self._model_class, self._model),
+            )
+            self._resolved[state] = resolved
+        return resolved
+
+    def __missing__(self, key):
+        from_id, to_id = divmod(key, self.count)
+        from_state = self._states[from_id]
+        to_state = self._states[to_id]
+        from_chain = [from_state] + ancestors(from_state)
+        to_chain = [to_state] + ancestors(to_state)
+        common = set(from_chain).intersection(to_chain)
+        exit_levels = tuple(
+            (s, self._callbacks(s)[0])
+            for s in from_chain
+            if s not in common
+        )
+        enter_levels = tuple(
+            (s, self._callbacks(s)[1])
+            for s in reversed(to_chain)
+            if s not in common
+        )
+        chain = (
+            tuple(cb for _, callbacks in exit_levels for cb in callbacks),
+            tuple(cb for _, callbacks in enter_levels for cb in callbacks),
+            exit_levels,
+            enter_levels,
+        )
+        self[key] = chain
+        return chain
+
+
+class Hooks:
+    """The callbacks of a transition table resolved against a model class.
+
+    Each hook is a list of tuples of callables taking the model, indexed by
+    state id (on_enter, on_exit) or transition id (on_before, on_after).
+    Callbacks are resolved when a model is bound instead of on every
+    transition, empty callback lists resolve to an empty tuple.  guards
+    holds the resolved guard of each transition id, None for unguarded
+    transitions.  chains holds the Chains of hierarchical definitions,
+    precomputed for every state change of the table, and is None
+    otherwise.  update() resolves the callbacks of states and transitions
+    added to the table afterwards.
+    """
+
+    __slots__ = (
+        "on_enter",
+        "on_exit",
+        "on_before",
+        "on_after",
+        "guards",
+        "chains",
+        "_model_class",
+        "_model",
+        "_undefined",
+    )
+
+    def __init__(self, table, model_class, model=None):
+        self._model_class = model_class
+        self._model = model
+        # ids of states only named by transitions so far
+        self._undefined = set()
+        self.on_enter = []
+        self.on_exit = []
+        self.on_before = []
+        self.on_after = []
+        self.guards = []
+        self.chains = None
+        self.update(table)
+        chains = self.chains
+        if chains is not None:
+            states = table._states
+            transitions = table._transitions
+            state_ids = table._state_ids
+            for index, to_id in enumerate(table._next):
+                from_id = index // table._stride
+                if states[from_id] is None:
+                    continue
+                if to_id >= 0:
+                    targets = (to_id,)
+                elif index in table._guarded:
+                    targets = [
+                        state_ids[transitions[tid].to_state]
+                        for tid in table._guarded[index]
+                    ]
+                else:
+                    continue
+                for to_id in targets:
+                    if to_id != from_id and states[to_id] is not None:
+                        # computes the chain once
+                        chains[from_id * chains.count + to_id]
+
+    def update(self, table, redefined=()):
+        """Resolves the callbacks of the states and transitions added to a
+        table since the hooks were resolved, and of the redefined state
+        ids, the others are kept.
+        """
+        model_class, model = self._model_class, self._model
+        states = table._states
+        count = len(self.on_enter)
+        defined = [sid for sid in self._undefined if states[sid] is not None]
+        self._undefined.difference_update(defined)
+        defined.extend(
+            sid for sid in redefined if sid < count and sid not in defined
+        )
+        for sid in defined:
+            state = states[sid]
+            self.on_enter[sid] = state.on_enter.resolve(model_class, model)
+            self.on_exit[sid] = state.on_exit.resolve(model_class, model)
+        added = states[count:]
+        for sid, s in enumerate(added, count):
+            if s is None:
+                self._undefined.add(sid)
+                self.on_enter.append(())
+                self.on_exit.append(())
+            else:
+                self.on_enter.append(s.on_enter.resolve(model_class, model))
+                self.on_exit.append(s.on_exit.resolve(model_class, model))
+
+        on_before, on_after = self.on_before, self.on_after
+        guards = self.guards
+        for t in table._transitions[len(on_before) :]:
+            on_before.append(t.on_before.resolve(model_class, model))
+            on_after.append(t.on_after.resolve(model_class, model))
+            guard = t.guard
+            guards.append(
+                None if guard is None else guard.resolve(model_class, model)
+            )
+
+        # chains are keyed by the state count, they are computed again on
+        # use once states have been added
+        changed = [states[sid] for sid in defined] + list(added)
+        if changed and (
+            self.chains is not None
+            or any(s is not None and s.parent is not None for s in changed)
+        ):
+            self.chains = Chains(table, model_class, model)
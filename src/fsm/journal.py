@@ -0,0 +1,277 @@
+"""Transition journal
+An append only binary log of the transitions performed by bound machines,
+with state snapshots and a replay engine to rebuild entity states.
+"""
+
+from array import array
+from hashlib import blake2b
+import mmap
+import os
+import struct
+import time
+
+from fsm.definition import BoundFsm
+from fsm.error import FsmError
+from fsm.table import GUARDED
+
+LOG_MAGIC = b"FSMLOG1\0"
+SNAPSHOT_MAGIC = b"FSMSNP1\0"
+
+# entity id, action id, timestamp
+RECORD = struct.Struct("<QId")
+# flags records of guarded transitions, which hold the state id entered
+# in place of the action id
+GUARDED_RECORD = 1 << 31
+# magic, definition fingerprint
+LOG_HEADER = struct.Struct("<8s8s")
+# magic, definition fingerprint, log position, entity count
+SNAPSHOT_HEADER = struct.Struct("<8s8sQQ")
+
+
+def fingerprint(definition):
+    """Returns 8 bytes identifying the state and action ids of a definition,
+    journals and snapshots can only be replayed with a matching definition.
+    """
+    names = "\0".join(definition.state_names) + "\1"
+    names += "\0".join(definition.action_names)
+    return blake2b(names.encode(), digest_size=8).digest()
+
+
+class TransitionLog:
+    """Appends fixed size (entity id, action id, timestamp) records to a
+    journal file.  Guarded transitions are recorded with the state entered,
+    see GUARDED_RECORD, as replaying does not evaluate guards.
+
+    Optionally writes a snapshot every snapshot_interval records, using
+    snapshot_source to get the current mapping of entity id to state id.
+    """
+
+    def __init__(
+        self,
+        filename,
+        definition,
+        snapshot_filename=None,
+        snapshot_interval=None,
+        snapshot_source=None,
+    ):
+        self._filename = filename
+        self._definition = definition
+        self._fingerprint = fingerprint(definition)
+        self._snapshot_filename = snapshot_filename
+        self._snapshot_interval = snapshot_interval
+        self._snapshot_source = snapshot_source
+
+        if snapshot_interval and (
+            snapshot_filename is None or snapshot_source is None
+        ):
+            raise ValueError(
+                "Periodic snapshots need snapshot_filename and snapshot_source"
+            )
+
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        if size:
+            _check_log_header(filename, self._fingerprint)
+        self._file = open(filename, "ab")
+        if size:
+            self._count = (size - LOG_HEADER.size) // RECORD.size
+        else:
+            self._file.write(LOG_HEADER.pack(LOG_MAGIC, self._fingerprint))
+            self._count = 0
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def __len__(self):
+        """Returns the number of records in the journal"""
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, entity_id, action_id, timestamp=None):
+        """Appends a transition record"""
+        if timestamp is None:
+            timestamp = time.time()
+        self._file.write(RECORD.pack(entity_id, action_id, timestamp))
+        self._count += 1
+        if (
+            self._snapshot_interval
+            and self._count % self._snapshot_interval == 0
+        ):
+            self.snapshot(self._snapshot_filename, self._snapshot_source())
+
+    def snapshot(self, filename, states):
+        """Writes a snapshot of a mapping of entity id to state id, taken
+        at the current journal position.
+        """
+        self.flush()
+        write_snapshot(filename, self._definition, states, self._count)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class LoggedBoundFsm(BoundFsm):
+    """A BoundFsm which appends each transition it performs to a
+    TransitionLog under its entity id.
+    """
+
+    __slots__ = ("_log", "_entity_id")
+
+    def __init__(self, definition, model=None, log=None, entity_id=0):
+        self._log = log
+        self._entity_id = entity_id
+        super().__init__(definition, model)
+
+    @property
+    def entity_id(self):
+        return self._entity_id
+
+    def perform_id(self, action_id):
+        state_id = self._state
+        try:
+            transition = super().perform_id(action_id)
+        except BaseException:
+            # the state may have changed before a callback raised, which
+            # is logged so replaying recovers it
+            if self._state != state_id:
+                self._append(state_id, action_id)
+            raise
+        self._append(state_id, action_id)
+        return transition
+
+    def _append(self, state_id, action_id):
+        """Logs an action performed from a state id"""
+        table = self._definition._table
+        if table._next[state_id * table._stride + action_id] == GUARDED:
+            action_id = GUARDED_RECORD | self._state
+        self._log.append(self._entity_id, action_id)
+
+    def perform_many(self, actions, rollback=False):
+        """Performs a sequence of actions, see BoundFsm.perform_many().
+        Rollback is not supported, the journal can not record it.
+        """
+        if rollback:
+            raise FsmError("Logged machines do not support rollback")
+        return super().perform_many(actions)
+
+
+def _check_log_header(filename, expected):
+    with open(filename, "rb") as fin:
+        header = fin.read(LOG_HEADER.size)
+    if len(header) != LOG_HEADER.size:
+        raise FsmError("Invalid transition log", filename)
+    magic, print_ = LOG_HEADER.unpack(header)
+    if magic != LOG_MAGIC:
+        raise FsmError("Invalid transition log", filename)
+    if print_ != expected:
+        raise FsmError("Transition log does not match definition", filename)
+
+
+def write_snapshot(filename, definition, states, position=0):
+    """Writes a mapping of entity id to state id to a snapshot file.  The
+    position is the number of journal records the snapshot includes.  The
+    file is replaced atomically.
+    """
+    entity_ids = array("Q", states.keys())
+    state_ids = array("i", states.values())
+    tmp = f"{filename}.tmp"
+    with open(tmp, "wb") as fout:
+        fout.write(
+            SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC,
+                fingerprint(definition),
+                position,
+                len(entity_ids),
+            )
+        )
+        entity_ids.tofile(fout)
+        state_ids.tofile(fout)
+    os.replace(tmp, filename)
+
+
+def read_snapshot(filename, definition):
+    """Reads a snapshot file, returns a (states, position) tuple where
+    states maps entity id to state id.
+    """
+    with open(filename, "rb") as fin:
+        magic, print_, position, count = SNAPSHOT_HEADER.unpack(
+            fin.read(SNAPSHOT_HEADER.size)
+        )
+        if magic != SNAPSHOT_MAGIC:
+            raise FsmError("Invalid snapshot", filename)
+        if print_ != fingerprint(definition):
+            raise FsmError("Snapshot does not match definition", filename)
+        entity_ids = array("Q")
+        entity_ids.fromfile(fin, count)
+        state_ids = array("i")
+        state_ids.fromfile(fin, count)
+    return dict(zip(entity_ids, state_ids)), position
+
+
+def replay(definition, log_filename, snapshot_filename=None):
+    """Rebuilds entity states from an optional snapshot and the journal
+    records written after it.  No callbacks or guards are called, guarded
+    transitions are replayed from the state they recorded.  Returns a
+    mapping of entity id to state id, entities start in the start state.
+    """
+    states, position = {}, 0
+    if snapshot_filename is not None and os.path.exists(snapshot_filename):
+        states, position = read_snapshot(snapshot_filename, definition)
+
+    _check_log_header(log_filename, fingerprint(definition))
+    start = LOG_HEADER.size + position * RECORD.size
+    if os.path.getsize(log_filename) <= start:
+        return states
+
+    table = definition.table
+    stride = table.stride
+    next_state = table._next
+    n_states = len(table._state_names)
+    start_id = definition.state_id(definition.start_state)
+    get = states.get
+    with open(log_filename, "rb") as fin, mmap.mmap(
+        fin.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buf:
+        end = start + (len(buf) - start) // RECORD.size * RECORD.size
+        records = RECORD.iter_unpack(memoryview(buf)[start:end])
+        try:
+            for entity_id, action_id, _ in records:
+                if action_id & GUARDED_RECORD:
+                    to_id = action_id & ~GUARDED_RECORD
+                    if to_id >= n_states:
+                        to_id = -1
+                else:
+                    state_id = get(entity_id, start_id)
+                    to_id = (
+                        next_state[state_id * stride + action_id]
+                        if action_id < stride
+                        else -1
+                    )
+                if to_id < 0:
+                    raise FsmError(
+                        "Invalid transition in log", entity_id, action_id
+                    )
+                states[entity_id] = to_id
+        finally:
+            # release the exported buffer before the map is closed
+            del records
+    return states
+
+
+def restore(machines, states):
+    """Silently sets the state of bound machines, a mapping of entity id to
+    machine, from a mapping of entity id to state id such as returned by
+    replay().  No callbacks are called.
+    """
+    for entity_id, state_id in states.items():
+        machine = machines.get(entity_id)
+        if machine is not None:
+            machine._set_state_id(state_id)
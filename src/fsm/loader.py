@@ -0,0 +1,123 @@
+"""Loader
+Loading and validation of state machine initialization data with an in
+memory cache keyed by content hash and an optional on-disk cache.
+"""
+
+from collections import OrderedDict
+from hashlib import sha256
+import json
+import os
+import pickle
+
+import yaml
+
+from fsm.definition import as_objects
+from fsm.schema import FSM_SCHEMA
+
+# use the C accelerated yaml loader if libyaml is available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader
+
+# maximum number of validated docs kept in memory
+CACHE_SIZE = 32
+
+# suffix of on-disk cache files, written next to the source file
+DISK_CACHE_SUFFIX = ".fsmcache"
+
+_cache = OrderedDict()
+
+
+def clear_cache():
+    """Clears the in memory cache of validated data"""
+    _cache.clear()
+
+
+def parse_doc(doc):
+    """Parses a yaml or json doc.  Json docs are parsed with the json
+    module, which is much faster than yaml.
+    """
+    if doc.lstrip().startswith("{"):
+        try:
+            return json.loads(doc)
+        except ValueError:
+            pass
+    return yaml.load(doc, Loader=SafeLoader)
+
+
+def _validate_doc(doc):
+    data = parse_doc(doc) if doc else None
+    if not data:
+        raise ValueError("No data provided for Fsm configuration")
+    return FSM_SCHEMA(data)
+
+
+def _validated(doc, cache):
+    """Returns the validated data of a doc, from the cache if possible"""
+    if not cache:
+        return _validate_doc(doc)
+
+    key = sha256(doc.encode()).digest()
+    data = _cache.get(key)
+    if data is None:
+        data = _validate_doc(doc)
+        _cache[key] = data
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return data
+
+
+def _load_file(filename, cache, disk_cache):
+    """Returns the validated data of a file.  The on-disk cache is used if
+    the file's modification time and size are unchanged.
+    """
+    if disk_cache:
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cache_filename = f"{filename}{DISK_CACHE_SUFFIX}"
+        try:
+            with open(cache_filename, "rb") as fin:
+                cached_stamp, data = pickle.load(fin)
+            if cached_stamp == stamp:
+                return data
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+    with open(filename) as fin:
+        doc = fin.read()
+    data = _validated(doc, cache)
+
+    if disk_cache:
+        try:
+            with open(cache_filename, "wb") as fout:
+                pickle.dump((stamp, data), fout, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+    return data
+
+
+def load_data(
+    data=None, doc=None, filename=None, cache=True, disk_cache=False
+):
+    """Loads and validates state machine initialization data from data, a
+    yaml or json doc, or a file containing one.
+
+    Validated docs are cached in memory by content hash.  With disk_cache
+    enabled validated file data is also pickled next to the source file
+    and reused while the file's modification time and size are unchanged.
+    Returns a new dict of validated data.
+    """
+    if filename:
+        data = _load_file(filename, cache, disk_cache)
+    elif doc:
+        data = _validated(doc, cache)
+    elif data:
+        data = FSM_SCHEMA(data)
+
+    if not data:
+        raise ValueError("No data provided for Fsm configuration")
+
+    return dict(data)
@@ -0,0 +1,122 @@
+"""Model class support
+Installs state machine methods once on a model class rather than adding
+partial functions to every model instance.
+"""
+
+from fsm.error import FsmError
+
+# name of the model attribute referencing its bound state machine, models
+# using __slots__ must include it in their slots
+MACHINE_ATTR = "_fsm"
+
+
+def _get_state(model):
+    machine = getattr(model, MACHINE_ATTR, None)
+    if machine is not None:
+        return machine.state
+    # models bound without descriptors keep a copy of their state
+    try:
+        return model.__dict__["state"]
+    except (AttributeError, KeyError):
+        raise AttributeError(
+            f"'{type(model).__name__}' object has no attribute 'state'"
+        ) from None
+
+
+def _set_state(model, state):
+    """Sets the state of the model's machine, or stores the state copied
+    to models bound without descriptors.
+    """
+    machine = getattr(model, MACHINE_ATTR, None)
+    if machine is not None:
+        machine._set_state(state)
+        return
+    try:
+        model.__dict__["state"] = state
+    except AttributeError:
+        raise FsmError(
+            f"Model class '{type(model).__name__}' has the state property"
+            " installed, its models can only be bound with descriptors"
+        ) from None
+
+
+def _make_state_check(state_name):
+    def is_state(model):
+        return _get_state(model) == state_name
+
+    is_state.__name__ = f"is_{state_name}"
+    is_state._fsm_installed = True
+    return is_state
+
+
+def _make_action(action):
+    def perform(model):
+        machine = getattr(model, MACHINE_ATTR, None)
+        if machine is None:
+            raise FsmError(
+                f"Model is not bound with descriptors, perform '{action}'"
+                " with its machine"
+            )
+        return machine.trigger(action)
+
+    perform.__name__ = action
+    perform._fsm_installed = True
+    return perform
+
+
+def _install(model_class, name, attr):
+    """Sets attr on the model class unless it would replace an attribute
+    the class defines for itself.
+    """
+    existing = getattr(model_class, name, None)
+    # properties carry the marker on their getter
+    marked = getattr(existing, "fget", existing)
+    if existing is not None and not getattr(marked, "_fsm_installed", False):
+        raise FsmError(
+            f"Model class '{model_class.__name__}' already has"
+            f" attribute '{name}'"
+        )
+    setattr(model_class, name, attr)
+
+
+def install_model_class(model_class, states=(), actions=()):
+    """Installs a state property, is_<state> methods and action methods on
+    the model class.  Each resolves against the state machine referenced by
+    the model's MACHINE_ATTR attribute, so binding a model only needs to set
+    that one attribute, see set_machine().  Installing is additive, it may
+    be repeated for new states and actions.
+
+    Setting the state property sets the state of the model's machine, or
+    stores it on models bound without descriptors, which the installed
+    methods then check.
+    """
+    state = property(_get_state, _set_state)
+    state.fget._fsm_installed = True
+    _install(model_class, "state", state)
+    for state_name in states:
+        check = _make_state_check(state_name)
+        _install(model_class, f"is_{state_name}", check)
+    for action in actions:
+        _install(model_class, action, _make_action(action))
+
+
+def set_machine(model, machine):
+    """References the machine from a model of an installed class, dropping
+    any state copied by an earlier binding without descriptors.
+    """
+    setattr(model, MACHINE_ATTR, machine)
+    getattr(model, "__dict__", {}).pop("state", None)
+
+
+def unset_machine(model):
+    """Drops the machine reference of a model bound again without
+    descriptors, its installed methods then use the state copied to it.
+    """
+    attrs = getattr(model, "__dict__", None)
+    if attrs is not None:
+        attrs.pop(MACHINE_ATTR, None)
+    elif getattr(model, MACHINE_ATTR, None) is not None:
+        raise FsmError(
+            f"Model class '{type(model).__name__}' has the state property"
+            " installed, its models can only be bound with descriptors"
+        )
@@ -0,0 +1,192 @@
+"""Observers
+Instrumentation hooks for state machines.  Machines without an observer
+only pay a single check per transition.
+"""
+
+from bisect import bisect_left
+
+
+def callback_name(callback):
+    """Returns the name of a resolved callback"""
+    name = getattr(callback, "name", None)
+    return name if name is not None else callback.__name__
+
+
+class Observer:
+    """Base class of state machine observers, every hook does nothing.
+
+    Elapsed times are wall clock seconds.  from_state is the name of the
+    state the machine was in when the transition started, which for
+    wildcard, multi-source and composite transitions is not the
+    transition's from_state.  hook is the callback list being called
+    (on_before, on_exit, on_enter or on_after) and owner the Transition or
+    State it belongs to.
+    """
+
+    def transition_started(self, machine, transition, from_state):
+        pass
+
+    def transition_finished(self, machine, transition, from_state, elapsed):
+        pass
+
+    def callback_started(self, machine, hook, name, owner):
+        pass
+
+    def callback_finished(self, machine, hook, name, owner, elapsed):
+        pass
+
+    def invalid_action(self, machine, action, error):
+        pass
+
+
+class ObserverGroup(Observer):
+    """Dispatches each hook to a list of observers in order"""
+
+    def __init__(self, observers=None):
+        self._observers = list(observers or [])
+
+    @property
+    def observers(self):
+        return list(self._observers)
+
+    def add(self, observer):
+        self._observers.append(observer)
+
+    def remove(self, observer):
+        self._observers.remove(observer)
+
+    def __len__(self):
+        return len(self._observers)
+
+    def transition_started(self, machine, transition, from_state):
+        for o in self._observers:
+            o.transition_started(machine, transition, from_state)
+
+    def transition_finished(self, machine, transition, from_state, elapsed):
+        for o in self._observers:
+            o.transition_finished(machine, transition, from_state, elapsed)
+
+    def callback_started(self, machine, hook, name, owner):
+        for o in self._observers:
+            o.callback_started(machine, hook, name, owner)
+
+    def callback_finished(self, machine, hook, name, owner, elapsed):
+        for o in self._observers:
+            o.callback_finished(machine, hook, name, owner, elapsed)
+
+    def invalid_action(self, machine, action, error):
+        for o in self._observers:
+            o.invalid_action(machine, action, error)
+
+
+class PrintObserver(Observer):
+    """Prints a line for every transition, this is Fsm's user feedback"""
+
+    def transition_finished(self, machine, transition, from_state, elapsed):
+        print(
+            f"Action '{transition.action}' performed, state transitioned"
+            f" from '{from_state}' to '{machine.state}'"
+        )
+
+
+# histogram bucket upper bounds in seconds, 1us to ~16s in powers of 2
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+
+class Histogram:
+    """Latency histogram with fixed exponential buckets"""
+
+    def __init__(self, bounds=BUCKETS):
+        self._bounds = bounds
+        # the last bucket counts values above the highest bound
+        self._counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Returns the upper bound of the bucket holding the p-th
+        percentile, limited to the maximum value seen.
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self._bounds, self._counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def export(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": dict(zip(self._bounds, self._counts)),
+            "overflow": self._counts[-1],
+        }
+
+
+class MetricsObserver(Observer):
+    """Collects in-process metrics: transition counters, invalid action
+    counters and latency histograms per action and per callback name.
+    """
+
+    def __init__(self):
+        self.transitions = {}
+        self.invalid_actions = {}
+        self.action_latency = {}
+        self.callback_latency = {}
+
+    def transition_finished(self, machine, transition, from_state, elapsed):
+        key = (from_state, transition.action, machine.state)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        histogram = self.action_latency.get(transition.action)
+        if histogram is None:
+            histogram = self.action_latency[transition.action] = Histogram()
+        histogram.add(elapsed)
+
+    def callback_finished(self, machine, hook, name, owner, elapsed):
+        histogram = self.callback_latency.get(name)
+        if histogram is None:
+            histogram = self.callback_latency[name] = Histogram()
+        histogram.add(elapsed)
+
+    def invalid_action(self, machine, action, error):
+        self.invalid_actions[action] = self.invalid_actions.get(action, 0) + 1
+
+    def export(self):
+        """Returns the metrics as a dict of plain values"""
+        return {
+            "transitions": {
+                f"{f}:{a}->{t}": count
+                for (f, a, t), count in self.transitions.items()
+            },
+            "invalid_actions": dict(self.invalid_actions),
+            "action_latency": {
+                action: h.export() for action, h in self.action_latency.items()
+            },
+            "callback_latency": {
+                name: h.export() for name, h in self.callback_latency.items()
+            },
+        }
@@ -0,0 +1,122 @@
+"""Profiler
+An observer attributing wall and CPU time of transitions to individual
+callbacks, states and transitions.
+"""
+
+from time import thread_time
+
+from fsm.observer import Histogram, Observer
+
+
+class ProfileStats:
+    """Wall time histogram and total CPU time of one profiled item"""
+
+    def __init__(self):
+        self.wall = Histogram()
+        self.cpu = 0.0
+
+    def add(self, wall, cpu):
+        self.wall.add(wall)
+        self.cpu += cpu
+
+    def export(self):
+        wall = self.wall
+        return {
+            "count": wall.count,
+            "wall_total": wall.total,
+            "wall_mean": wall.mean,
+            "wall_max": wall.max,
+            "p50": wall.percentile(50),
+            "p90": wall.percentile(90),
+            "p99": wall.percentile(99),
+            "cpu_total": self.cpu,
+        }
+
+
+def _top(stats, top):
+    items = sorted(stats.items(), key=lambda i: i[1].wall.total, reverse=True)
+    if top is not None:
+        items = items[:top]
+    return [dict(name=name, **s.export()) for name, s in items]
+
+
+class Profiler(Observer):
+    """Records wall and CPU time per callback name, per state (the time of
+    its on_exit and on_enter callbacks) and per transition.
+
+    Attach it to a live machine with enable_profiling() and detach it with
+    disable_profiling(), the machine does not need to be rebuilt.  CPU time
+    is measured per thread, use a profiler per thread or per machine when
+    transitions run concurrently.
+    """
+
+    def __init__(self):
+        self.callbacks = {}
+        self.states = {}
+        self.transitions = {}
+        # CPU start times, transitions and callbacks may nest
+        self._cpu_starts = []
+
+    def _stats(self, stats, key):
+        s = stats.get(key)
+        if s is None:
+            s = stats[key] = ProfileStats()
+        return s
+
+    def _cpu_elapsed(self):
+        # the profiler may be attached while a transition is in progress
+        if not self._cpu_starts:
+            return 0.0
+        return thread_time() - self._cpu_starts.pop()
+
+    def transition_started(self, machine, transition, from_state):
+        self._cpu_starts.append(thread_time())
+
+    def transition_finished(self, machine, transition, from_state, elapsed):
+        cpu = self._cpu_elapsed()
+        key = f"{from_state}:{transition.action}->{machine.state}"
+        self._stats(self.transitions, key).add(elapsed, cpu)
+
+    def callback_started(self, machine, hook, name, owner):
+        self._cpu_starts.append(thread_time())
+
+    def callback_finished(self, machine, hook, name, owner, elapsed):
+        cpu = self._cpu_elapsed()
+        self._stats(self.callbacks, name).add(elapsed, cpu)
+        if hook in ("on_exit", "on_enter"):
+            self._stats(self.states, owner.name).add(elapsed, cpu)
+
+    def reset(self):
+        self.callbacks.clear()
+        self.states.clear()
+        self.transitions.clear()
+
+    def report(self, top=10):
+        """Returns the top slowest callbacks, states and transitions by
+        total wall time.  Use top=None to include everything.
+        """
+        return {
+            "callbacks": _top(self.callbacks, top),
+            "states": _top(self.states, top),
+            "transitions": _top(self.transitions, top),
+        }
+
+    def format_report(self, top=10):
+        """Returns the report as a text table"""
+        lines = []
+        header = (
+            f"{'name':40} {'count':>8} {'wall ms':>10} {'cpu ms':>10}"
+            f" {'p50 us':>9} {'p99 us':>9}"
+        )
+        for section, rows in self.report(top).items():
+            lines.append(section)
+            lines.append(header)
+            for r in rows:
+                lines.append(
+                    f"{r['name']:40} {r['count']:8}"
+                    f" {r['wall_total'] * 1e3:10.3f}"
+                    f" {r['cpu_total'] * 1e3:10.3f} {r['p50'] * 1e6:9.1f}"
+                    f" {r['p99'] * 1e6:9.1f}"
+                )
+            lines.append("")
+        return "\n".join(lines)
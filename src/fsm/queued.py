@@ -0,0 +1,96 @@
+"""Run to completion state machines
+State machines which queue the actions performed while a transition is in
+progress and perform them once it has completed, instead of recursing.
+"""
+
+from collections import deque
+
+from fsm.definition import BoundFsm, DescriptorBoundFsm
+from fsm.fsm import Fsm
+
+
+class RunToCompletionMixin:
+    """Completes each transition before the next one starts.
+
+    An action performed while a transition is in progress, typically by one
+    of its callbacks, is appended to the machine's queue and None is
+    returned.  Once the transition has completed the queue is drained in
+    order by the outermost call, so long chains of actions triggered by
+    callbacks run iteratively with a constant stack depth.  Queued actions
+    are checked against the state when they are dequeued.
+
+    With coalesce enabled an action already waiting in the queue is not
+    queued again.  If a transition raises an exception the actions still
+    queued are dropped and the exception propagates from the outermost
+    call.
+    """
+
+    __slots__ = ()
+
+    def _init_queue(self, coalesce):
+        self._queue = deque()
+        self._queued = set() if coalesce else None
+        self._draining = False
+
+    @property
+    def queued_actions(self):
+        """Returns a tuple of the names of the queued actions"""
+        names = self._definition._table._action_names
+        return tuple(names[action_id] for action_id in self._queue)
+
+    def perform_id(self, action_id):
+        queue = self._queue
+        queued = self._queued
+        if self._draining:
+            if queued is not None:
+                if action_id in queued:
+                    return None
+                queued.add(action_id)
+            queue.append(action_id)
+            return None
+
+        perform_id = super().perform_id
+        self._draining = True
+        try:
+            transition = perform_id(action_id)
+            while queue:
+                action_id = queue.popleft()
+                if queued is not None:
+                    queued.discard(action_id)
+                perform_id(action_id)
+        finally:
+            self._draining = False
+            queue.clear()
+            if queued is not None:
+                queued.clear()
+        return transition
+
+
+class RunToCompletionBoundFsm(RunToCompletionMixin, BoundFsm):
+    """A run to completion BoundFsm"""
+
+    __slots__ = ("_queue", "_queued", "_draining")
+
+    def __init__(self, definition, model=None, coalesce=False):
+        self._init_queue(coalesce)
+        super().__init__(definition, model)
+
+
+class RunToCompletionDescriptorBoundFsm(
+    RunToCompletionMixin, DescriptorBoundFsm
+):
+    """A run to completion DescriptorBoundFsm"""
+
+    __slots__ = ("_queue", "_queued", "_draining")
+
+    def __init__(self, definition, model, coalesce=False):
+        self._init_queue(coalesce)
+        super().__init__(definition, model)
+
+
+class RunToCompletionFsm(RunToCompletionMixin, Fsm):
+    """A run to completion Fsm"""
+
+    def __init__(self, *args, coalesce=False, **kwargs):
+        self._init_queue(coalesce)
+        super().__init__(*args, **kwargs)
@@ -1,5 +1,7 @@
 import voluptuous as vol
 
+from fsm.guard import valid_guard
+
 CB_SCHEMA = vol.Schema(vol.Any(str, [str]))
 
 # validation schema for State object initialization data
@@ -10,6 +12,13 @@ STATE_SCHEMA = vol.Schema(
             "name": str,
             vol.Optional("on_enter"): CB_SCHEMA,
             vol.Optional("on_exit"): CB_SCHEMA,
+            vol.Inclusive("timeout", "timeout"): vol.All(
+                vol.Coerce(float), vol.Range(min=0, min_included=False),
+            ),
+            vol.Inclusive("on_timeout", "timeout"): str,
+            # composite states
+            vol.Optional("states"): vol.All(vol.Length(1), [vol.Self]),
+            vol.Optional("initial"): str,
         },
     )
 )
@@ -18,10 +27,14 @@ STATE_SCHEMA = vol.Schema(
 TRANSITION_SCHEMA = vol.Schema(
     {
         vol.Required("action"): str,
-        vol.Required("from_state"): str,
+        # a state name, a list of state names or "*" for every state
+        vol.Required("from_state"): vol.Any(
+            str, vol.All([str], vol.Length(min=1))
+        ),
         vol.Required("to_state"): str,
         vol.Optional("on_before"): CB_SCHEMA,
         vol.Optional("on_after"): CB_SCHEMA,
+        vol.Optional("guard"): vol.All(str, valid_guard),
     }
 )
 
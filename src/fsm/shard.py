@@ -0,0 +1,177 @@
+"""Sharded execution
+Drives the states of a large fleet of entities from a pool of worker
+processes, each owning the entities of one shard.
+"""
+
+from collections import namedtuple
+import multiprocessing
+import zlib
+
+from fsm.error import FsmError
+
+# final entity states (entity key to state name) and event counts
+ShardResult = namedtuple("ShardResult", "states events errors")
+
+
+def shard_of(key, shards):
+    """Returns the shard of an entity key.  Integer keys are assigned by
+    modulo, other keys by the crc32 of their string form, which unlike
+    hash() is the same in every process.
+    """
+    if isinstance(key, int):
+        return key % shards
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def _worker(conn, definition):
+    """Worker process loop.  Entity states are kept as state ids and updated
+    through the transition table, no models are bound so no callbacks are
+    called.
+    """
+    table = definition.table
+    stride = table.stride
+    next_state = table._next
+    action_ids = table._action_ids
+    start_id = definition.state_id(definition.start_state)
+    states = {}
+    get = states.get
+    events = errors = 0
+
+    while True:
+        command, payload = conn.recv()
+        if command == "events":
+            for key, action in payload:
+                action_id = action_ids.get(action, stride)
+                to_id = (
+                    next_state[get(key, start_id) * stride + action_id]
+                    if action_id < stride
+                    else -1
+                )
+                if to_id < 0 or table._states[to_id] is None:
+                    errors += 1
+                else:
+                    states[key] = to_id
+            events += len(payload)
+        elif command == "states":
+            states.update(payload)
+        elif command == "gather":
+            names = table._state_names
+            conn.send(
+                (
+                    {key: names[sid] for key, sid in states.items()},
+                    events,
+                    errors,
+                )
+            )
+        elif command == "stop":
+            conn.close()
+            return
+
+
+class ShardedRunner:
+    """Partitions entities by key across worker processes.
+
+    The definition is sent to each worker once when it starts.  Events,
+    (entity key, action) tuples, are batched per shard and applied by the
+    worker owning the shard using the compiled transition table, so
+    callbacks are not called and throughput scales with the number of
+    processes.  Entities start in the definition's start state unless
+    initial states are provided.  Guards need a model, events for guarded
+    transitions are counted as errors.
+    """
+
+    def __init__(
+        self, definition, processes=None, batch_size=10000, context=None,
+    ):
+        context = context or multiprocessing.get_context()
+        self._definition = definition
+        self._shards = processes or multiprocessing.cpu_count()
+        self._batch_size = batch_size
+        self._conns = []
+        self._processes = []
+        self._batches = [[] for _ in range(self._shards)]
+
+        for _ in range(self._shards):
+            conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker, args=(child_conn, definition), daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._conns.append(conn)
+            self._processes.append(process)
+
+    @property
+    def shards(self):
+        return self._shards
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def set_states(self, states):
+        """Sets initial states from a mapping of entity key to state name"""
+        state_id = self._definition.state_id
+        payloads = [[] for _ in range(self._shards)]
+        for key, state in states.items():
+            payloads[shard_of(key, self._shards)].append(
+                (key, state_id(state))
+            )
+        for conn, payload in zip(self._conns, payloads):
+            if payload:
+                conn.send(("states", payload))
+
+    def submit(self, events):
+        """Partitions (entity key, action) events by shard and sends them to
+        the workers in batches.
+        """
+        shards = self._shards
+        batches = self._batches
+        batch_size = self._batch_size
+        for event in events:
+            shard = shard_of(event[0], shards)
+            batch = batches[shard]
+            batch.append(event)
+            if len(batch) >= batch_size:
+                self._conns[shard].send(("events", batch))
+                batches[shard] = []
+
+    def _flush(self):
+        for shard, batch in enumerate(self._batches):
+            if batch:
+                self._conns[shard].send(("events", batch))
+                self._batches[shard] = []
+
+    def gather(self):
+        """Sends pending events and gathers the final states and event
+        counts of all shards.  Returns a ShardResult.
+        """
+        self._flush()
+        for conn in self._conns:
+            conn.send(("gather", None))
+        states = {}
+        events = errors = 0
+        for conn in self._conns:
+            try:
+                shard_states, shard_events, shard_errors = conn.recv()
+            except EOFError:
+                raise FsmError("Shard worker exited")
+            states.update(shard_states)
+            events += shard_events
+            errors += shard_errors
+        return ShardResult(states, events, errors)
+
+    def close(self):
+        """Stops the worker processes"""
+        for conn in self._conns:
+            try:
+                conn.send(("stop", None))
+            except OSError:
+                pass
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._conns = []
+        self._processes = []
@@ -0,0 +1,500 @@
+"""Shared definitions
+Exports a compiled definition to a file laid out so that other processes
+can memory map it read-only and use it in place: the transition table,
+state and action names and callback names are read straight from the
+mapped pages, which the operating system shares between processes.
+"""
+
+from array import array
+from collections.abc import Mapping, Sequence
+import mmap
+import os
+import struct
+
+from fsm.definition import FsmDefinition
+from fsm.error import FsmError
+from fsm.journal import fingerprint
+from fsm.hooks import Chains
+from fsm.snapshot import (
+    pack_states,
+    pack_transition,
+    unpack_composites,
+    unpack_state,
+    unpack_transition,
+)
+from fsm.table import TransitionTable
+from fsm.transition import guard_source
+
+SHARED_MAGIC = b"FSMSHM1\0"
+
+# magic, fingerprint, start state id, stride, state count, action count,
+# transition count, string count, callback record count, strings size
+SHARED_HEADER = struct.Struct("<8s8siIIIIIII4x")
+
+
+def _string_table(strings):
+    """Returns the byte offsets and the utf-8 blob of a list of strings"""
+    offsets = array("i", [0])
+    parts = []
+    size = 0
+    for s in strings:
+        data = s.encode()
+        parts.append(data)
+        size += len(data)
+        offsets.append(size)
+    blob = b"".join(parts)
+    return offsets, blob + b"\0" * (-len(blob) % 4)
+
+
+def dump_table(definition):
+    """Serializes a definition to the shared table layout, see
+    SharedDefinition.
+    """
+    table = definition.table
+    strings = {}
+
+    def string_id(s):
+        sid = strings.get(s)
+        if sid is None:
+            sid = strings[s] = len(strings)
+        return sid
+
+    records = array("i")
+    state_names = array("i", map(string_id, table._state_names))
+    action_names = array("i", map(string_id, table._action_names))
+
+    # composite states and states, see pack_states()
+    state_offsets = pack_states(records, table._states, string_id)
+
+    # transitions, see pack_transition()
+    transition_offsets = array("i")
+    for tran in table._transitions:
+        transition_offsets.append(len(records))
+        pack_transition(records, tran, table, string_id)
+    transition_offsets.append(len(records))
+
+    # guarded table cells: count, then per cell its index and candidates
+    records.append(len(table._guarded))
+    for index, tids in table._guarded.items():
+        records.append(index)
+        records.append(len(tids))
+        records.extend(tids)
+
+    string_offsets, blob = _string_table(strings)
+    header = SHARED_HEADER.pack(
+        SHARED_MAGIC,
+        fingerprint(definition),
+        definition.state_id(definition.start_state),
+        table._stride,
+        len(table._state_names),
+        len(table._action_names),
+        len(table._transitions),
+        len(strings),
+        len(records),
+        len(blob),
+    )
+    return b"".join(
+        (
+            header,
+            table._next.tobytes(),
+            table._tran.tobytes(),
+            state_names.tobytes(),
+            action_names.tobytes(),
+            state_offsets.tobytes(),
+            transition_offsets.tobytes(),
+            string_offsets.tobytes(),
+            records.tobytes(),
+            blob,
+        )
+    )
+
+
+def export_table(definition, filename):
+    """Writes a definition to a shared table file, replaced atomically.
+    Put the file on a memory backed file system such as /dev/shm to share
+    it without disk io.
+    """
+    tmp = f"{filename}.tmp"
+    with open(tmp, "wb") as fout:
+        fout.write(dump_table(definition))
+    os.replace(tmp, filename)
+
+
+class _Lazy(Sequence):
+    """A read-only sequence whose items are built on first access"""
+
+    def __init__(self, count, build):
+        self._count = count
+        self._build = build
+        self._items = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        item = self._items.get(index, self)
+        if item is self:
+            if not 0 <= index < self._count:
+                raise IndexError(index)
+            item = self._items[index] = self._build(index)
+        return item
+
+
+class _NameIndex(Mapping):
+    """Maps names to ids, the dict is built on first lookup"""
+
+    def __init__(self, names):
+        self._names = names
+        self._ids = None
+
+    def _index(self):
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self._names)}
+        return self._ids
+
+    def __getitem__(self, name):
+        return self._index()[name]
+
+    def get(self, name, default=None):
+        return self._index().get(name, default)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+class SharedTable(TransitionTable):
+    """A read-only TransitionTable viewing a buffer in the shared table
+    layout.  Names, State and Transition objects are built on first use.
+    """
+
+    def __init__(self, buf):
+        view = memoryview(buf)
+        try:
+            header = SHARED_HEADER.unpack_from(view)
+        except struct.error:
+            raise FsmError("Invalid shared table")
+        (
+            magic,
+            self.fingerprint,
+            self.start_id,
+            stride,
+            n_states,
+            n_actions,
+            n_transitions,
+            n_strings,
+            n_records,
+            blob_size,
+        ) = header
+        if magic != SHARED_MAGIC:
+            raise FsmError("Invalid shared table")
+
+        sizes = (
+            n_states * stride,
+            n_states * stride,
+            n_states,
+            n_actions,
+            n_states + 1,
+            n_transitions + 1,
+            n_strings + 1,
+            n_records,
+        )
+        offset = SHARED_HEADER.size
+        if len(view) < offset + 4 * sum(sizes) + blob_size:
+            raise FsmError("Truncated shared table")
+        self._views = [view]
+        sections = []
+        for size in sizes:
+            section = self._view(view, offset, 4 * size).cast("i")
+            self._views.append(section)
+            sections.append(section)
+            offset += 4 * size
+        (
+            self._next,
+            self._tran,
+            state_names,
+            action_names,
+            self._state_offsets,
+            self._transition_offsets,
+            self._string_offsets,
+            self._records,
+        ) = sections
+        self._blob = self._view(view, offset, blob_size)
+
+        self._stride = stride
+        self._state_names = _Lazy(
+            n_states, lambda i: self._string(state_names[i])
+        )
+        self._state_ids = _NameIndex(self._state_names)
+        self._action_names = _Lazy(
+            n_actions, lambda i: self._string(action_names[i])
+        )
+        self._action_ids = _NameIndex(self._action_names)
+        self._states = _Lazy(n_states, self._build_state)
+        self._transitions = _Lazy(n_transitions, self._build_transition)
+
+        records = self._records
+        # composite states are few, they are built at once
+        self._composites, _ = unpack_composites(records, self._string)
+        pos = self._transition_offsets[n_transitions]
+        self._guarded = {}
+        for _ in range(records[pos]):
+            index, count = records[pos + 1 : pos + 3]
+            self._guarded[index] = tuple(records[pos + 3 : pos + 3 + count])
+            pos += 2 + count
+
+    def _view(self, view, offset, size):
+        section = view[offset : offset + size]
+        self._views.append(section)
+        return section
+
+    def _string(self, string_id):
+        offsets = self._string_offsets
+        return str(
+            self._blob[offsets[string_id] : offsets[string_id + 1]], "utf-8"
+        )
+
+    def _build_state(self, sid):
+        state, _ = unpack_state(
+            self._records,
+            self._state_offsets[sid],
+            self._state_names[sid],
+            self._string,
+            self._composites,
+        )
+        return state
+
+    def _build_transition(self, tid):
+        transition, _ = unpack_transition(
+            self._records, self._transition_offsets[tid], self, self._string
+        )
+        return transition
+
+    def row(self, state_id):
+        """Returns a dict of action name to Transition for a state id, in
+        action id order.
+        """
+        stride = self._stride
+        tran = self._tran
+        base = state_id * stride
+        return {
+            self._action_names[aid]: self._transitions[tran[base + aid]]
+            for aid in range(len(self._action_names))
+            if tran[base + aid] >= 0
+        }
+
+    def intern_state(self, name):
+        raise FsmError("Shared transition table is read-only")
+
+    intern_action = add_state = add_transition = intern_state
+
+    def release(self):
+        """Releases the views of the buffer"""
+        for view in reversed(self._views):
+            view.release()
+
+
+class _StateIndex(Mapping):
+    """Maps the names of defined states to State objects"""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, name):
+        sid = self._table._state_ids.get(name)
+        state = None if sid is None else self._table._states[sid]
+        if state is None:
+            raise KeyError(name)
+        return state
+
+    def __iter__(self):
+        for state in self._table._states:
+            if state is not None:
+                yield state.name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _TransitionIndex(Mapping):
+    """Maps state names to dicts of action name to Transition, only states
+    with transitions are included.
+    """
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, name):
+        sid = self._table._state_ids.get(name)
+        row = None if sid is None else self._table.row(sid)
+        if not row:
+            raise KeyError(name)
+        return row
+
+    def __iter__(self):
+        table = self._table
+        stride = table._stride
+        tran = table._tran
+        for sid, name in enumerate(table._state_names):
+            base = sid * stride
+            if any(tran[base + aid] >= 0 for aid in range(stride)):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _LazyHooks:
+    """Hooks resolved per state and transition on first use"""
+
+    __slots__ = (
+        "on_enter",
+        "on_exit",
+        "on_before",
+        "on_after",
+        "guards",
+        "chains",
+    )
+
+    def __init__(self, table, model_class):
+        states = table._states
+        transitions = table._transitions
+
+        def state_hook(name):
+            def build(sid):
+                state = states[sid]
+                if state is None:
+                    return ()
+                return getattr(state, name).resolve(model_class)
+
+            return _Lazy(len(states), build)
+
+        def transition_hook(name):
+            return _Lazy(
+                len(transitions),
+                lambda tid: getattr(transitions[tid], name).resolve(
+                    model_class
+                ),
+            )
+
+        self.on_enter = state_hook("on_enter")
+        self.on_exit = state_hook("on_exit")
+        self.on_before = transition_hook("on_before")
+        self.on_after = transition_hook("on_after")
+        self.guards = _Lazy(
+            len(transitions),
+            lambda tid: (
+                None
+                if transitions[tid].guard is None
+                else transitions[tid].guard.resolve(model_class)
+            ),
+        )
+        self.chains = (
+            Chains(table, model_class) if table._composites else None
+        )
+
+
+class SharedDefinition(FsmDefinition):
+    """A read-only FsmDefinition using a shared table in place.
+
+    Attaching only maps the file, its cost does not depend on the size of
+    the machine and the table pages are shared by every process attached
+    to the same file.  Names, State and Transition objects and resolved
+    callbacks are built on first use, so per process memory only grows
+    with the part of the machine actually used.  Lookups through the lazy
+    tables are somewhat slower than with a regular definition.
+
+    A SharedDefinition attached to a file pickles as its filename, so
+    passing it to worker processes attaches instead of copying it.
+    """
+
+    def __init__(self, buf, filename=None, mapped=None):
+        table = SharedTable(buf)
+        self._table = table
+        self._filename = filename
+        self._mapped = mapped
+        self._start_state = table._state_names[table.start_id]
+        self._states = _StateIndex(table)
+        self._transitions = _TransitionIndex(table)
+        self._composites = {s.name: s for s in table._composites}
+        self._leaves = None
+        self._declared = None
+        self._model_classes = set()
+        self._hooks = {}
+        # actions in action id order, reverse indexes are built on first use
+        self._state_actions = _Lazy(
+            len(table._state_names), lambda sid: tuple(table.row(sid))
+        )
+        self._sources = None
+
+    @classmethod
+    def attach(cls, filename):
+        """Memory maps a shared table file read-only"""
+        with open(filename, "rb") as fin:
+            mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(mapped, filename=os.fspath(filename), mapped=mapped)
+        except Exception:
+            mapped.close()
+            raise
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def __reduce__(self):
+        if self._filename is None:
+            raise FsmError("Only file backed shared definitions can pickle")
+        return type(self).attach, (self._filename,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Releases the buffer, machines using the definition can not be
+        used afterwards.
+        """
+        self._table.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+    def resolve_hooks(self, model_class, refresh=False):
+        """Returns the callbacks of a model class as lazily resolved hooks,
+        see FsmDefinition.resolve_hooks().
+        """
+        hooks = None if refresh else self._hooks.get(model_class)
+        if hooks is None:
+            hooks = _LazyHooks(self._table, model_class)
+            self._hooks[model_class] = hooks
+        return hooks
+
+    def _build_reverse_indexes(self):
+        self._sources = {}
+        self._accepting = {}
+        self._incoming = {}
+        self._incoming_tuples = {}
+        for from_state, t in self._cells():
+            self._sources.setdefault(t.action, {})[from_state] = None
+            self._incoming.setdefault(t.to_state, {})[
+                from_state, t.action, guard_source(t)
+            ] = t
+
+    def states_accepting(self, action):
+        if self._sources is None:
+            self._build_reverse_indexes()
+        return super().states_accepting(action)
+
+    def incoming_transitions(self, state):
+        if self._sources is None:
+            self._build_reverse_indexes()
+        return super().incoming_transitions(state)
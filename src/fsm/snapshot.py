@@ -0,0 +1,532 @@
+"""Snapshots
+Compact binary formats for compiled definitions and for the current states
+of many entities.  Loading reads arrays straight from the buffer, entity
+states are not copied at all so large snapshots can be memory mapped and
+shared by worker processes.
+"""
+
+from array import array
+import mmap
+import os
+import struct
+
+from fsm.definition import FsmDefinition
+from fsm.error import FsmError
+from fsm.hooks import ancestors
+from fsm.journal import fingerprint
+from fsm.state import State
+from fsm.table import TransitionTable
+from fsm.transition import guard_source, Transition, WILDCARD
+
+DEFINITION_MAGIC = b"FSMDEF1\0"
+STATES_MAGIC = b"FSMENT1\0"
+
+# magic, fingerprint, start state id, stride, state count, action count,
+# transition count, string count, strings size, record count
+DEFINITION_HEADER = struct.Struct("<8s8siIIIIIII")
+# flags of state records
+STATE_DEFINED = 1
+STATE_TIMEOUT = 2
+STATE_ENCLOSED = 4
+
+# magic, fingerprint, state id typecode, has entity ids, padding, count
+STATES_HEADER = struct.Struct("<8s8scB6xQ")
+
+
+def _align(offset, size):
+    return (offset + size - 1) // size * size
+
+
+def _frombuffer(typecode, buf, offset, count):
+    """Returns an array of count items copied from buf at offset and the
+    offset following them.
+    """
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(buf[offset:end])
+    return values, end
+
+
+def pack_double(value):
+    """Returns the two ints holding the bytes of a double"""
+    return array("i", array("d", [value]).tobytes())
+
+
+def unpack_double(ints):
+    """Returns the double held by two ints, see pack_double()"""
+    return array("d", bytes(ints))[0]
+
+
+def _pack_callbacks(records, manager, string_id):
+    names = manager.callbacks
+    records.append(len(names))
+    records.extend(string_id(n) for n in names)
+
+
+def _unpack_callbacks(records, pos, string):
+    count = records[pos]
+    names = [string(i) for i in records[pos + 1 : pos + 1 + count]]
+    return names, pos + 1 + count
+
+
+def pack_states(records, states, string_id):
+    """Appends the records of a table's states to an int array and returns
+    the offset of each state's record, followed by the end offset.
+
+    The composite states enclosing the states come first, outermost first:
+    their count, then per composite state its name, the index of its parent
+    (-1 if none), its initial state, on_enter and on_exit.  Each state
+    record holds flags (STATE_DEFINED, STATE_TIMEOUT, STATE_ENCLOSED),
+    on_enter and on_exit, then on_timeout and the timeout if it has one
+    and the index of its parent if enclosed.  Undefined states only have
+    their flags.
+    """
+    composites = {}
+    for state in states:
+        if state is not None:
+            for composite in reversed(ancestors(state)):
+                composites.setdefault(composite, len(composites))
+    records.append(len(composites))
+    for composite in composites:
+        parent = composite.parent
+        records.append(string_id(composite.name))
+        records.append(-1 if parent is None else composites[parent])
+        records.append(string_id(composite.initial))
+        _pack_callbacks(records, composite.on_enter, string_id)
+        _pack_callbacks(records, composite.on_exit, string_id)
+
+    offsets = array("i")
+    for state in states:
+        offsets.append(len(records))
+        if state is None:
+            records.append(0)
+            continue
+        flags = STATE_DEFINED
+        if state.timeout is not None:
+            flags |= STATE_TIMEOUT
+        if state.parent is not None:
+            flags |= STATE_ENCLOSED
+        records.append(flags)
+        _pack_callbacks(records, state.on_enter, string_id)
+        _pack_callbacks(records, state.on_exit, string_id)
+        if state.timeout is not None:
+            records.append(string_id(state.on_timeout))
+            records.extend(pack_double(state.timeout))
+        if state.parent is not None:
+            records.append(composites[state.parent])
+    offsets.append(len(records))
+    return offsets
+
+
+def unpack_composites(records, string):
+    """Returns a list of the composite States packed by pack_states() at the
+    start of records and the position of the first state record.  string
+    returns the string of a string id.
+    """
+    composites = []
+    pos = 1
+    for _ in range(records[0]):
+        name, parent, initial = records[pos : pos + 3]
+        on_enter, pos = _unpack_callbacks(records, pos + 3, string)
+        on_exit, pos = _unpack_callbacks(records, pos, string)
+        composites.append(
+            State(
+                string(name),
+                on_enter,
+                on_exit,
+                parent=None if parent < 0 else composites[parent],
+                initial=string(initial),
+            )
+        )
+    return composites, pos
+
+
+def unpack_state(records, pos, name, string, composites):
+    """Returns the State packed by pack_states() at a record position, None
+    if undefined, and the position following its record.
+    """
+    flags = records[pos]
+    if not flags:
+        return None, pos + 1
+    on_enter, pos = _unpack_callbacks(records, pos + 1, string)
+    on_exit, pos = _unpack_callbacks(records, pos, string)
+    timeout = on_timeout = parent = None
+    if flags & STATE_TIMEOUT:
+        on_timeout = string(records[pos])
+        timeout = unpack_double(records[pos + 1 : pos + 3])
+        pos += 3
+    if flags & STATE_ENCLOSED:
+        parent = composites[records[pos]]
+        pos += 1
+    state = State(name, on_enter, on_exit, timeout, on_timeout, parent)
+    return state, pos
+
+
+def pack_transition(records, transition, table, string_id):
+    """Appends the record of a table's transition to an int array: its
+    sources, action and to state ids, guard (-1 if none), on_before and
+    on_after.  A single source is stored as a string id, WILDCARD as -1
+    and a list of n sources as -2 - n followed by their string ids.
+    """
+    from_state = transition.from_state
+    if from_state == WILDCARD:
+        records.append(-1)
+    elif isinstance(from_state, str):
+        records.append(string_id(from_state))
+    else:
+        records.append(-2 - len(from_state))
+        records.extend(string_id(name) for name in from_state)
+    records.append(table._action_ids[transition.action])
+    records.append(table._state_ids[transition.to_state])
+    source = guard_source(transition)
+    records.append(-1 if source is None else string_id(source))
+    _pack_callbacks(records, transition.on_before, string_id)
+    _pack_callbacks(records, transition.on_after, string_id)
+
+
+def unpack_transition(records, pos, table, string):
+    """Returns the Transition packed by pack_transition() at a record
+    position and the position following its record.
+    """
+    sources = records[pos]
+    if sources >= 0:
+        from_state = string(sources)
+        pos += 1
+    elif sources == -1:
+        from_state = WILDCARD
+        pos += 1
+    else:
+        end = pos + 1 - 2 - sources
+        from_state = tuple(string(i) for i in records[pos + 1 : end])
+        pos = end
+    action_id, to_id, guard = records[pos : pos + 3]
+    on_before, pos = _unpack_callbacks(records, pos + 3, string)
+    on_after, pos = _unpack_callbacks(records, pos, string)
+    transition = Transition(
+        table._action_names[action_id],
+        from_state,
+        table._state_names[to_id],
+        on_before=on_before,
+        on_after=on_after,
+        guard=None if guard < 0 else string(guard),
+    )
+    return transition, pos
+
+
+def dump_definition(definition):
+    """Serializes a definition to bytes: the state and action names, the
+    callback names of states and transitions and the transition table.
+    Models and resolved callbacks are not included.
+    """
+    table = definition.table
+    strings = {}
+
+    def string_id(s):
+        sid = strings.get(s)
+        if sid is None:
+            sid = strings[s] = len(strings)
+        return sid
+
+    state_names = array("i", map(string_id, table._state_names))
+    action_names = array("i", map(string_id, table._action_names))
+
+    # states, see pack_states(); transitions, see pack_transition(); then
+    # the count of guarded table cells and per cell its index and candidates
+    records = array("i")
+    pack_states(records, table._states, string_id)
+    for tran in table._transitions:
+        pack_transition(records, tran, table, string_id)
+    records.append(len(table._guarded))
+    for index, tids in table._guarded.items():
+        records.append(index)
+        records.append(len(tids))
+        records.extend(tids)
+
+    blob = "\0".join(strings).encode()
+    header = DEFINITION_HEADER.pack(
+        DEFINITION_MAGIC,
+        fingerprint(definition),
+        definition.state_id(definition.start_state),
+        table._stride,
+        len(table._state_names),
+        len(table._action_names),
+        len(table._transitions),
+        len(strings),
+        len(blob),
+        len(records),
+    )
+    pad = b"\0" * (_align(len(blob), 4) - len(blob))
+    return b"".join(
+        (
+            header,
+            blob,
+            pad,
+            state_names.tobytes(),
+            action_names.tobytes(),
+            records.tobytes(),
+            table._next.tobytes(),
+            table._tran.tobytes(),
+        )
+    )
+
+
+def load_definition(buf):
+    """Builds a definition from bytes written by dump_definition(), or any
+    buffer such as a memory map.  Nothing is validated again, the
+    transition table is loaded as is.
+    """
+    buf = memoryview(buf)
+    try:
+        (
+            magic,
+            print_,
+            start_id,
+            stride,
+            n_states,
+            n_actions,
+            n_transitions,
+            n_strings,
+            blob_size,
+            n_records,
+        ) = DEFINITION_HEADER.unpack_from(buf)
+    except struct.error:
+        raise FsmError("Invalid definition snapshot")
+    if magic != DEFINITION_MAGIC:
+        raise FsmError("Invalid definition snapshot")
+
+    offset = DEFINITION_HEADER.size
+    strings = bytes(buf[offset : offset + blob_size]).decode().split("\0")
+    if len(strings) != n_strings:
+        raise FsmError("Invalid definition snapshot")
+    offset = _align(offset + blob_size, 4)
+    state_names, offset = _frombuffer("i", buf, offset, n_states)
+    action_names, offset = _frombuffer("i", buf, offset, n_actions)
+    records, offset = _frombuffer("i", buf, offset, n_records)
+    next_state, offset = _frombuffer("i", buf, offset, n_states * stride)
+    tran, offset = _frombuffer("i", buf, offset, n_states * stride)
+    buf.release()
+    if len(tran) != n_states * stride:
+        raise FsmError("Truncated definition snapshot")
+
+    table = TransitionTable()
+    table._state_names = [strings[i] for i in state_names]
+    table._state_ids = {name: i for i, name in enumerate(table._state_names)}
+    table._action_names = [strings[i] for i in action_names]
+    table._action_ids = {
+        name: i for i, name in enumerate(table._action_names)
+    }
+    table._stride = stride
+    table._next = next_state
+    table._tran = tran
+
+    string = strings.__getitem__
+    composites, pos = unpack_composites(records, string)
+    for name in table._state_names:
+        state, pos = unpack_state(records, pos, name, string, composites)
+        table._states.append(state)
+    for _ in range(n_transitions):
+        transition, pos = unpack_transition(records, pos, table, string)
+        table._transitions.append(transition)
+    guarded = records[pos]
+    pos += 1
+    for _ in range(guarded):
+        index, count = records[pos : pos + 2]
+        table._guarded[index] = tuple(records[pos + 2 : pos + 2 + count])
+        pos += 2 + count
+
+    definition = FsmDefinition.__new__(FsmDefinition)
+    definition._start_state = table._state_names[start_id]
+    definition._states = {s.name: s for s in table._states if s is not None}
+    # the transition of each table cell, its first candidate if guarded
+    definition._transitions = {}
+    for sid, name in enumerate(table._state_names):
+        base = sid * stride
+        for aid, action in enumerate(table._action_names):
+            tid = tran[base + aid]
+            if tid >= 0:
+                definition._transitions.setdefault(name, {})[
+                    action
+                ] = table._transitions[tid]
+    definition._table = table
+    definition._model_classes = set()
+    definition._hooks = {}
+    definition._reindex()
+    if fingerprint(definition) != print_:
+        raise FsmError("Definition snapshot does not match its fingerprint")
+    return definition
+
+
+def write_definition(filename, definition):
+    """Writes a definition snapshot file"""
+    with open(filename, "wb") as fout:
+        fout.write(dump_definition(definition))
+
+
+def read_definition(filename):
+    """Reads a definition snapshot file"""
+    with open(filename, "rb") as fin:
+        return load_definition(fin.read())
+
+
+def _state_typecode(definition):
+    """Returns the smallest array typecode holding all state ids"""
+    count = len(definition.state_names)
+    if count <= 0x100:
+        return "B"
+    if count <= 0x10000:
+        return "H"
+    return "i"
+
+
+def dump_states(definition, state_ids, entity_ids=None):
+    """Serializes the state ids of many entities to bytes.  State ids are
+    stored with the smallest item size that fits the definition, one byte
+    for up to 256 states.  Without entity_ids the entities are identified
+    by their index.
+    """
+    typecode = _state_typecode(definition)
+    states = array(typecode, state_ids)
+    header = STATES_HEADER.pack(
+        STATES_MAGIC,
+        fingerprint(definition),
+        typecode.encode(),
+        entity_ids is not None,
+        len(states),
+    )
+    parts = [header]
+    if entity_ids is not None:
+        entity_ids = array("Q", entity_ids)
+        if len(entity_ids) != len(states):
+            raise ValueError("entity_ids and state_ids lengths differ")
+        parts.append(entity_ids.tobytes())
+    parts.append(states.tobytes())
+    return b"".join(parts)
+
+
+class EntityStates:
+    """Entity states loaded by load_states() or open_states().
+
+    state_ids and entity_ids (None if entities are identified by index)
+    are read-only memoryviews over the snapshot buffer, nothing is copied.
+    Close it, or use it as a context manager, to release a memory map.
+    """
+
+    def __init__(self, definition, state_ids, entity_ids=None, mapped=None):
+        self._definition = definition
+        self._state_ids = state_ids
+        self._entity_ids = entity_ids
+        self._mapped = mapped
+
+    @property
+    def definition(self):
+        return self._definition
+
+    @property
+    def state_ids(self):
+        return self._state_ids
+
+    @property
+    def entity_ids(self):
+        return self._entity_ids
+
+    def __len__(self):
+        return len(self._state_ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def state(self, index):
+        """Returns the state name of the entity at an index"""
+        return self._definition.state_names[self._state_ids[index]]
+
+    def items(self):
+        """Yields (entity id, state id) pairs"""
+        if self._entity_ids is None:
+            return enumerate(self._state_ids)
+        return zip(self._entity_ids, self._state_ids)
+
+    def to_dict(self):
+        """Returns a new mapping of entity id to state id"""
+        return dict(self.items())
+
+    def close(self):
+        """Releases the views and the memory map, if any"""
+        self._state_ids.release()
+        if self._entity_ids is not None:
+            self._entity_ids.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+
+def load_states(buf, definition, mapped=None):
+    """Loads entity states from a buffer written by dump_states() without
+    copying, returns EntityStates viewing the buffer.
+    """
+    view = memoryview(buf)
+    try:
+        magic, print_, typecode, has_ids, count = STATES_HEADER.unpack_from(
+            view
+        )
+    except struct.error:
+        raise FsmError("Invalid states snapshot")
+    if magic != STATES_MAGIC:
+        raise FsmError("Invalid states snapshot")
+    if print_ != fingerprint(definition):
+        raise FsmError("States snapshot does not match definition")
+    typecode = typecode.decode()
+
+    offset = STATES_HEADER.size
+    size = count * array(typecode).itemsize
+    if len(view) < offset + size + (count * 8 if has_ids else 0):
+        raise FsmError("Truncated states snapshot")
+    entity_ids = None
+    if has_ids:
+        end = offset + count * 8
+        entity_ids = view[offset:end].cast("Q")
+        offset = end
+    end = offset + size
+    state_ids = view[offset:end].cast(typecode)
+    view.release()
+    return EntityStates(definition, state_ids, entity_ids, mapped)
+
+
+def write_states(filename, definition, state_ids, entity_ids=None):
+    """Writes an entity states snapshot file, replaced atomically"""
+    tmp = f"{filename}.tmp"
+    with open(tmp, "wb") as fout:
+        fout.write(dump_states(definition, state_ids, entity_ids))
+    os.replace(tmp, filename)
+
+
+def open_states(filename, definition):
+    """Memory maps an entity states snapshot file read-only, returns
+    EntityStates viewing the map.  Processes opening the same file share
+    its pages.
+    """
+    with open(filename, "rb") as fin:
+        mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return load_states(mapped, definition, mapped)
+    except Exception:
+        mapped.close()
+        raise
+
+
+def restore_states(machines, states):
+    """Silently sets the states of bound machines, a sequence indexed by
+    entity or a mapping of entity id to machine, from EntityStates.  No
+    callbacks are called.
+    """
+    if states.entity_ids is None:
+        for machine, state_id in zip(machines, states.state_ids):
+            machine._set_state_id(state_id)
+    else:
+        get = machines.get
+        for entity_id, state_id in states.items():
+            machine = get(entity_id)
+            if machine is not None:
+                machine._set_state_id(state_id)
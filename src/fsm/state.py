@@ -2,14 +2,39 @@ from fsm.util import CallbackManager
 
 
 class State:
-    """Encapsulates state machine state"""
+    """Encapsulates state machine state.
 
-    def __init__(self, name=None, on_enter=None, on_exit=None):
+    A state with a timeout, in seconds, performs its on_timeout action once
+    a machine has stayed in it that long, see fsm.timeout.
+
+    A composite state encloses other states, whose parent it is, and has
+    the name of the enclosed state entered in its place as initial.
+    Machines are only ever in states which are not composite.
+    """
+
+    def __init__(
+        self,
+        name=None,
+        on_enter=None,
+        on_exit=None,
+        timeout=None,
+        on_timeout=None,
+        parent=None,
+        initial=None,
+    ):
         if not name:
             raise ValueError("Name parameter required")
+        if (timeout is None) != (on_timeout is None):
+            raise ValueError("timeout and on_timeout must be set together")
+        if timeout is not None and not timeout > 0:
+            raise ValueError("timeout must be positive", timeout)
         self._name = name
         self._on_enter = CallbackManager(on_enter)
         self._on_exit = CallbackManager(on_exit)
+        self._timeout = None if timeout is None else float(timeout)
+        self._on_timeout = on_timeout
+        self._parent = parent
+        self._initial = initial
 
     @property
     def name(self):
@@ -23,3 +48,24 @@ class State:
     def on_exit(self):
         return self._on_exit
 
+    @property
+    def timeout(self):
+        """Returns the timeout in seconds, None if the state has none"""
+        return self._timeout
+
+    @property
+    def on_timeout(self):
+        """Returns the name of the action performed on timeout"""
+        return self._on_timeout
+
+    @property
+    def parent(self):
+        """Returns the enclosing composite State, None if there is none"""
+        return self._parent
+
+    @property
+    def initial(self):
+        """Returns the name of the state entered in place of a composite
+        state, None if the state is not composite.
+        """
+        return self._initial
@@ -0,0 +1,139 @@
+"""Event streams
+Reads (entity key, action) events lazily from files or iterators and
+drives bound state machines with them.
+"""
+
+from collections import namedtuple
+from itertools import islice
+import json
+import time
+
+from fsm.error import FsmError
+
+# outcome of one event, error is None on success
+EventResult = namedtuple("EventResult", "entity action state error")
+
+
+def _lines(source):
+    """Yields lines from a filename, a file object or an iterable of lines"""
+    if isinstance(source, str):
+        with open(source) as fin:
+            yield from fin
+    else:
+        yield from source
+
+
+def read_events(
+    source,
+    format="csv",
+    key_type=str,
+    entity_field="entity_id",
+    action_field="action",
+):
+    """Lazily yields (entity key, action) tuples from a source, a filename,
+    a file object or an iterable of lines.
+
+    csv lines hold `entity_id,action`, jsonl lines hold objects with
+    entity_field and action_field members.  Blank lines are skipped and
+    entity keys are converted with key_type.
+    """
+    if format == "csv":
+        for line in _lines(source):
+            line = line.strip()
+            if line:
+                key, _, action = line.partition(",")
+                yield key_type(key.strip()), action.strip()
+    elif format == "jsonl":
+        for line in _lines(source):
+            if line.strip():
+                event = json.loads(line)
+                yield key_type(event[entity_field]), event[action_field]
+    else:
+        raise ValueError("Invalid event format", format)
+
+
+class PipelineStats:
+    """Event counts and throughput of an EventPipeline"""
+
+    def __init__(self):
+        self.events = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        """Returns events processed per second"""
+        return self.events / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return {
+            "events": self.events,
+            "errors": self.errors,
+            "elapsed": self.elapsed,
+            "rate": self.rate,
+        }
+
+
+class EventPipeline:
+    """Routes events to bound machines by entity key and applies them with
+    perform().
+
+    machines is a mapping of entity key to machine or a callable returning
+    the machine for a key (for example to bind models on first use).  Events
+    are consumed in chunks of chunk_size and results are yielded as they
+    are produced, so memory use does not depend on the size of the input.
+    """
+
+    def __init__(self, machines, chunk_size=1000):
+        if callable(machines):
+            self._lookup = machines
+        else:
+            self._lookup = machines.get
+        self._chunk_size = chunk_size
+        self._stats = PipelineStats()
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def run(self, events, errors_only=False):
+        """Applies (entity key, action) events, yields an EventResult for
+        each event, or only for failed events with errors_only.
+        """
+        stats = self._stats
+        lookup = self._lookup
+        events = iter(events)
+        while True:
+            # elapsed time covers reading and applying events
+            start = time.perf_counter()
+            chunk = list(islice(events, self._chunk_size))
+            if not chunk:
+                break
+            results = []
+            for key, action in chunk:
+                machine = lookup(key)
+                if machine is None:
+                    error = FsmError("Unknown entity", key)
+                    results.append(EventResult(key, action, None, error))
+                    continue
+                try:
+                    machine.perform(action)
+                except FsmError as error:
+                    results.append(
+                        EventResult(key, action, machine.state, error)
+                    )
+                    continue
+                if not errors_only:
+                    results.append(
+                        EventResult(key, action, machine.state, None)
+                    )
+            stats.elapsed += time.perf_counter() - start
+            stats.events += len(chunk)
+            stats.errors += sum(1 for r in results if r.error is not None)
+            yield from results
+
+    def consume(self, events):
+        """Applies all events without yielding results, returns the stats"""
+        for _ in self.run(events, errors_only=True):
+            pass
+        return self._stats
@@ -0,0 +1,206 @@
+"""TransitionTable
+Integer indexed transition table used by state machine definitions.
+"""
+
+from array import array
+
+from fsm.transition import guard_source
+
+
+# table value for a state/action pair without a transition
+NO_TRANSITION = -1
+
+# next state value for a state/action pair with guarded candidates
+GUARDED = -2
+
+
+class TransitionTable:
+    """Interns state and action names into dense integer ids and stores
+    transitions in flat arrays indexed by `state_id * stride + action_id`.
+
+    For every state/action pair the table holds the id of the next state and
+    the id of the Transition performed (or NO_TRANSITION).  The stride is the
+    action capacity of a row, it grows by doubling as actions are added so
+    adding actions one at a time stays cheap.
+
+    Pairs with guarded transitions hold GUARDED as next state and the id of
+    their first candidate, the candidate transition ids are kept in
+    evaluation order by table index in `_guarded`.  Cells of several
+    states may hold the id of the same shared transition.
+    """
+
+    def __init__(self):
+        self._state_names = []
+        self._state_ids = {}
+        # State objects by id, None for names only referenced by transitions
+        self._states = []
+        self._action_names = []
+        self._action_ids = {}
+        self._transitions = []
+        self._stride = 1
+        self._next = array("i")
+        self._tran = array("i")
+        self._guarded = {}
+
+    @property
+    def state_names(self):
+        return tuple(self._state_names)
+
+    @property
+    def action_names(self):
+        return tuple(self._action_names)
+
+    @property
+    def stride(self):
+        return self._stride
+
+    def state_id(self, name):
+        """Returns the id of a state name or None if unknown"""
+        return self._state_ids.get(name)
+
+    def action_id(self, name):
+        """Returns the id of an action name or None if unknown"""
+        return self._action_ids.get(name)
+
+    def intern_state(self, name):
+        """Returns the id of a state name, adding a table row if new"""
+        sid = self._state_ids.get(name)
+        if sid is None:
+            sid = len(self._state_names)
+            self._state_names.append(name)
+            self._state_ids[name] = sid
+            self._states.append(None)
+            row = array("i", [NO_TRANSITION]) * self._stride
+            self._next.extend(row)
+            self._tran.extend(row)
+        return sid
+
+    def intern_action(self, name):
+        """Returns the id of an action name, widening the table if needed"""
+        aid = self._action_ids.get(name)
+        if aid is None:
+            aid = len(self._action_names)
+            if aid >= self._stride:
+                self._relayout(self._stride * 2)
+            self._action_names.append(name)
+            self._action_ids[name] = aid
+        return aid
+
+    def _relayout(self, stride):
+        """Copies table rows into arrays with a wider stride"""
+        old = self._stride
+        pad = array("i", [NO_TRANSITION]) * (stride - old)
+        tables = []
+        for table in (self._next, self._tran):
+            wide = array("i")
+            for start in range(0, len(table), old):
+                wide.extend(table[start : start + old])
+                wide.extend(pad)
+            tables.append(wide)
+        self._next, self._tran = tables
+        self._guarded = {
+            index // old * stride + index % old: tids
+            for index, tids in self._guarded.items()
+        }
+        self._stride = stride
+
+    def add_state(self, state):
+        """Adds a State object, returns its id"""
+        sid = self.intern_state(state.name)
+        self._states[sid] = state
+        return sid
+
+    def add_transition(self, transition, from_states=None):
+        """Adds a Transition object, replacing any transition for the same
+        state, action and guard.  Guarded transitions are candidates
+        evaluated in the order they were added, an unguarded transition is
+        the fallback evaluated last.  The transition is added to the rows
+        of from_states, or of its from_state, under a single id.  Returns
+        the transition id.
+        """
+        if from_states is None:
+            from_states = (transition.from_state,)
+        sids = [self.intern_state(name) for name in from_states]
+        to_sid = self.intern_state(transition.to_state)
+        aid = self.intern_action(transition.action)
+        tid = len(self._transitions)
+        self._transitions.append(transition)
+        source = guard_source(transition)
+        for sid in sids:
+            self._add_candidate(sid, aid, tid, to_sid, source)
+        return tid
+
+    def add_unguarded(self, transition):
+        """Adds an unguarded Transition to the row of its from_state, the
+        fast path of add_transition() for cells without transitions.
+        Returns the transition id, or None if the cell already has
+        transitions and nothing was added.
+        """
+        state_ids = self._state_ids
+        sid = state_ids.get(transition.from_state)
+        if sid is None:
+            sid = self.intern_state(transition.from_state)
+        to_sid = state_ids.get(transition.to_state)
+        if to_sid is None:
+            to_sid = self.intern_state(transition.to_state)
+        aid = self._action_ids.get(transition.action)
+        if aid is None:
+            aid = self.intern_action(transition.action)
+        index = sid * self._stride + aid
+        if self._tran[index] != NO_TRANSITION:
+            return None
+        tid = len(self._transitions)
+        self._transitions.append(transition)
+        self._next[index] = to_sid
+        self._tran[index] = tid
+        return tid
+
+    def _add_candidate(self, sid, aid, tid, to_sid, source):
+        """Adds a transition id to the candidates of a table cell"""
+        index = sid * self._stride + aid
+        candidates = list(self.candidates(sid, aid))
+        for i, other in enumerate(candidates):
+            if guard_source(self._transitions[other]) == source:
+                candidates[i] = tid
+                break
+        else:
+            if (
+                source is not None
+                and candidates
+                and self._transitions[candidates[-1]].guard is None
+            ):
+                candidates.insert(len(candidates) - 1, tid)
+            else:
+                candidates.append(tid)
+
+        if len(candidates) == 1 and source is None:
+            self._next[index] = to_sid
+            self._guarded.pop(index, None)
+        else:
+            self._next[index] = GUARDED
+            self._guarded[index] = tuple(candidates)
+        self._tran[index] = candidates[0]
+
+    def candidates(self, state_id, action_id):
+        """Returns a tuple of the ids of the transitions for a state and
+        action, in evaluation order.
+        """
+        if not 0 <= action_id < self._stride:
+            return ()
+        index = state_id * self._stride + action_id
+        tid = self._tran[index]
+        if tid < 0:
+            return ()
+        if self._next[index] == GUARDED:
+            return self._guarded[index]
+        return (tid,)
+
+    def lookup(self, state_id, action_id):
+        """Returns the (next state id, transition id) pair for a state and
+        action, both NO_TRANSITION if there is no such transition.  The next
+        state id is GUARDED if the transition depends on guards.
+        """
+        if not 0 <= action_id < self._stride:
+            return NO_TRANSITION, NO_TRANSITION
+        index = state_id * self._stride + action_id
+        return self._next[index], self._tran[index]
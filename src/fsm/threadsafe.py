@@ -0,0 +1,107 @@
+"""Thread safe state machines
+State machines which serialize transitions with a lock per machine, and so
+per model, rather than a global lock.
+"""
+
+from threading import RLock
+
+from fsm.definition import BoundFsm, DescriptorBoundFsm
+from fsm.fsm import Fsm
+from fsm.queued import (
+    RunToCompletionBoundFsm,
+    RunToCompletionDescriptorBoundFsm,
+    RunToCompletionFsm,
+)
+
+
+class ThreadSafeMixin:
+    """Holds the machine's lock while an action reads the current state,
+    checks the transition, calls callbacks and writes the new state.
+
+    The lock is re-entrant so callbacks may perform further actions on the
+    same model.  Reading the state, is_<state> checks, get_actions() and
+    actions do not take the lock.
+    """
+
+    __slots__ = ()
+
+    def perform_id(self, action_id):
+        with self._lock:
+            return super().perform_id(action_id)
+
+    def perform_if(self, expected_state, action):
+        """Atomically performs an action only if the current state is
+        expected_state.  Returns the Transition performed, or None if the
+        state differs.
+        """
+        with self._lock:
+            return super().perform_if(expected_state, action)
+
+    def perform_many(self, actions, rollback=False):
+        """Atomically validates and performs a sequence of actions, see
+        BoundFsm.perform_many().
+        """
+        with self._lock:
+            return super().perform_many(actions, rollback)
+
+
+class ThreadSafeBoundFsm(ThreadSafeMixin, BoundFsm):
+    """A thread safe BoundFsm"""
+
+    __slots__ = ("_lock",)
+
+    def __init__(self, definition, model=None):
+        self._lock = RLock()
+        super().__init__(definition, model)
+
+
+class ThreadSafeDescriptorBoundFsm(ThreadSafeMixin, DescriptorBoundFsm):
+    """A thread safe DescriptorBoundFsm"""
+
+    __slots__ = ("_lock",)
+
+    def __init__(self, definition, model):
+        self._lock = RLock()
+        super().__init__(definition, model)
+
+
+class ThreadSafeFsm(ThreadSafeMixin, Fsm):
+    """A thread safe Fsm"""
+
+    def __init__(self, *args, **kwargs):
+        self._lock = RLock()
+        super().__init__(*args, **kwargs)
+
+
+class ThreadSafeRunToCompletionBoundFsm(
+    ThreadSafeMixin, RunToCompletionBoundFsm
+):
+    """A thread safe RunToCompletionBoundFsm, other threads wait for the
+    queue to be drained.
+    """
+
+    __slots__ = ("_lock",)
+
+    def __init__(self, definition, model=None, coalesce=False):
+        self._lock = RLock()
+        super().__init__(definition, model, coalesce)
+
+
+class ThreadSafeRunToCompletionDescriptorBoundFsm(
+    ThreadSafeMixin, RunToCompletionDescriptorBoundFsm
+):
+    """A thread safe RunToCompletionDescriptorBoundFsm"""
+
+    __slots__ = ("_lock",)
+
+    def __init__(self, definition, model, coalesce=False):
+        self._lock = RLock()
+        super().__init__(definition, model, coalesce)
+
+
+class ThreadSafeRunToCompletionFsm(ThreadSafeMixin, RunToCompletionFsm):
+    """A thread safe RunToCompletionFsm"""
+
+    def __init__(self, *args, **kwargs):
+        self._lock = RLock()
+        super().__init__(*args, **kwargs)
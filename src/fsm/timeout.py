@@ -0,0 +1,247 @@
+"""Timeouts
+Fires the on_timeout action of machines which stayed in a state with a
+timeout, keeping the deadlines of all attached machines in a single heap.
+"""
+
+import asyncio
+from heapq import heapify, heappop, heappush
+from itertools import count
+import threading
+import time
+
+from fsm.error import FsmError
+
+# fields of a heap entry, an entry is cancelled by clearing its machine
+_DEADLINE, _SEQUENCE, _MACHINE, _STATE = range(4)
+
+# cancelled entries are only compacted away once there are this many
+_COMPACT_MIN = 1024
+
+
+class TimeoutScheduler:
+    """Schedules the timeouts of attached machines.
+
+    An attached machine reports each state change: the pending timeout of
+    the state left is cancelled and one is scheduled if the entered state
+    has a timeout.  Self transitions do not leave the state, they do not
+    restart its timeout.  Scheduling is O(log n) and cancelling O(1), so
+    millions of machines can be attached; cancelled entries are dropped as
+    they reach the top of the heap, or all at once when they outnumber the
+    pending timeouts.
+
+    Due timeouts are fired by run_due(), by the run() driver in a thread of
+    its own or by the arun() asyncio driver.  A timeout performs the state's
+    on_timeout action on the machine.  If the action fails with FsmError,
+    for example because no guard passed, the machine's observer is told
+    and the other due timeouts are still fired.  Other exceptions
+    propagate from the driver and the remaining timeouts stay pending.
+
+    The clock returns the current time in seconds, deadlines are compared
+    with it.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []
+        # machine to its pending entry
+        self._pending = {}
+        self._cancelled = 0
+        self._sequence = count()
+        self._lock = threading.Lock()
+        self._running = False
+        self._wakeup = threading.Event()
+        self._loop = None
+        self._async_wakeup = None
+
+    def __len__(self):
+        """Returns the number of pending timeouts"""
+        return len(self._pending)
+
+    def attach(self, machine):
+        """Attaches a machine, scheduling the timeout of its current state"""
+        timers = machine._timers
+        if timers is self:
+            return
+        if timers is not None:
+            raise FsmError("Machine is attached to another scheduler")
+        machine._timers = self
+        self.state_changed(machine, machine.get_state())
+
+    def detach(self, machine):
+        """Detaches a machine, cancelling its pending timeout"""
+        if machine._timers is not self:
+            raise FsmError("Machine is not attached to this scheduler")
+        machine._timers = None
+        with self._lock:
+            self._cancel(machine)
+
+    def deadline(self, machine):
+        """Returns the deadline of a machine's pending timeout, None if it
+        has none.
+        """
+        entry = self._pending.get(machine)
+        return None if entry is None else entry[_DEADLINE]
+
+    def next_deadline(self):
+        """Returns the earliest pending deadline, None if there is none"""
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][_MACHINE] is None:
+                heappop(heap)
+                self._cancelled -= 1
+            return heap[0][_DEADLINE] if heap else None
+
+    def state_changed(self, machine, state):
+        """Called by attached machines when their state is set to a State,
+        reschedules their timeout.
+        """
+        timeout = state.timeout
+        if timeout is None and machine not in self._pending:
+            return
+        wake = False
+        with self._lock:
+            self._cancel(machine)
+            if timeout is not None:
+                entry = [
+                    self._clock() + timeout,
+                    next(self._sequence),
+                    machine,
+                    machine._state,
+                ]
+                self._pending[machine] = entry
+                heappush(self._heap, entry)
+                wake = self._heap[0] is entry
+        if wake:
+            self._notify()
+
+    def _cancel(self, machine):
+        """Cancels the pending timeout of a machine, with the lock held"""
+        entry = self._pending.pop(machine, None)
+        if entry is None:
+            return
+        entry[_MACHINE] = None
+        self._cancelled += 1
+        if (
+            self._cancelled > _COMPACT_MIN
+            and self._cancelled > len(self._pending)
+        ):
+            self._heap = [e for e in self._heap if e[_MACHINE] is not None]
+            heapify(self._heap)
+            self._cancelled = 0
+
+    def _pop_due(self, now):
+        """Removes the earliest timeout due at now, returns a (machine,
+        state id, action) tuple or None if no timeout is due.
+        """
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][_DEADLINE] <= now:
+                entry = heappop(heap)
+                machine = entry[_MACHINE]
+                if machine is None:
+                    self._cancelled -= 1
+                    continue
+                del self._pending[machine]
+                state_id = entry[_STATE]
+                state = machine._definition._table._states[state_id]
+                return machine, state_id, state.on_timeout
+        return None
+
+    def run_due(self, now=None):
+        """Fires the timeouts due at now, the current time by default.
+        Returns a list of the Transitions performed.
+        """
+        now = self._clock() if now is None else now
+        performed = []
+        due = self._pop_due(now)
+        while due is not None:
+            machine, state_id, action = due
+            # the state may have changed since the timeout was removed,
+            # perform_if() checks it atomically on thread safe machines
+            state = machine._definition._table._state_names[state_id]
+            try:
+                transition = machine.perform_if(state, action)
+            except FsmError:
+                # reported to the machine's observer by perform
+                transition = None
+            if transition is not None:
+                performed.append(transition)
+            due = self._pop_due(now)
+        return performed
+
+    async def arun_due(self, now=None):
+        """Fires the timeouts due at now, see run_due().  Machines with an
+        aperform_if() method, such as AsyncFsm, are awaited.
+        """
+        now = self._clock() if now is None else now
+        performed = []
+        due = self._pop_due(now)
+        while due is not None:
+            machine, state_id, action = due
+            state = machine._definition._table._state_names[state_id]
+            aperform_if = getattr(machine, "aperform_if", None)
+            try:
+                if aperform_if is None:
+                    transition = machine.perform_if(state, action)
+                else:
+                    transition = await aperform_if(state, action)
+            except FsmError:
+                # reported to the machine's observer by aperform
+                transition = None
+            if transition is not None:
+                performed.append(transition)
+            due = self._pop_due(now)
+        return performed
+
+    def _timeout(self):
+        """Returns the seconds until the next deadline, None if there is
+        none.
+        """
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self._clock())
+
+    def _notify(self):
+        """Wakes the running driver up, the earliest deadline changed"""
+        self._wakeup.set()
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._async_wakeup.set)
+
+    def stop(self):
+        """Stops the running driver"""
+        self._running = False
+        self._notify()
+
+    def run(self):
+        """Fires timeouts as they become due until stop() is called, from
+        another thread or from a callback.
+        """
+        self._running = True
+        wakeup = self._wakeup
+        while self._running:
+            wakeup.clear()
+            self.run_due()
+            if self._running:
+                wakeup.wait(self._timeout())
+
+    async def arun(self):
+        """Fires timeouts as they become due until stop() is called or the
+        task is cancelled.
+        """
+        self._async_wakeup = wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        try:
+            while self._running:
+                wakeup.clear()
+                await self.arun_due()
+                if not self._running:
+                    break
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self._timeout())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
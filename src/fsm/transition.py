@@ -1,22 +1,40 @@
-import voluptuous as vol
-
-
 from fsm.util import CallbackManager
 
+# from_state of a transition applying to every state
+WILDCARD = "*"
+
 
 class Transition:
     """Defines an action that transitions state machine from one state to 
-    another.
+    another.  An optional guard, see fsm.guard, must pass for the
+    transition to be performed.
+
+    The from_state may also be a list of state names or WILDCARD, a single
+    Transition object is then shared by all the states it applies to.
     """
 
     def __init__(
-        self, action, from_state, to_state, on_before=None, on_after=None
+        self,
+        action,
+        from_state,
+        to_state,
+        on_before=None,
+        on_after=None,
+        guard=None,
     ):
+        if not isinstance(from_state, str):
+            from_state = tuple(from_state)
         self._action = action
         self._from = from_state
         self._to = to_state
         self._on_before = CallbackManager(on_before)
         self._on_after = CallbackManager(on_after)
+        self._guard = None
+        if guard is not None:
+            # fsm.guard imports ast, only needed by guarded machines
+            from fsm.guard import compile_guard
+
+            self._guard = compile_guard(guard)
 
     @property
     def action(self):
@@ -26,6 +44,13 @@ class Transition:
     def from_state(self):
         return self._from
 
+    @property
+    def multi_source(self):
+        """Returns True if the transition applies to a list of states or
+        to every state.
+        """
+        return not isinstance(self._from, str) or self._from == WILDCARD
+
     @property
     def to_state(self):
         return self._to
@@ -37,3 +62,14 @@ class Transition:
     @property
     def on_after(self):
         return self._on_after
+
+    @property
+    def guard(self):
+        """Returns the compiled Guard or None"""
+        return self._guard
+
+
+def guard_source(transition):
+    """Returns the guard source of a transition, None if unguarded"""
+    guard = transition.guard
+    return None if guard is None else guard.source
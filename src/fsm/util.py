@@ -1,3 +1,6 @@
+from types import FunctionType
+
+
 def as_cb_list(data):
     """Validates callback name or names and returns them as a list.  Standalone
     strings are allowed, along with lists or tuples containing only strings.
@@ -14,6 +17,45 @@ def as_cb_list(data):
     raise TypeError()
 
 
+class InstanceCallback:
+    """Calls a named callback looked up on the target at call time.  Used
+    for callbacks which are not plain methods of the target's class.
+    Returns the callback's result, so coroutines can be awaited.
+    """
+
+    __slots__ = ("_name",)
+
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    def __call__(self, target):
+        c = getattr(target, self._name, None)
+        if callable(c):
+            return c()
+        return None
+
+
+def resolve_callback(name, target_class, target=None):
+    """Resolves a callback name against a target class.  Returns a callable
+    taking the target: the plain function defined by the class, otherwise an
+    InstanceCallback.  If a target is provided its instance attributes take
+    precedence, as they would with getattr().
+    """
+    # inspect is slow to import and only needed once models are bound
+    from inspect import getattr_static
+
+    attr = getattr_static(target_class, name, None)
+    if isinstance(attr, FunctionType) and name not in getattr(
+        target, "__dict__", ()
+    ):
+        return attr
+    return InstanceCallback(name)
+
+
 class CallbackManager:
     """A class to manage a list of named callback functions and call them
     on a target.
@@ -31,6 +73,17 @@ class CallbackManager:
         """Adds callbacks to the internal callback list"""
         self._callbacks += as_cb_list(callback)
 
+    def resolve(self, target_class, target=None):
+        """Resolves the callback list against a target class, returns a
+        tuple of callables taking the target, see resolve_callback().
+        """
+        if not self._callbacks:
+            return ()
+        return tuple(
+            resolve_callback(cb, target_class, target)
+            for cb in self._callbacks
+        )
+
     def call_on(self, target):
         """Given a target object looks for callable attributes in the
         callback list.  Each callable found is called.
@@ -0,0 +1,162 @@
+"""Test fsm.aio"""
+import asyncio
+
+import pytest
+
+from fsm import create_fsm, FsmError
+from fsm.aio import AsyncFsm
+
+
+@pytest.fixture(name="fsm_data")
+def fixture_fsm_data():
+    return {
+        "start_state": "s1",
+        "states": [
+            {"name": "s1", "on_exit": "on_exit"},
+            {"name": "s2", "on_enter": "on_enter"},
+        ],
+        "transitions": [
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "on_before": "on_before",
+                "on_after": "on_after",
+            },
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+    }
+
+
+class AsyncModel:
+    def __init__(self):
+        self.calls = []
+
+    async def on_before(self):
+        await asyncio.sleep(0)
+        self.calls.append("before")
+
+    def on_exit(self):
+        self.calls.append("exit")
+
+    async def on_enter(self):
+        await asyncio.sleep(0)
+        self.calls.append("enter")
+
+    async def on_after(self):
+        self.calls.append("after")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_aperform(fsm_data):
+    model = AsyncModel()
+    fsm = create_fsm(
+        data=fsm_data, model=model, fsm_class=AsyncFsm, feedback=False
+    )
+    transition = run(fsm.aperform("a1"))
+    assert transition.to_state == "s2"
+    assert model.state == "s2"
+    assert model.calls == ["before", "exit", "enter", "after"]
+
+
+def test_model_action_is_awaitable(fsm_data):
+    model = AsyncModel()
+    AsyncFsm(model=model, feedback=False, **fsm_data)
+
+    async def actions():
+        await model.a1()
+        await model.a2()
+
+    run(actions())
+    assert model.is_s1()
+
+
+def test_aperform_invalid_action(fsm_data):
+    fsm = AsyncFsm(feedback=False, **fsm_data)
+    with pytest.raises(FsmError):
+        run(fsm.aperform("a2"))
+    with pytest.raises(FsmError):
+        run(fsm.aperform("invalid"))
+
+
+def test_aperform_if(fsm_data):
+    model = AsyncModel()
+    fsm = AsyncFsm(model=model, feedback=False, **fsm_data)
+
+    async def actions():
+        # the second waits for the lock, then finds the state changed
+        return await asyncio.gather(
+            fsm.aperform_if("s1", "a1"), fsm.aperform_if("s1", "a1")
+        )
+
+    first, second = run(actions())
+    assert first.to_state == "s2" and second is None
+    assert model.calls == ["before", "exit", "enter", "after"]
+
+
+def test_aperform_serialized(fsm_data):
+    model = AsyncModel()
+    fsm = AsyncFsm(model=model, feedback=False, **fsm_data)
+
+    async def actions():
+        return await asyncio.gather(
+            fsm.aperform("a1"), fsm.aperform("a2"), return_exceptions=True
+        )
+
+    results = run(actions())
+    assert not any(isinstance(r, Exception) for r in results)
+    assert model.state == "s1"
+    assert model.calls == ["before", "exit", "enter", "after"]
+
+
+def test_aperform_reentrant(fsm_data):
+    class Model(AsyncModel):
+        async def on_after(self):
+            await self.a2()
+
+    fsm = AsyncFsm(model=Model(), feedback=False, **fsm_data)
+    with pytest.raises(FsmError):
+        run(fsm.aperform("a1"))
+
+
+def test_aperform_observed(fsm_data):
+    from fsm.observer import MetricsObserver
+
+    fsm = AsyncFsm(model=AsyncModel(), feedback=False, **fsm_data)
+    metrics = MetricsObserver()
+    fsm.add_observer(metrics)
+    run(fsm.aperform("a1"))
+    exported = metrics.export()
+    assert exported["transitions"] == {"s1:a1->s2": 1}
+    assert set(exported["callback_latency"]) == {
+        "on_before",
+        "on_exit",
+        "on_enter",
+        "on_after",
+    }
+
+
+def test_instance_coroutine_callbacks(fsm_data):
+    class Model:
+        def __init__(self):
+            self.calls = []
+
+            async def on_enter():
+                await asyncio.sleep(0)
+                self.calls.append("enter")
+
+            self.on_enter = on_enter
+
+        @staticmethod
+        async def on_after():
+            await asyncio.sleep(0)
+
+    model = Model()
+    fsm = create_fsm(
+        data=fsm_data, model=model, fsm_class=AsyncFsm, feedback=False
+    )
+    run(fsm.aperform("a1"))
+    assert model.calls == ["enter"]
@@ -0,0 +1,220 @@
+"""Test fsm.analysis"""
+from types import SimpleNamespace
+
+import pytest
+
+from fsm import FsmDefinition
+from fsm.analysis import analyze, minimize, reachable_states
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    # s2 and s3 behave the same, s4 is unreachable, s5 is only named by a
+    # transition
+    return FsmDefinition(
+        states=["s1", "s2", "s3", "s4", "done", "stuck"],
+        transitions=[
+            {"action": "left", "from_state": "s1", "to_state": "s2"},
+            {"action": "right", "from_state": "s1", "to_state": "s3"},
+            {"action": "finish", "from_state": "s2", "to_state": "done"},
+            {"action": "finish", "from_state": "s3", "to_state": "done"},
+            {"action": "wait", "from_state": "s2", "to_state": "stuck"},
+            {"action": "wait", "from_state": "s3", "to_state": "stuck"},
+            {"action": "wait", "from_state": "stuck", "to_state": "stuck"},
+            {"action": "jump", "from_state": "s4", "to_state": "s5"},
+        ],
+        start_state="s1",
+    )
+
+
+def test_analyze(definition):
+    assert reachable_states(definition) == ["s1", "s2", "s3", "done", "stuck"]
+    analysis = analyze(definition)
+    assert analysis.unreachable == ["s4", "s5"]
+    assert analysis.dead_ends == ["done", "s5"]
+    assert analysis.sinks == ["stuck"]
+    assert analysis.unused_actions == ["jump"]
+    assert analysis.undefined == ["s5"]
+
+
+def test_minimize(definition):
+    minimized, state_map = minimize(definition)
+    assert minimized.state_names == ("s1", "s2", "done", "stuck")
+    assert state_map["s3"] == "s2"
+    assert "s4" not in state_map
+    assert minimized.get_actions("s1") == ["left", "right"]
+    machine = minimized.bind()
+    machine.perform("right")
+    assert machine.state == "s2"
+
+    minimized, state_map = minimize(definition, reachable_only=False)
+    assert state_map["s4"] == "s4"
+    assert "s5" in minimized.state_names
+
+
+def test_minimize_respects_callbacks():
+    definition = FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "enter"}, "s3", "s4"],
+        transitions=[
+            {"action": "a", "from_state": "s1", "to_state": "s2"},
+            {"action": "b", "from_state": "s1", "to_state": "s3"},
+            {"action": "c", "from_state": "s1", "to_state": "s4"},
+            {"action": "x", "from_state": "s2", "to_state": "s1"},
+            {"action": "x", "from_state": "s3", "to_state": "s1"},
+            {
+                "action": "x",
+                "from_state": "s4",
+                "to_state": "s1",
+                "on_after": "after",
+            },
+        ],
+        start_state="s1",
+    )
+    minimized, _ = minimize(definition)
+    assert len(minimized.state_names) == 4
+
+
+def test_minimize_chain():
+    # a ring of equivalent states collapses to one, a chain ending in a
+    # dead end does not collapse
+    n = 1000
+    ring = FsmDefinition(
+        states=[f"s{i}" for i in range(n)],
+        transitions=[
+            {
+                "action": "next",
+                "from_state": f"s{i}",
+                "to_state": f"s{(i + 1) % n}",
+            }
+            for i in range(n)
+        ],
+        start_state="s0",
+    )
+    minimized, state_map = minimize(ring)
+    assert minimized.state_names == ("s0",)
+    assert set(state_map.values()) == {"s0"}
+
+    chain = FsmDefinition(
+        states=[f"s{i}" for i in range(n)],
+        transitions=[
+            {"action": "next", "from_state": f"s{i}", "to_state": f"s{i + 1}"}
+            for i in range(n - 1)
+        ],
+        start_state="s0",
+    )
+    assert minimize(chain).definition is chain
+
+
+def test_minimize_guarded():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3", "s4", "s5"],
+        transitions=[
+            {
+                "action": "a",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "ready",
+            },
+            {"action": "a", "from_state": "s1", "to_state": "s3"},
+            {"action": "x", "from_state": "s2", "to_state": "s4"},
+            {"action": "x", "from_state": "s3", "to_state": "s5"},
+            {
+                "action": "y",
+                "from_state": "s4",
+                "to_state": "s1",
+                "guard": "ready",
+            },
+            {
+                "action": "y",
+                "from_state": "s5",
+                "to_state": "s1",
+                "guard": "not ready",
+            },
+        ],
+        start_state="s1",
+    )
+    assert analyze(definition).unreachable == []
+    # states differing only by guards are not merged
+    assert minimize(definition).definition is definition
+
+    same = FsmDefinition(
+        states=["s1", "s2", "s3", "s4"],
+        transitions=[
+            {
+                "action": "a",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "ready",
+            },
+            {"action": "a", "from_state": "s1", "to_state": "s3"},
+            {"action": "x", "from_state": "s2", "to_state": "s4"},
+            {"action": "x", "from_state": "s3", "to_state": "s4"},
+        ],
+        start_state="s1",
+    )
+    minimized, state_map = minimize(same)
+    assert minimized.state_names == ("s1", "s2", "s4")
+    assert state_map["s3"] == "s2"
+    guards = [t.guard and t.guard.source for t in minimized.transitions]
+    assert guards.count("ready") == 1
+    machine = minimized.bind(SimpleNamespace(ready=False))
+    assert machine.perform("a").to_state == "s2"
+
+
+def test_minimize_shares_wildcard():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3", "reset", "off"],
+        transitions=[
+            {"action": "next", "from_state": "s1", "to_state": "s2"},
+            {"action": "next", "from_state": "s2", "to_state": "s3"},
+            {"action": "next", "from_state": "s3", "to_state": "s3"},
+            {"action": "reset", "from_state": "*", "to_state": "reset"},
+            {"action": "off", "from_state": "reset", "to_state": "off"},
+            {"action": "reset", "from_state": "off", "to_state": "off"},
+        ],
+        start_state="s1",
+    )
+    minimized, state_map = minimize(definition)
+    assert state_map["s2"] == state_map["s3"] == "s1"
+    reset = [t for t in minimized.transitions if t.action == "reset"]
+    assert [(t.from_state, t.to_state) for t in reset] == [
+        (("s1", "reset"), "reset"),
+        ("off", "off"),
+    ]
+    machine = minimized.bind()
+    machine.perform("next")
+    machine.perform("reset")
+    machine.perform("off")
+    machine.perform("reset")
+    assert machine.state == "off"
+
+
+def test_minimize_keeps_state_changes():
+    definition = FsmDefinition(
+        states=[
+            {"name": "s0", "on_enter": "cb"},
+            {"name": "s1", "on_enter": "cb"},
+            "s2",
+            "s3",
+        ],
+        transitions=[
+            {"action": "go", "from_state": "s0", "to_state": "s1"},
+            {"action": "go", "from_state": "s1", "to_state": "s0"},
+            {"action": "next", "from_state": "s0", "to_state": "s2"},
+            {"action": "next", "from_state": "s1", "to_state": "s2"},
+            {"action": "go", "from_state": "s2", "to_state": "s3"},
+            {"action": "go", "from_state": "s3", "to_state": "s2"},
+        ],
+        start_state="s0",
+    )
+    minimized, state_map = minimize(definition)
+    # s0 and s1 would be merged into a self transition, s2 and s3 call no
+    # callbacks
+    assert state_map == {"s0": "s0", "s1": "s1", "s2": "s2", "s3": "s2"}
+
+    model = SimpleNamespace(calls=0)
+    model.cb = lambda: setattr(model, "calls", model.calls + 1)
+    machine = minimized.bind(model)
+    for _ in range(4):
+        machine.perform("go")
+    assert model.calls == 4
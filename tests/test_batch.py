@@ -0,0 +1,106 @@
+"""Test fsm.batch"""
+import pytest
+
+from fsm import FsmDefinition, FsmError
+
+np = pytest.importorskip("numpy")
+
+from fsm.batch import BatchFsm, NO_ACTION  # noqa: E402
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s2", "to_state": "s3"},
+            {"action": "a2", "from_state": "s1", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+def test_create_with_size(definition):
+    batch = BatchFsm(definition, size=4)
+    assert len(batch) == 4
+    assert batch.state_names() == ["s1"] * 4
+
+
+def test_create_requires_size_or_states(definition):
+    with pytest.raises(ValueError):
+        BatchFsm(definition)
+
+
+def test_create_invalid_states(definition):
+    with pytest.raises(FsmError):
+        BatchFsm(definition, states=[0, 7])
+
+
+def test_step(definition):
+    batch = BatchFsm(definition, size=4)
+    actions = batch.encode_actions(["a1", "a2", None, "invalid"])
+    result = batch.step(actions)
+    assert batch.state_names() == ["s2", "s1", "s1", "s1"]
+    assert result.success.tolist() == [True, True, False, False]
+    assert result.invalid.tolist() == [False, False, False, True]
+
+    result = batch.step(batch.encode_actions(["a2", "a2", "a1", "a1"]))
+    assert batch.state_names() == ["s3", "s1", "s2", "s2"]
+    assert result.success.all()
+
+
+def test_step_invalid_action_for_state(definition):
+    batch = BatchFsm(definition, size=2)
+    batch.perform("a1", mask=[True, False])
+    result = batch.perform("a1")
+    assert result.success.tolist() == [False, True]
+    assert result.invalid.tolist() == [True, False]
+    assert batch.state_names() == ["s2", "s2"]
+
+
+def test_step_wrong_shape(definition):
+    batch = BatchFsm(definition, size=2)
+    with pytest.raises(ValueError):
+        batch.step([NO_ACTION])
+
+
+def test_groups(definition):
+    batch = BatchFsm(definition, size=5)
+    result = batch.step(batch.encode_actions(["a1", "a2", "a1", None, "a2"]))
+    groups = result.groups()
+    a1 = int(result.transition_ids[0])
+    a2 = int(result.transition_ids[1])
+    assert sorted(groups) == sorted([a1, a2])
+    assert groups[a1].tolist() == [0, 2]
+    assert groups[a2].tolist() == [1, 4]
+
+
+def test_transition_to_undeclared_state_is_invalid():
+    definition = FsmDefinition(
+        states=["s1"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+    batch = BatchFsm(definition, size=1)
+    result = batch.perform("a1")
+    assert result.invalid.all()
+    assert batch.state_names() == ["s1"]
+
+
+def test_guarded_transition_is_invalid():
+    definition = FsmDefinition(
+        states=["s1", "s2"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "ready",
+            },
+        ],
+        start_state="s1",
+    )
+    batch = BatchFsm(definition, size=1)
+    assert batch.perform("a1").invalid.all()
+    assert batch.state_names() == ["s1"]
@@ -0,0 +1,504 @@
+"""Test fsm.definition"""
+import sys
+
+import pytest
+import voluptuous as vol
+
+from fsm import (
+    BoundFsm,
+    create_definition,
+    Fsm,
+    FsmDefinition,
+    FsmError,
+)
+
+
+@pytest.fixture(name="fsm_doc")
+def fixture_fsm_doc():
+    return """
+        start_state: s1
+        states:
+            - s1
+            - name: s2
+              on_enter: on_callback
+        transitions:
+            - action: a1
+              from_state: s1
+              to_state: s2
+            - action: a2
+              from_state: s2
+              to_state: s1
+    """
+
+
+class DummyModel:
+    def __init__(self):
+        self.cb_count = 0
+
+    def on_callback(self):
+        self.cb_count += 1
+
+
+def test_create_no_start_state():
+    with pytest.raises(FsmError):
+        FsmDefinition(states=["s1"])
+
+
+def test_create_invalid_start_state():
+    definition = FsmDefinition(states=["s1"], start_state="s2")
+    with pytest.raises(FsmError):
+        definition.bind()
+
+
+def test_from_data():
+    definition = FsmDefinition.from_data(
+        {
+            "start_state": "s1",
+            "states": ["s1", "s2"],
+            "transitions": [
+                {"action": "a1", "from_state": "s1", "to_state": "s2"}
+            ],
+        }
+    )
+    assert definition.start_state == "s1"
+    assert [s.name for s in definition.states] == ["s1", "s2"]
+    assert definition.get_actions("s1") == ["a1"]
+
+
+def test_from_data_without_validation():
+    data = {
+        "start_state": "s1",
+        "states": ["s1", {"name": "s2", "on_enter": "cb"}],
+        "transitions": [
+            {"action": "a1", "from_state": "s1", "to_state": "s2"}
+        ],
+    }
+    definition = FsmDefinition.from_data(data, validate=False)
+    assert definition.states[1].on_enter.callbacks == ["cb"]
+    assert definition.get_actions("s1") == ["a1"]
+    with pytest.raises(vol.MultipleInvalid):
+        FsmDefinition.from_data(dict(data, states=[1]))
+
+
+def test_create_definition_from_doc(fsm_doc):
+    definition = create_definition(doc=fsm_doc)
+    assert isinstance(definition, FsmDefinition)
+    assert [t.action for t in definition.transitions] == ["a1", "a2"]
+
+
+def test_bind_shares_definition(fsm_doc):
+    definition = create_definition(doc=fsm_doc)
+    m1, m2 = DummyModel(), DummyModel()
+    f1, f2 = definition.bind(m1), definition.bind(m2)
+    assert isinstance(f1, BoundFsm)
+    assert f1.definition is f2.definition
+    f1.perform("a1")
+    assert m1.state == "s2" and f1.state == "s2" and f1.is_state("s2")
+    assert m2.state == "s1" and f2.state == "s1"
+    assert m1.cb_count == 1 and m2.cb_count == 0
+    assert f1.actions == ["a2"]
+    assert f2.get_actions() == ["a1"]
+
+
+def test_bind_does_not_add_model_methods(fsm_doc):
+    model = DummyModel()
+    create_definition(doc=fsm_doc).bind(model)
+    assert not hasattr(model, "a1")
+    assert not hasattr(model, "is_s1")
+
+
+def test_bound_without_model(fsm_doc):
+    machine = create_definition(doc=fsm_doc).bind()
+    assert machine.model is machine
+    machine.perform("a1")
+    assert machine.state == "s2"
+    assert machine.get_state().name == "s2"
+
+
+def test_bound_invalid_action(fsm_doc):
+    machine = create_definition(doc=fsm_doc).bind()
+    with pytest.raises(FsmError):
+        machine.perform("a2")
+
+
+def test_bound_is_small(fsm_doc):
+    machine = create_definition(doc=fsm_doc).bind(DummyModel())
+    assert not hasattr(machine, "__dict__")
+    assert sys.getsizeof(machine) <= 80
+
+
+def test_fsm_definition_is_a_copy():
+    fsm = Fsm(states=["s1", "s2"], start_state="s1", feedback=False)
+    definition = fsm.definition
+    fsm.add_transition({"action": "a1", "from_state": "s1", "to_state": "s2"})
+    assert definition.get_actions("s1") == []
+    assert definition.bind().state == "s1"
+
+
+def test_perform_id(fsm_doc):
+    definition = create_definition(doc=fsm_doc)
+    model = DummyModel()
+    machine = definition.bind(model)
+    a1, a2 = definition.action_id("a1"), definition.action_id("a2")
+    assert definition.action_names == ("a1", "a2")
+    transition = machine.perform_id(a1)
+    assert transition.to_state == "s2"
+    assert machine.state_id == definition.state_id("s2")
+    assert model.state == "s2" and model.cb_count == 1
+    machine.perform_id(a2)
+    assert model.state == "s1"
+    with pytest.raises(FsmError):
+        machine.perform_id(a2)
+    with pytest.raises(FsmError):
+        machine.perform_id(99)
+
+
+def test_perform_many(fsm_doc):
+    definition = create_definition(doc=fsm_doc)
+    model = DummyModel()
+    machine = definition.bind(model)
+    transitions = machine.perform_many(["a1", "a2", "a1"])
+    assert [t.action for t in transitions] == ["a1", "a2", "a1"]
+    assert model.state == "s2" and model.cb_count == 2
+
+    # the path is validated before any callback is called
+    with pytest.raises(FsmError, match="'a1' in state 's2' at step 2"):
+        machine.perform_many(["a2", "a1", "a1"])
+    with pytest.raises(FsmError, match="at step 1"):
+        machine.perform_many(["a2", "invalid"])
+    assert model.state == "s2" and model.cb_count == 2
+
+
+def test_perform_many_rollback(fsm_doc):
+    class FailingModel(DummyModel):
+        def on_callback(self):
+            super().on_callback()
+            if self.cb_count == 2:
+                raise RuntimeError()
+
+    definition = create_definition(doc=fsm_doc)
+    model = FailingModel()
+    machine = definition.bind(model)
+    with pytest.raises(RuntimeError):
+        machine.perform_many(["a1", "a2", "a1"], rollback=True)
+    assert model.state == "s1" and machine.state == "s1"
+
+    model.cb_count = 1
+    with pytest.raises(RuntimeError):
+        machine.perform_many(["a1", "a2", "a1"])
+    assert model.state == "s2"
+
+
+def test_query_indexes():
+    fsm = Fsm(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s1", "to_state": "s3"},
+            {"action": "a1", "from_state": "s2", "to_state": "s3"},
+        ],
+        start_state="s1",
+        feedback=False,
+    )
+    definition = fsm._definition
+    assert definition.actions_of("s1") == ("a1", "a2")
+    assert definition.actions_of("s3") == ()
+    assert definition.actions_of("invalid") == ()
+    assert definition.states_accepting("a1") == {"s1", "s2"}
+    assert definition.states_accepting("invalid") == frozenset()
+    assert [t.from_state for t in definition.incoming_transitions("s3")] == [
+        "s1",
+        "s2",
+    ]
+    assert fsm.available_actions == ("a1", "a2")
+    assert fsm.available_actions is definition.actions_of("s1")
+    assert fsm.actions == ["a1", "a2"]
+
+    # indexes follow added and replaced transitions
+    fsm.add_state("s4")
+    fsm.add_transition({"action": "a3", "from_state": "s4", "to_state": "s1"})
+    fsm.add_transition({"action": "a1", "from_state": "s2", "to_state": "s1"})
+    assert definition.actions_of("s4") == ("a3",)
+    assert definition.actions_of("s2") == ("a1",)
+    assert len(definition.incoming_transitions("s3")) == 1
+    assert {t.from_state for t in definition.incoming_transitions("s1")} == {
+        "s2",
+        "s4",
+    }
+    assert definition.states_accepting("a3") == {"s4"}
+    fsm.perform("a1")
+    assert fsm.available_actions == ("a1",)
+
+
+def test_unknown_names(fsm_doc):
+    definition = create_definition(doc=fsm_doc)
+    with pytest.raises(FsmError):
+        definition.action_id("invalid")
+    with pytest.raises(FsmError):
+        definition.state_id("invalid")
+
+
+def test_transition_to_undeclared_state():
+    machine = FsmDefinition(
+        states=["s1"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    ).bind()
+    with pytest.raises(FsmError):
+        machine.perform("a1")
+
+
+def test_pickle_drops_model_class_caches(fsm_doc):
+    import pickle
+
+    class LocalModel:
+        pass
+
+    definition = create_definition(doc=fsm_doc)
+    definition.bind(LocalModel())
+    copy = pickle.loads(pickle.dumps(definition))
+    assert copy.state_names == definition.state_names
+    assert copy.bind().perform("a1").to_state == "s2"
+
+
+@pytest.fixture(name="nested_doc")
+def fixture_nested_doc():
+    return """
+        start_state: active
+        states:
+            - name: active
+              on_enter: enter_active
+              on_exit: exit_active
+              initial: editing
+              states:
+                  - name: editing
+                    on_exit: exit_editing
+                  - name: review
+                    initial: draft
+                    on_enter: enter_review
+                    states:
+                        - name: draft
+                          on_enter: enter_draft
+                        - final
+            - name: cancelled
+              on_enter: enter_cancelled
+        transitions:
+            - action: cancel
+              from_state: active
+              to_state: cancelled
+            - action: submit
+              from_state: editing
+              to_state: review
+            - action: approve
+              from_state: draft
+              to_state: final
+            - action: cancel
+              from_state: final
+              to_state: final
+            - action: restart
+              from_state: cancelled
+              to_state: active
+    """
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith(("enter_", "exit_")):
+            return lambda: self.calls.append(name)
+        raise AttributeError(name)
+
+
+def test_hierarchical_states(nested_doc):
+    definition = create_definition(doc=nested_doc)
+    assert definition.start_state == "editing"
+    assert definition.state_names == (
+        "editing",
+        "draft",
+        "final",
+        "cancelled",
+    )
+    assert [s.name for s in definition.composite_states] == [
+        "active",
+        "review",
+    ]
+    # inherited transitions are compiled into the flat table
+    assert definition.get_actions("draft") == ["cancel", "approve"]
+    assert definition.states_accepting("cancel") == {
+        "editing",
+        "draft",
+        "final",
+    }
+
+    model = Recorder()
+    machine = definition.bind(model)
+    assert machine.is_in("active") and not machine.is_in("review")
+    machine.perform("submit")
+    assert machine.state == "draft"
+    assert machine.is_in("review")
+    assert model.calls == ["exit_editing", "enter_review", "enter_draft"]
+
+    # transitions between enclosed states do not exit their composite
+    model.calls.clear()
+    machine.perform("approve")
+    assert model.calls == []
+
+    # the more specific transition wins over the inherited one
+    machine.perform("cancel")
+    assert machine.state == "final"
+
+    machine = definition.bind(model)
+    model.calls.clear()
+    machine.perform("cancel")
+    assert model.calls == ["exit_editing", "exit_active", "enter_cancelled"]
+    model.calls.clear()
+    machine.perform("restart")
+    assert machine.state == "editing"
+    assert model.calls == ["enter_active"]
+
+
+def test_hierarchical_observed_chain(nested_doc):
+    from fsm.observer import Observer
+
+    class Hooked(Observer):
+        def __init__(self):
+            self.owners = []
+
+        def callback_started(self, machine, hook, name, owner):
+            self.owners.append((hook, owner.name))
+
+    definition = create_definition(doc=nested_doc)
+    machine = definition.bind(Recorder())
+    observer = Hooked()
+    machine.add_observer(observer)
+    machine.perform("cancel")
+    assert observer.owners == [
+        ("on_exit", "editing"),
+        ("on_exit", "active"),
+        ("on_enter", "cancelled"),
+    ]
+
+
+def test_invalid_hierarchical_states():
+    for states in (
+        [{"name": "s1", "initial": "s2", "states": ["s3"]}],
+        [{"name": "s1", "initial": "s2"}],
+        [{"name": "s1", "states": ["s1"]}],
+        [
+            {
+                "name": "s1",
+                "timeout": 1,
+                "on_timeout": "a1",
+                "states": ["s2"],
+            }
+        ],
+    ):
+        with pytest.raises(ValueError):
+            FsmDefinition(states=states, start_state="s1")
+
+
+@pytest.fixture(name="wildcard_definition")
+def fixture_wildcard_definition():
+    return FsmDefinition(
+        states=["s1", "s2", "s3", "halted"],
+        transitions=[
+            {"action": "next", "from_state": "s1", "to_state": "s2"},
+            {"action": "halt", "from_state": "s3", "to_state": "s3"},
+            {"action": "halt", "from_state": "*", "to_state": "halted"},
+            {"action": "next", "from_state": ["s2", "s3"], "to_state": "s1"},
+            {"action": "halt", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+def test_wildcard_transitions(wildcard_definition):
+    definition = wildcard_definition
+    # explicit transitions take precedence, declared before or after
+    machine = definition.bind()
+    for state, expected in (
+        ("s1", "halted"),
+        ("s2", "s1"),
+        ("s3", "s3"),
+        ("halted", "halted"),
+    ):
+        machine._set_state(state)
+        machine.perform("halt")
+        assert machine.state == expected
+    assert definition.states_accepting("next") == {"s1", "s2", "s3"}
+
+    # a single Transition object is shared by the states
+    table = definition.table
+    halt = table.action_id("halt")
+    wildcard = {
+        table.lookup(definition.state_id(s), halt)[1] for s in ("s1", "halted")
+    }
+    assert len(wildcard) == 1
+    shared = table._transitions[wildcard.pop()]
+    assert shared.from_state == "*"
+    assert definition.transitions.count(shared) == 1
+    assert definition.incoming_transitions("halted") == (shared,)
+    machine._set_state("s3")
+    assert machine.perform("next").from_state == ("s2", "s3")
+
+
+def test_wildcard_only_defined_states(wildcard_definition):
+    # states only named by transitions are not included
+    assert wildcard_definition.get_actions("s9") == []
+    with pytest.raises(ValueError):
+        FsmDefinition(states=["*"], start_state="*")
+
+
+def test_wildcard_applies_to_added_states():
+    fsm = Fsm(
+        states=["s1", "halted"],
+        transitions=[
+            {"action": "halt", "from_state": "*", "to_state": "halted"}
+        ],
+        start_state="s1",
+        feedback=False,
+    )
+    fsm.add_state("s2")
+    fsm.add_transition(
+        {"action": "next", "from_state": "s1", "to_state": "s2"}
+    )
+    fsm.next()
+    fsm.halt()
+    assert fsm.state == "halted"
+    # the rebuilt copy has the same table
+    copy = fsm.definition
+    for state in ("s1", "s2", "halted"):
+        assert copy.get_actions(state) == fsm.get_actions(state=state)
+
+
+def test_wildcard_in_hierarchy():
+    definition = create_definition(
+        data={
+            "start_state": "editing",
+            "states": [
+                {"name": "active", "states": ["editing", "review"]},
+                "closed",
+            ],
+            "transitions": [
+                {"action": "close", "from_state": "*", "to_state": "closed"},
+                {
+                    "action": "close",
+                    "from_state": "active",
+                    "to_state": "review",
+                },
+                {
+                    "action": "reopen",
+                    "from_state": ["closed", "review"],
+                    "to_state": "active",
+                },
+            ],
+        }
+    )
+    machine = definition.bind()
+    machine.perform("close")
+    assert machine.state == "review"
+    machine.perform("reopen")
+    assert machine.state == "editing"
+    assert definition.get_actions("closed") == ["close", "reopen"]
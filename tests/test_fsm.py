@@ -1,4 +1,6 @@
 """Test fsm"""
+import subprocess
+import sys
 from unittest import mock
 
 import pytest
@@ -168,6 +170,67 @@ def test_add_transition(model):
     assert fsm.get_actions(state="s2") == ["a2"]
 
 
+def test_add_after_create_resolves_new_callbacks(model):
+    fsm = Fsm(model=model, states=["s1"], start_state="s1", feedback=False)
+    hooks = fsm._hooks
+    fsm.add_state({"name": "s2", "on_enter": "on_callback"})
+    fsm.add_transition({"action": "a1", "from_state": "s1", "to_state": "s2"})
+    # the hooks are extended, not resolved again
+    assert fsm._hooks is hooks
+    model.a1()
+    assert model.cb_count == 1
+
+
+def test_set_model_shares_class_hooks(fsm_data):
+    fsm = create_fsm(data=fsm_data, model=DummyModel(), feedback=False)
+    hooks = fsm._hooks
+    fsm.set_model(DummyModel())
+    assert fsm._hooks is hooks
+
+    # instance attributes named as callbacks are resolved per model
+    model = DummyModel()
+    calls = []
+    model.on_callback = lambda: calls.append("instance")
+    fsm.set_model(model)
+    assert fsm._hooks is not hooks
+    model.a1()
+    assert calls == ["instance"] and model.cb_count == 0
+
+
+def test_redefine_state_resolves_callbacks(model):
+    fsm = Fsm(
+        model=model,
+        states=["s1", "s2"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+        feedback=False,
+    )
+    fsm.add_state({"name": "s2", "on_enter": "on_callback"})
+    model.a1()
+    assert model.cb_count == 1
+
+
+def test_externally_set_state(model):
+    fsm = Fsm(
+        model=model,
+        states=["s1", "s2"],
+        transitions=[{"action": "a2", "from_state": "s2", "to_state": "s1"}],
+        start_state="s1",
+        feedback=False,
+    )
+    # restoring a persisted state, no callbacks are called
+    model.state = "s2"
+    assert model.is_s2() and fsm.state == "s2"
+    model.a2()
+    assert model.state == "s1"
+
+    fsm = Fsm(states=["s1", "s2"], start_state="s1", feedback=False)
+    fsm.state = "s2"
+    assert fsm.is_s2()
+    with pytest.raises(FsmError):
+        fsm.state = "s3"
+
+
 def test_no_actions_for_state(model):
     fsm = Fsm(
         model=model,
@@ -257,3 +320,46 @@ def test_transition_with_no_state_change(fsm_doc):
     assert fsm.state == "s1"
     fsm.a2()
     assert fsm.state == "s1"
+
+
+def test_resolve_callbacks(fsm_data, model):
+    fsm = create_fsm(model=model, data=fsm_data, feedback=False)
+    fsm.get_state().on_exit.add("on_callback")
+    fsm.resolve_callbacks()
+    model.a2()
+    assert model.cb_count == 0
+    model.a1()
+    assert model.cb_count == 2
+
+
+def test_import_is_lazy():
+    # a fresh interpreter, the test session has imported everything
+    code = """
+import sys
+import fsm
+from fsm import FsmDefinition, State, Transition
+
+heavy = ("voluptuous", "yaml", "inspect", "ast", "fsm.loader")
+assert not any(m in sys.modules for m in heavy), sorted(sys.modules)
+definition = FsmDefinition(
+    states=[State("s1"), State("s2")],
+    transitions=[Transition("a1", "s1", "s2")],
+    start_state="s1",
+)
+FsmDefinition.from_data(
+    {
+        "start_state": "s1",
+        "states": ["s1", {"name": "s2"}],
+        "transitions": [{"action": "a1", "from_state": "*", "to_state": "s2"}],
+    },
+    validate=False,
+)
+assert "voluptuous" not in sys.modules and "yaml" not in sys.modules
+assert fsm.FSM_SCHEMA is fsm.schema.FSM_SCHEMA
+"""
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+    import fsm
+
+    with pytest.raises(AttributeError):
+        fsm.NO_SUCH_SCHEMA
@@ -0,0 +1,234 @@
+"""Test fsm.guard"""
+import pytest
+
+import voluptuous as vol
+
+from fsm import FsmDefinition, FsmError, TRANSITION_SCHEMA
+from fsm.guard import compile_guard
+
+
+class Account:
+    def __init__(self, balance=0, amount=0, locked=False):
+        self.balance = balance
+        self.amount = amount
+        self.locked = locked
+        self.calls = []
+
+    def is_locked(self):
+        return self.locked
+
+    def on_refused(self):
+        self.calls.append("refused")
+
+
+def evaluate(source, model, model_class=Account):
+    return compile_guard(source).resolve(model_class, model)(model)
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("balance >= amount", True),
+        ("balance >= amount and not is_locked()", True),
+        ("balance - amount > 10", False),
+        ("0 <= amount < balance", True),
+        ("amount in (1, 2, 5)", True),
+        ("amount not in [1, 2]", True),
+        ("locked or balance == 0", False),
+        ("-balance < 0", True),
+        ("locked is False", True),
+    ],
+)
+def test_expressions(source, expected):
+    assert evaluate(source, Account(balance=10, amount=5)) is expected
+
+
+def test_name_guards():
+    account = Account(locked=True)
+    assert evaluate("is_locked", account) is True
+    assert evaluate("locked", account) is True
+    assert evaluate("balance", account) == 0
+
+
+def test_compiled_once():
+    assert compile_guard("balance > 0") is compile_guard("balance > 0")
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "balance >",
+        "__class__",
+        "balance.__class__",
+        "_private()",
+        "open('file')",
+        "[x for x in balance]",
+        "lambda: True",
+        "balance ** 2",
+    ],
+)
+def test_invalid_guards(source):
+    with pytest.raises(ValueError):
+        compile_guard(source)
+    with pytest.raises(vol.MultipleInvalid):
+        TRANSITION_SCHEMA(
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": source,
+            }
+        )
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["idle", "paid", "locked", "refused"],
+        transitions=[
+            {
+                "action": "pay",
+                "from_state": "idle",
+                "to_state": "locked",
+                "guard": "is_locked",
+            },
+            {
+                "action": "pay",
+                "from_state": "idle",
+                "to_state": "refused",
+                "on_after": "on_refused",
+            },
+            {
+                "action": "pay",
+                "from_state": "idle",
+                "to_state": "paid",
+                "guard": "balance >= amount",
+            },
+            {"action": "reset", "from_state": "refused", "to_state": "idle"},
+            {"action": "reset", "from_state": "locked", "to_state": "idle"},
+            {"action": "reset", "from_state": "paid", "to_state": "idle"},
+        ],
+        start_state="idle",
+    )
+
+
+def test_guard_order_and_fallback(definition):
+    account = Account(balance=10, amount=5, locked=True)
+    machine = definition.bind(account)
+    assert machine.perform("pay").to_state == "locked"
+
+    account.locked = False
+    machine.perform("reset")
+    assert machine.perform("pay").to_state == "paid"
+
+    account.balance = 0
+    machine.perform("reset")
+    assert machine.perform("pay").to_state == "refused"
+    assert account.calls == ["refused"]
+
+
+def test_guard_replaced():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "is_locked",
+            },
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s3",
+                "guard": "is_locked",
+            },
+        ],
+        start_state="s1",
+    )
+    assert len(definition.transitions) == 1
+    machine = definition.bind(Account(locked=True))
+    assert machine.perform("a1").to_state == "s3"
+
+
+def test_no_guard_passed():
+    definition = FsmDefinition(
+        states=["s1", "s2"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "balance > 0",
+            },
+        ],
+        start_state="s1",
+    )
+    machine = definition.bind(Account())
+    assert machine.available_actions == ("a1",)
+    with pytest.raises(FsmError):
+        machine.perform("a1")
+    assert machine.state == "s1"
+    machine.model.balance = 1
+    machine.perform("a1")
+    assert machine.state == "s2"
+
+
+def test_perform_many_with_guards(definition):
+    machine = definition.bind(Account(balance=10, amount=5))
+    machine.perform_many(["pay", "reset", "pay"])
+    assert machine.state == "paid"
+    with pytest.raises(FsmError):
+        machine.perform_many(["reset", "pay", "unknown"])
+    assert machine.state == "paid"
+
+
+def test_perform_many_validates_every_guarded_target():
+    definition = FsmDefinition(
+        states=["a", "b", "c"],
+        transitions=[
+            {
+                "action": "go",
+                "from_state": "a",
+                "to_state": "b",
+                "guard": "ok",
+            },
+            {"action": "go", "from_state": "a", "to_state": "c"},
+            {"action": "next", "from_state": "b", "to_state": "a"},
+        ],
+        start_state="a",
+    )
+
+    class Model:
+        ok = True
+
+    machine = definition.bind(Model())
+    # next is only valid if the guard passes
+    with pytest.raises(FsmError, match="in state 'c' at step 1"):
+        machine.perform_many(["go", "next"])
+    assert machine.state == "a"
+
+
+def test_perform_many_guard_without_fallback():
+    definition = FsmDefinition(
+        states=["a", "b", "c"],
+        transitions=[
+            {"action": "x", "from_state": "a", "to_state": "b"},
+            {"action": "y", "from_state": "b", "to_state": "c", "guard": "ok"},
+        ],
+        start_state="a",
+    )
+
+    class Model:
+        ok = False
+
+    machine = definition.bind(Model())
+    with pytest.raises(FsmError, match="use rollback"):
+        machine.perform_many(["x", "y"])
+    assert machine.state == "a"
+    with pytest.raises(FsmError, match="No guard passed"):
+        machine.perform_many(["x", "y"], rollback=True)
+    assert machine.state == "a"
+    machine.model.ok = True
+    machine.perform_many(["x", "y"], rollback=True)
+    assert machine.state == "c"
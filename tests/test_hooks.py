@@ -0,0 +1,87 @@
+"""Test fsm.hooks"""
+from fsm import FsmDefinition
+from fsm.hooks import Hooks
+from fsm.util import InstanceCallback
+
+
+class Model:
+    def on_enter_s2(self):
+        pass
+
+    def on_before_a1(self):
+        pass
+
+
+def test_hooks_resolved_per_id():
+    definition = FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "on_enter_s2"}],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "on_before": "on_before_a1",
+            }
+        ],
+        start_state="s1",
+    )
+    hooks = Hooks(definition.table, Model)
+    s2 = definition.state_id("s2")
+    assert hooks.on_enter[s2] == (Model.on_enter_s2,)
+    assert hooks.on_exit[s2] == ()
+    assert hooks.on_before[0] == (Model.on_before_a1,)
+    assert hooks.on_after[0] == ()
+
+
+def test_hooks_cached_per_class():
+    definition = FsmDefinition(states=["s1"], start_state="s1")
+    hooks = definition.resolve_hooks(Model)
+    assert definition.resolve_hooks(Model) is hooks
+    assert definition.resolve_hooks(Model, refresh=True) is not hooks
+
+
+def test_hooks_undeclared_state():
+    definition = FsmDefinition(
+        states=["s1"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+    hooks = Hooks(definition.table, Model)
+    assert hooks.on_enter[definition.table.state_id("s2")] == ()
+
+
+def test_hooks_instance_callbacks():
+    definition = FsmDefinition(
+        states=[{"name": "s1", "on_exit": "on_enter_s2"}], start_state="s1"
+    )
+    model = Model()
+    model.on_enter_s2 = lambda: None
+    hooks = Hooks(definition.table, Model, model)
+    (cb,) = hooks.on_exit[0]
+    assert isinstance(cb, InstanceCallback)
+
+
+def test_hooks_update():
+    definition = FsmDefinition(
+        states=["s1"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+    hooks = Hooks(definition.table, Model)
+    on_before = hooks.on_before[0]
+    definition._add_state({"name": "s2", "on_enter": "on_enter_s2"})
+    definition._add_transition(
+        {
+            "action": "a2",
+            "from_state": "s2",
+            "to_state": "s3",
+            "on_before": "on_before_a1",
+        }
+    )
+    hooks.update(definition.table)
+    s2 = definition.table.state_id("s2")
+    assert hooks.on_enter[s2] == (Model.on_enter_s2,)
+    assert hooks.on_enter[definition.table.state_id("s3")] == ()
+    assert hooks.on_before[0] is on_before
+    assert hooks.on_before[1] == (Model.on_before_a1,)
+    assert hooks.guards == [None, None]
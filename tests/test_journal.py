@@ -0,0 +1,184 @@
+"""Test fsm.journal"""
+import pytest
+
+from fsm import FsmDefinition, FsmError
+from fsm.journal import (
+    LoggedBoundFsm,
+    read_snapshot,
+    replay,
+    restore,
+    TransitionLog,
+    write_snapshot,
+)
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "on_enter"}],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+class Model:
+    def __init__(self):
+        self.enters = 0
+
+    def on_enter(self):
+        self.enters += 1
+
+
+def test_logged_machine_and_replay(definition, tmp_path):
+    filename = tmp_path / "fsm.log"
+    with TransitionLog(filename, definition) as log:
+        machines = {
+            i: LoggedBoundFsm(definition, Model(), log=log, entity_id=i)
+            for i in range(3)
+        }
+        machines[0].perform("a1")
+        machines[1].perform("a1")
+        machines[1].perform("a2")
+        machines[2].perform("a1")
+        with pytest.raises(FsmError):
+            machines[2].perform("a1")
+        assert len(log) == 4
+
+    s1, s2 = definition.state_id("s1"), definition.state_id("s2")
+    states = replay(definition, filename)
+    assert states == {0: s2, 1: s1, 2: s2}
+
+    fresh = {i: definition.bind(Model()) for i in range(3)}
+    restore(fresh, states)
+    assert [fresh[i].state for i in range(3)] == ["s2", "s1", "s2"]
+    assert fresh[0].model.enters == 0
+
+
+def test_reopen_appends(definition, tmp_path):
+    filename = tmp_path / "fsm.log"
+    with TransitionLog(filename, definition) as log:
+        log.append(7, definition.action_id("a1"))
+    with TransitionLog(filename, definition) as log:
+        assert len(log) == 1
+        log.append(7, definition.action_id("a2"))
+    assert replay(definition, filename) == {7: definition.state_id("s1")}
+
+
+def test_logged_perform_many(definition, tmp_path):
+    filename = tmp_path / "fsm.log"
+    with TransitionLog(filename, definition) as log:
+        machine = LoggedBoundFsm(definition, Model(), log=log, entity_id=3)
+        machine.perform_many(["a1", "a2", "a1"])
+        with pytest.raises(FsmError):
+            machine.perform_many(["a2"], rollback=True)
+        assert len(log) == 3
+    assert replay(definition, filename) == {3: definition.state_id("s2")}
+
+
+def test_log_definition_mismatch(definition, tmp_path):
+    filename = tmp_path / "fsm.log"
+    TransitionLog(filename, definition).close()
+    other = FsmDefinition(states=["x"], start_state="x")
+    with pytest.raises(FsmError):
+        TransitionLog(filename, other)
+    with pytest.raises(FsmError):
+        replay(other, filename)
+
+
+def test_snapshot_roundtrip(definition, tmp_path):
+    filename = tmp_path / "fsm.snap"
+    write_snapshot(filename, definition, {1: 0, 2: 1}, position=5)
+    assert read_snapshot(filename, definition) == ({1: 0, 2: 1}, 5)
+
+
+def test_replay_from_snapshot(definition, tmp_path):
+    log_filename = tmp_path / "fsm.log"
+    snap_filename = tmp_path / "fsm.snap"
+    a1, a2 = definition.action_id("a1"), definition.action_id("a2")
+    s1, s2 = definition.state_id("s1"), definition.state_id("s2")
+    states = {}
+
+    def source():
+        return dict(states)
+
+    with TransitionLog(
+        log_filename,
+        definition,
+        snapshot_filename=snap_filename,
+        snapshot_interval=2,
+        snapshot_source=source,
+    ) as log:
+        states[1] = s2
+        log.append(1, a1)
+        states[2] = s2
+        log.append(2, a1)
+        log.append(2, a2)
+
+    assert read_snapshot(snap_filename, definition) == ({1: s2, 2: s2}, 2)
+    assert replay(definition, log_filename, snap_filename) == {1: s2, 2: s1}
+
+
+def test_periodic_snapshot_requires_source(definition, tmp_path):
+    with pytest.raises(ValueError):
+        TransitionLog(tmp_path / "fsm.log", definition, snapshot_interval=2)
+
+
+def test_replay_invalid_transition(definition, tmp_path):
+    filename = tmp_path / "fsm.log"
+    with TransitionLog(filename, definition) as log:
+        log.append(1, definition.action_id("a2"))
+    with pytest.raises(FsmError):
+        replay(definition, filename)
+
+
+def test_replay_guarded_transitions(tmp_path):
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "ok",
+            },
+            {"action": "a1", "from_state": "s1", "to_state": "s3"},
+            {"action": "a2", "from_state": ["s2", "s3"], "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+    class Guarded:
+        def __init__(self, ok):
+            self.ok = ok
+
+    filename = tmp_path / "fsm.log"
+    with TransitionLog(filename, definition) as log:
+        machines = {
+            i: LoggedBoundFsm(definition, Guarded(ok), log=log, entity_id=i)
+            for i, ok in enumerate((True, False))
+        }
+        for machine in machines.values():
+            machine.perform_many(["a1", "a2", "a1"])
+
+    states = replay(definition, filename)
+    assert states == {
+        0: definition.state_id("s2"),
+        1: definition.state_id("s3"),
+    }
+
+
+def test_log_state_change_when_callback_raises(definition, tmp_path):
+    class Failing(Model):
+        def on_enter(self):
+            raise RuntimeError("on_enter failed")
+
+    filename = tmp_path / "fsm.log"
+    with TransitionLog(filename, definition) as log:
+        machine = LoggedBoundFsm(definition, Failing(), log=log, entity_id=1)
+        with pytest.raises(RuntimeError):
+            machine.perform("a1")
+        assert machine.state == "s2"
+    assert replay(definition, filename) == {1: definition.state_id("s2")}
@@ -0,0 +1,100 @@
+"""Test fsm.loader"""
+import os
+from unittest import mock
+
+import pytest
+
+from fsm import State, Transition
+from fsm import loader
+from fsm.loader import (
+    as_objects,
+    clear_cache,
+    DISK_CACHE_SUFFIX,
+    load_data,
+    parse_doc,
+)
+
+DOC = """
+    start_state: s1
+    states: [s1, {name: s2, on_enter: cb}]
+    transitions:
+        - action: a1
+          from_state: s1
+          to_state: s2
+"""
+
+
+@pytest.fixture(autouse=True)
+def fixture_clear_cache():
+    clear_cache()
+    yield
+    clear_cache()
+
+
+@pytest.fixture(name="schema")
+def fixture_schema():
+    with mock.patch.object(
+        loader, "FSM_SCHEMA", wraps=loader.FSM_SCHEMA
+    ) as schema:
+        yield schema
+
+
+def test_parse_doc_yaml_and_json():
+    assert parse_doc("a: 1") == {"a": 1}
+    assert parse_doc('{"a": 1}') == {"a": 1}
+    # flow style yaml is not json
+    assert parse_doc("{a: 1}") == {"a": 1}
+
+
+def test_load_data_empty():
+    with pytest.raises(ValueError):
+        load_data()
+    with pytest.raises(ValueError):
+        load_data(doc="")
+
+
+def test_load_doc_cached(schema):
+    data = load_data(doc=DOC)
+    assert data["start_state"] == "s1"
+    data["extra"] = True
+    assert "extra" not in load_data(doc=DOC)
+    assert schema.call_count == 1
+    load_data(doc=DOC, cache=False)
+    assert schema.call_count == 2
+
+
+def test_cache_eviction(schema, monkeypatch):
+    monkeypatch.setattr(loader, "CACHE_SIZE", 1)
+    load_data(doc=DOC)
+    load_data(doc=DOC + "\n")
+    load_data(doc=DOC)
+    assert schema.call_count == 3
+
+
+def test_disk_cache(schema, tmp_path):
+    filename = tmp_path / "fsm.yaml"
+    filename.write_text(DOC)
+    load_data(filename=str(filename), disk_cache=True)
+    assert os.path.exists(f"{filename}{DISK_CACHE_SUFFIX}")
+
+    clear_cache()
+    data = load_data(filename=str(filename), disk_cache=True)
+    assert data["start_state"] == "s1"
+    assert schema.call_count == 1
+
+    # a modified source file is loaded again
+    filename.write_text(DOC.replace("s1", "s3"))
+    os.utime(filename, ns=(0, 0))
+    data = load_data(filename=str(filename), disk_cache=True)
+    assert data["start_state"] == "s3"
+    assert schema.call_count == 2
+
+
+def test_as_objects():
+    data = as_objects(load_data(doc=DOC))
+    s1, s2 = data["states"]
+    assert isinstance(s1, State) and s1.name == "s1"
+    assert s2.on_enter.callbacks == ["cb"]
+    (t1,) = data["transitions"]
+    assert isinstance(t1, Transition) and t1.to_state == "s2"
+    assert as_objects(load_data(doc=DOC))["states"][0] is not s1
@@ -0,0 +1,140 @@
+"""Test fsm.model"""
+import pytest
+
+from fsm import Fsm, FsmDefinition, FsmError
+from fsm.model import MACHINE_ATTR, install_model_class
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "on_callback"}],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+class SlotsModel:
+    __slots__ = (MACHINE_ATTR, "cb_count")
+
+    def __init__(self):
+        self.cb_count = 0
+
+    def on_callback(self):
+        self.cb_count += 1
+
+
+def test_install_model_class():
+    class Model:
+        pass
+
+    install_model_class(Model, states=["s1"], actions=["a1"])
+    assert callable(Model.is_s1)
+    assert callable(Model.a1)
+    assert isinstance(Model.state, property)
+
+
+def test_install_model_class_is_repeatable():
+    class Model:
+        pass
+
+    install_model_class(Model, states=["s1"], actions=["a1"])
+    install_model_class(Model, states=["s1", "s2"], actions=["a1"])
+    assert callable(Model.is_s2)
+
+
+def test_install_model_class_conflict():
+    class Model:
+        def a1(self):
+            pass
+
+    with pytest.raises(FsmError):
+        install_model_class(Model, actions=["a1"])
+
+
+def test_bind_descriptors_slots_model(definition):
+    model = SlotsModel()
+    machine = definition.bind(model, descriptors=True)
+    assert getattr(model, MACHINE_ATTR) is machine
+    assert model.state == "s1"
+    assert model.is_s1() and not model.is_s2()
+    model.a1()
+    assert model.state == "s2" and machine.state == "s2"
+    assert model.is_s2()
+    assert model.cb_count == 1
+
+
+def test_bind_descriptors_installs_once(definition):
+    m1, m2 = SlotsModel(), SlotsModel()
+    definition.bind(m1, descriptors=True)
+    a1 = SlotsModel.a1
+    definition.bind(m2, descriptors=True)
+    assert SlotsModel.a1 is a1
+    m2.a1()
+    assert m1.state == "s1" and m2.state == "s2"
+
+
+def test_bind_descriptors_requires_model(definition):
+    with pytest.raises(FsmError):
+        definition.bind(descriptors=True)
+
+
+def test_fsm_descriptors():
+    class Model:
+        __slots__ = (MACHINE_ATTR,)
+
+    model = Model()
+    fsm = Fsm(
+        model=model,
+        states=["s1", "s2"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+        feedback=False,
+        descriptors=True,
+    )
+    fsm.add_state("s3")
+    fsm.add_transition({"action": "a2", "from_state": "s2", "to_state": "s3"})
+    model.a1()
+    model.a2()
+    assert model.is_s3() and model.state == "s3"
+
+
+def test_bind_without_descriptors_after_descriptors(definition):
+    class Model:
+        def on_callback(self):
+            pass
+
+    model = Model()
+    definition.bind(model, descriptors=True)
+    machine = definition.bind(model)
+    assert model.state == "s1"
+    machine.perform("a1")
+    assert model.state == "s2"
+    # binding with descriptors again drops the copied state
+    definition.bind(model, descriptors=True)
+    assert model.state == "s1"
+
+
+def test_bind_slots_model_without_descriptors(definition):
+    definition.bind(SlotsModel(), descriptors=True)
+    with pytest.raises(FsmError):
+        definition.bind(SlotsModel())
+
+
+def test_installed_methods_without_descriptors(definition):
+    class Model:
+        def on_callback(self):
+            pass
+
+    definition.bind(Model(), descriptors=True)
+    model = Model()
+    definition.bind(model, descriptors=True)
+    machine = definition.bind(model)
+    assert model.is_s1()
+    machine.perform("a1")
+    assert model.is_s2() and not model.is_s1()
+    with pytest.raises(FsmError):
+        model.a1()
@@ -0,0 +1,160 @@
+"""Test fsm.observer"""
+import pytest
+
+from fsm import Fsm, FsmDefinition, FsmError
+from fsm.observer import (
+    Histogram,
+    MetricsObserver,
+    Observer,
+    ObserverGroup,
+    PrintObserver,
+)
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "on_enter"}],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "on_before": "on_before",
+            },
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+class Model:
+    def on_before(self):
+        pass
+
+    def on_enter(self):
+        pass
+
+
+class RecordingObserver(Observer):
+    def __init__(self):
+        self.events = []
+
+    def transition_started(self, machine, transition, from_state):
+        self.events.append(("started", transition.action))
+
+    def transition_finished(self, machine, transition, from_state, elapsed):
+        self.events.append(("finished", transition.action))
+
+    def callback_started(self, machine, hook, name, owner):
+        self.events.append((hook, name))
+
+    def invalid_action(self, machine, action, error):
+        self.events.append(("invalid", action))
+
+
+def test_observer_hooks(definition):
+    machine = definition.bind(Model())
+    observer = RecordingObserver()
+    machine.add_observer(observer)
+    machine.perform("a1")
+    with pytest.raises(FsmError):
+        machine.perform("a1")
+    with pytest.raises(FsmError):
+        machine.perform("unknown")
+    assert observer.events == [
+        ("started", "a1"),
+        ("on_before", "on_before"),
+        ("on_enter", "on_enter"),
+        ("finished", "a1"),
+        ("invalid", "a1"),
+        ("invalid", "unknown"),
+    ]
+
+
+def test_add_remove_observers(definition):
+    machine = definition.bind()
+    o1, o2 = RecordingObserver(), RecordingObserver()
+    machine.add_observer(o1)
+    machine.add_observer(o2)
+    assert isinstance(machine.observer, ObserverGroup)
+    machine.perform("a1")
+    assert o1.events == o2.events
+    machine.remove_observer(o1)
+    assert machine.observer is o2
+    machine.remove_observer(o2)
+    assert machine.observer is None
+    with pytest.raises(ValueError):
+        machine.remove_observer(o2)
+
+
+def test_metrics_observer(definition):
+    machine = definition.bind(Model())
+    metrics = MetricsObserver()
+    machine.add_observer(metrics)
+    machine.perform("a1")
+    machine.perform("a2")
+    machine.perform("a1")
+    with pytest.raises(FsmError):
+        machine.perform("a1")
+    exported = metrics.export()
+    assert exported["transitions"] == {"s1:a1->s2": 2, "s2:a2->s1": 1}
+    assert exported["invalid_actions"] == {"a1": 1}
+    assert exported["action_latency"]["a1"]["count"] == 2
+    assert exported["callback_latency"]["on_enter"]["count"] == 2
+
+
+def test_metrics_report_source_states(capsys):
+    fsm = Fsm(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {"action": "a1", "from_state": ["s1", "s2"], "to_state": "s2"},
+            {"action": "reset", "from_state": "*", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+    metrics = MetricsObserver()
+    fsm.add_observer(metrics)
+    fsm.a1()
+    fsm.a1()
+    fsm.reset()
+    assert metrics.export()["transitions"] == {
+        "s1:a1->s2": 1,
+        "s2:a1->s2": 1,
+        "s2:reset->s1": 1,
+    }
+    assert "from 's2' to 's1'" in capsys.readouterr().out
+
+
+def test_histogram():
+    histogram = Histogram()
+    for value in (1e-6, 2e-6, 3e-6, 1e-3):
+        histogram.add(value)
+    assert histogram.count == 4
+    assert histogram.min == 1e-6 and histogram.max == 1e-3
+    assert histogram.percentile(50) == 2e-6
+    assert histogram.percentile(100) == 1e-3
+    assert Histogram().percentile(50) == 0.0
+
+
+def test_fsm_feedback(capsys):
+    fsm = Fsm(
+        states=["s1", "s2"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+    assert isinstance(fsm.observer, PrintObserver)
+    fsm.a1()
+    assert "state transitioned from 's1' to 's2'" in capsys.readouterr().out
+
+
+def test_fsm_no_feedback(capsys):
+    fsm = Fsm(
+        states=["s1", "s2"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+        feedback=False,
+    )
+    assert fsm.observer is None
+    fsm.a1()
+    assert capsys.readouterr().out == ""
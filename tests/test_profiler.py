@@ -0,0 +1,98 @@
+"""Test fsm.profiler"""
+import pytest
+
+from fsm import Fsm
+from fsm.observer import MetricsObserver
+from fsm.profiler import Profiler
+
+
+class Model:
+    def slow(self):
+        sum(range(10000))
+
+    def fast(self):
+        pass
+
+
+@pytest.fixture(name="fsm")
+def fixture_fsm():
+    return Fsm(
+        model=Model(),
+        states=[
+            {"name": "s1", "on_exit": "fast"},
+            {"name": "s2", "on_enter": "slow"},
+        ],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "on_after": "fast",
+            },
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+        feedback=False,
+    )
+
+
+def test_profiler_report(fsm):
+    profiler = fsm.enable_profiling()
+    fsm.perform("a1")
+    fsm.perform("a2")
+    fsm.perform("a1")
+    report = profiler.report()
+    callbacks = {r["name"]: r for r in report["callbacks"]}
+    assert callbacks["slow"]["count"] == 2
+    assert callbacks["fast"]["count"] == 4
+    assert report["callbacks"][0]["name"] == "slow"
+    states = {r["name"]: r for r in report["states"]}
+    assert states["s2"]["count"] == 2 and states["s1"]["count"] == 2
+    transitions = {r["name"]: r for r in report["transitions"]}
+    assert transitions["s1:a1->s2"]["count"] == 2
+    assert transitions["s2:a2->s1"]["count"] == 1
+    assert transitions["s1:a1->s2"]["cpu_total"] >= 0
+    assert "slow" in profiler.format_report()
+    assert len(profiler.report(top=1)["callbacks"]) == 1
+
+
+def test_toggle_profiling(fsm):
+    metrics = MetricsObserver()
+    fsm.add_observer(metrics)
+    profiler = fsm.enable_profiling(Profiler())
+    fsm.perform("a1")
+    fsm.disable_profiling()
+    assert fsm.observer is metrics
+    fsm.perform("a2")
+    assert len(profiler.transitions) == 1
+    profiler.reset()
+    assert profiler.report()["transitions"] == []
+
+
+def test_profiler_attached_mid_transition(fsm):
+    profiler = Profiler()
+    transition = fsm.definition.transitions[0]
+    profiler.transition_finished(fsm, transition, fsm.state, 0.1)
+    assert profiler.report()["transitions"][0]["cpu_total"] == 0.0
+
+
+def test_profiler_failing_callback():
+    class Failing(Model):
+        def slow(self):
+            raise RuntimeError("on_enter failed")
+
+    fsm = Fsm(
+        model=Failing(),
+        states=["s1", {"name": "s2", "on_enter": "slow"}],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+        feedback=False,
+    )
+    profiler = fsm.enable_profiling()
+    with pytest.raises(RuntimeError):
+        fsm.perform("a1")
+    # the failing callback and transition are recorded
+    assert profiler._cpu_starts == []
+    report = profiler.report()
+    assert [c["name"] for c in report["callbacks"]] == ["slow"]
+    assert [t["name"] for t in report["transitions"]] == ["s1:a1->s2"]
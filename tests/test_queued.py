@@ -0,0 +1,189 @@
+"""Test fsm.queued"""
+import pytest
+
+from fsm import create_fsm, FsmDefinition, FsmError
+from fsm.queued import (
+    RunToCompletionBoundFsm,
+    RunToCompletionDescriptorBoundFsm,
+    RunToCompletionFsm,
+)
+from fsm.threadsafe import (
+    ThreadSafeRunToCompletionBoundFsm,
+    ThreadSafeRunToCompletionDescriptorBoundFsm,
+)
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "on_enter_s2"}, "s3"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "on_after": "after_a1",
+            },
+            {
+                "action": "a2",
+                "from_state": "s2",
+                "to_state": "s3",
+                "on_before": "before_a2",
+            },
+            {"action": "a3", "from_state": "s3", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+class Model:
+    def __init__(self):
+        self.machine = None
+        self.calls = []
+
+    def on_enter_s2(self):
+        self.calls.append("enter_s2")
+        self.calls.append(self.machine.perform("a2"))
+
+    def after_a1(self):
+        self.calls.append("after_a1")
+
+    def before_a2(self):
+        self.calls.append("before_a2")
+
+
+def test_nested_actions_recurse_by_default(definition):
+    model = Model()
+    model.machine = definition.bind(model)
+    model.machine.perform("a1")
+    assert model.calls[0] == "enter_s2"
+    assert model.calls[1] == "before_a2"
+    assert model.calls[3] == "after_a1"
+
+
+def test_nested_actions_run_to_completion(definition):
+    model = Model()
+    model.machine = machine = definition.bind(model, run_to_completion=True)
+    assert isinstance(machine, RunToCompletionBoundFsm)
+    transition = machine.perform("a1")
+    assert transition.action == "a1"
+    assert model.calls == ["enter_s2", None, "after_a1", "before_a2"]
+    assert machine.state == "s3"
+    assert machine.queued_actions == ()
+
+
+def test_long_chain_has_constant_stack_depth():
+    n = 5000
+    definition = FsmDefinition(
+        states=[{"name": f"s{i}", "on_enter": "step"} for i in range(n)],
+        transitions=[
+            {"action": "next", "from_state": f"s{i}", "to_state": f"s{i + 1}"}
+            for i in range(n - 1)
+        ],
+        start_state="s0",
+    )
+
+    class Chain:
+        def step(self):
+            if self.state != f"s{n - 1}":
+                machine.perform("next")
+
+    machine = definition.bind(Chain(), run_to_completion=True)
+    machine.perform("next")
+    assert machine.state == f"s{n - 1}"
+
+
+def test_coalesce(definition):
+    class Burst:
+        def on_enter_s2(self):
+            for _ in range(3):
+                machine.perform("a2")
+            calls.append(machine.queued_actions)
+
+        def before_a2(self):
+            calls.append("before_a2")
+
+    calls = []
+    machine = RunToCompletionBoundFsm(definition, Burst(), coalesce=True)
+    machine.perform("a1")
+    assert calls == [("a2",), "before_a2"]
+
+    # without coalescing the repeated action is invalid once dequeued
+    calls = []
+    machine = RunToCompletionBoundFsm(definition, Burst())
+    with pytest.raises(FsmError):
+        machine.perform("a1")
+    assert calls == [("a2", "a2", "a2"), "before_a2"]
+    assert machine.state == "s3"
+    assert machine.queued_actions == ()
+
+
+def test_descriptor_and_thread_safe_machines(definition):
+    class SlotModel:
+        __slots__ = ("_fsm",)
+
+    assert isinstance(
+        definition.bind(SlotModel(), descriptors=True, run_to_completion=True),
+        RunToCompletionDescriptorBoundFsm,
+    )
+    assert isinstance(
+        definition.bind(
+            SlotModel(),
+            descriptors=True,
+            thread_safe=True,
+            run_to_completion=True,
+        ),
+        ThreadSafeRunToCompletionDescriptorBoundFsm,
+    )
+
+    model = Model()
+    model.machine = machine = definition.bind(
+        model, thread_safe=True, run_to_completion=True
+    )
+    assert isinstance(machine, ThreadSafeRunToCompletionBoundFsm)
+    machine.perform("a1")
+    assert model.calls == ["enter_s2", None, "after_a1", "before_a2"]
+
+
+def test_run_to_completion_fsm():
+    class FsmModel:
+        def __init__(self):
+            self.calls = []
+
+        def on_enter_s2(self):
+            self.calls.append("enter_s2")
+            self.a2()
+
+        def before_a2(self):
+            self.calls.append("before_a2")
+
+        def after_a1(self):
+            self.calls.append("after_a1")
+
+    model = FsmModel()
+    create_fsm(
+        data={
+            "start_state": "s1",
+            "states": ["s1", {"name": "s2", "on_enter": "on_enter_s2"}, "s3"],
+            "transitions": [
+                {
+                    "action": "a1",
+                    "from_state": "s1",
+                    "to_state": "s2",
+                    "on_after": "after_a1",
+                },
+                {
+                    "action": "a2",
+                    "from_state": "s2",
+                    "to_state": "s3",
+                    "on_before": "before_a2",
+                },
+            ],
+        },
+        model=model,
+        feedback=False,
+        fsm_class=RunToCompletionFsm,
+    )
+    model.a1()
+    assert model.calls == ["enter_s2", "after_a1", "before_a2"]
+    assert model.state == "s3"
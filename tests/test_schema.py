@@ -24,6 +24,8 @@ def test_transition_schema_validation_invalid():
         "invalid type",
         {"missing": "states"},
         {"action": "action", "missing": "end state"},
+        {"action": "a1", "from_state": [], "to_state": "s2"},
+        {"action": "a1", "from_state": ["s1", 2], "to_state": "s2"},
     ]
 
     for data in invalids:
@@ -33,6 +35,10 @@ def test_transition_schema_validation_invalid():
 
 def test_transition_schema_validation_valid():
     TRANSITION_SCHEMA({"action": "a1", "from_state": "s1", "to_state": "s2"})
+    TRANSITION_SCHEMA({"action": "a1", "from_state": "*", "to_state": "s2"})
+    TRANSITION_SCHEMA(
+        {"action": "a1", "from_state": ["s1", "s3"], "to_state": "s2"}
+    )
     TRANSITION_SCHEMA(
         {
             "action": "a1",
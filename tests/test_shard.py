@@ -0,0 +1,52 @@
+"""Test fsm.shard"""
+import pytest
+
+from fsm import FsmDefinition, FsmError
+from fsm.shard import shard_of, ShardedRunner
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", "s2"],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+def test_shard_of():
+    assert shard_of(7, 4) == 3
+    assert shard_of("e1", 4) == shard_of("e1", 4)
+    assert 0 <= shard_of("e1", 4) < 4
+
+
+def test_sharded_runner(definition):
+    events = [(i, "a1") for i in range(100)]
+    events += [(i, "a2") for i in range(0, 100, 2)]
+    events += [("x", "a2"), ("y", "unknown")]
+    with ShardedRunner(definition, processes=2, batch_size=16) as runner:
+        runner.submit(events)
+        result = runner.gather()
+    assert result.events == len(events)
+    assert result.errors == 2
+    assert result.states[0] == "s1"
+    assert result.states[1] == "s2"
+    assert "x" not in result.states
+
+
+def test_sharded_runner_initial_states(definition):
+    with ShardedRunner(definition, processes=2) as runner:
+        runner.set_states({"e1": "s2", "e2": "s1"})
+        runner.submit([("e1", "a2"), ("e2", "a1")])
+        result = runner.gather()
+    assert result.states == {"e1": "s1", "e2": "s2"}
+    assert result.errors == 0
+
+
+def test_sharded_runner_invalid_initial_state(definition):
+    with ShardedRunner(definition, processes=1) as runner:
+        with pytest.raises(FsmError):
+            runner.set_states({"e1": "invalid"})
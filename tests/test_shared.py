@@ -0,0 +1,203 @@
+"""Test fsm.shared"""
+import multiprocessing
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+from fsm import FsmDefinition, FsmError
+from fsm.journal import fingerprint
+from fsm.shard import ShardedRunner
+from fsm.shared import dump_table, export_table, SharedDefinition
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=[
+            "s1",
+            {"name": "s2", "on_enter": "on_enter", "on_exit": "on_exit"},
+            "s3",
+        ],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {
+                "action": "a2",
+                "from_state": "s2",
+                "to_state": "s1",
+                "on_after": "on_after",
+            },
+            {"action": "a3", "from_state": "s2", "to_state": "s3"},
+        ],
+        start_state="s1",
+    )
+
+
+class Model:
+    def __init__(self):
+        self.calls = []
+
+    def on_enter(self):
+        self.calls.append("on_enter")
+
+    def on_exit(self):
+        self.calls.append("on_exit")
+
+    def on_after(self):
+        self.calls.append("on_after")
+
+
+def test_shared_definition(definition):
+    shared = SharedDefinition(dump_table(definition))
+    assert shared.start_state == "s1"
+    assert shared.state_names == definition.state_names
+    assert shared.action_names == definition.action_names
+    assert shared.state_id("s2") == definition.state_id("s2")
+    assert fingerprint(shared) == shared.table.fingerprint
+    assert [s.name for s in shared.states] == ["s1", "s2", "s3"]
+    assert shared.get_actions("s2") == ["a2", "a3"]
+    assert shared.get_actions("s3") == []
+    assert shared.actions == ["a1", "a2", "a3"]
+    assert shared.actions_of("s2") == ("a2", "a3")
+    assert shared.states_accepting("a1") == {"s1"}
+    assert len(shared.incoming_transitions("s1")) == 1
+    assert len(shared.transitions) == 3
+
+    machine = shared.bind(Model())
+    machine.perform("a1")
+    machine.perform("a2")
+    assert machine.state == "s1"
+    assert machine.model.calls == ["on_enter", "on_exit", "on_after"]
+    with pytest.raises(FsmError, match="Cannot perform action 'a2'"):
+        machine.perform("a2")
+    machine.perform("a1")
+    machine.perform("a3")
+    with pytest.raises(FsmError, match="No actions found"):
+        machine.perform("a1")
+
+
+def test_shared_table_read_only(definition):
+    shared = SharedDefinition(dump_table(definition))
+    with pytest.raises(FsmError):
+        shared.table.intern_state("s4")
+    with pytest.raises(FsmError):
+        shared.table.add_transition(definition.transitions[0])
+    with pytest.raises(FsmError):
+        SharedDefinition(b"garbage")
+    with pytest.raises(FsmError):
+        SharedDefinition(dump_table(definition)[:-8])
+
+
+def test_attach_file(definition, tmp_path):
+    filename = tmp_path / "fsm.table"
+    export_table(definition, filename)
+    with SharedDefinition.attach(filename) as shared:
+        machine = shared.bind(Model())
+        machine.perform("a1")
+        assert machine.state == "s2"
+
+        copy = pickle.loads(pickle.dumps(shared))
+        assert copy.filename == shared.filename
+        assert copy.state_names == definition.state_names
+        copy.close()
+
+    with pytest.raises(FsmError):
+        pickle.dumps(SharedDefinition(dump_table(definition)))
+
+
+def test_sharded_runner_attaches(definition, tmp_path):
+    filename = tmp_path / "fsm.table"
+    export_table(definition, filename)
+    shared = SharedDefinition.attach(filename)
+    context = multiprocessing.get_context("spawn")
+    with ShardedRunner(shared, processes=2, context=context) as runner:
+        runner.submit([(1, "a1"), (2, "a1"), (2, "a3"), (3, "a2")])
+        result = runner.gather()
+    assert result.states == {1: "s2", 2: "s3"}
+    assert result.errors == 1
+    shared.close()
+
+
+def test_shared_guards():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "ready",
+            },
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "done",
+            },
+            {"action": "a1", "from_state": "s1", "to_state": "s3"},
+        ],
+        start_state="s1",
+    )
+    shared = SharedDefinition(dump_table(definition))
+    ready = SimpleNamespace(ready=True, done=False)
+    assert shared.bind(ready).perform("a1").to_state == "s2"
+    not_ready = SimpleNamespace(ready=False, done=False)
+    assert shared.bind(not_ready).perform("a1").to_state == "s3"
+    assert len(shared.incoming_transitions("s2")) == 2
+    shared.close()
+
+
+def test_shared_timeouts():
+    definition = FsmDefinition(
+        states=[{"name": "s1", "timeout": 1.5, "on_timeout": "a1"}, "s2"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+    shared = SharedDefinition(dump_table(definition))
+    s1, s2 = shared.states
+    assert (s1.timeout, s1.on_timeout) == (1.5, "a1")
+    assert s2.timeout is None
+    shared.close()
+
+
+def test_shared_composite_states():
+    definition = FsmDefinition(
+        states=[
+            {"name": "on", "on_enter": "enter_on", "states": ["s1", "s2"]},
+            "off",
+        ],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "stop", "from_state": "on", "to_state": "off"},
+            {"action": "start", "from_state": "off", "to_state": "on"},
+        ],
+        start_state="off",
+    )
+    shared = SharedDefinition(dump_table(definition))
+    assert [s.name for s in shared.composite_states] == ["on"]
+    model = SimpleNamespace(calls=[])
+    model.enter_on = lambda: model.calls.append("enter_on")
+    machine = shared.bind(model)
+    machine.perform("start")
+    assert machine.state == "s1" and machine.is_in("on")
+    machine.perform("a1")
+    machine.perform("stop")
+    assert model.calls == ["enter_on"]
+    shared.close()
+
+
+def test_shared_multi_source():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {"action": "a1", "from_state": "*", "to_state": "s1"},
+            {"action": "a2", "from_state": ["s1", "s2"], "to_state": "s3"},
+        ],
+        start_state="s1",
+    )
+    shared = SharedDefinition(dump_table(definition))
+    a1, a2 = shared.transitions
+    assert (a1.from_state, a2.from_state) == ("*", ("s1", "s2"))
+    assert shared.states_accepting("a2") == {"s1", "s2"}
+    assert shared.incoming_transitions("s1") == (a1,)
+    shared.close()
@@ -0,0 +1,227 @@
+"""Test fsm.snapshot"""
+from types import SimpleNamespace
+
+import pytest
+
+from fsm import FsmDefinition, FsmError
+from fsm.snapshot import (
+    dump_definition,
+    dump_states,
+    load_definition,
+    load_states,
+    open_states,
+    read_definition,
+    restore_states,
+    write_definition,
+    write_states,
+)
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=[
+            "s1",
+            {
+                "name": "s2",
+                "on_enter": ["enter1", "enter2"],
+                "on_exit": "exit",
+            },
+        ],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {
+                "action": "a2",
+                "from_state": "s2",
+                "to_state": "s1",
+                "on_before": "before",
+                "on_after": "after",
+            },
+            {"action": "a3", "from_state": "s2", "to_state": "s3"},
+            {"action": "a1", "from_state": "s1", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+class Model:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda: self.calls.append(name)
+
+
+def test_definition_round_trip(definition, tmp_path):
+    loaded = load_definition(dump_definition(definition))
+    assert loaded.start_state == "s1"
+    assert loaded.state_names == definition.state_names
+    assert loaded.action_names == definition.action_names
+    assert [s.name for s in loaded.states] == ["s1", "s2"]
+    s2 = loaded.states[1]
+    assert s2.on_enter.callbacks == ["enter1", "enter2"]
+    assert s2.on_exit.callbacks == ["exit"]
+    assert loaded.get_actions("s1") == ["a1"]
+    assert loaded.get_actions("s2") == ["a2", "a3"]
+    assert loaded.states_accepting("a1") == {"s1"}
+    assert [t.from_state for t in loaded.incoming_transitions("s1")] == [
+        "s1",
+        "s2",
+    ]
+    assert list(loaded.table._next) == list(definition.table._next)
+
+    machine = loaded.bind(Model())
+    # the second a1 transition replaced the first
+    machine.perform("a1")
+    assert machine.state == "s1"
+
+    filename = tmp_path / "fsm.def"
+    write_definition(filename, definition)
+    loaded = read_definition(filename)
+    machine = loaded.bind(Model())
+    machine._set_state("s2")
+    machine.perform("a2")
+    assert machine.model.calls == ["before", "exit", "after"]
+
+
+def test_invalid_definition_snapshot(definition):
+    with pytest.raises(FsmError):
+        load_definition(b"garbage")
+    data = dump_definition(definition)
+    with pytest.raises(FsmError):
+        load_definition(data[:-4])
+
+
+def test_states_by_index(definition, tmp_path):
+    s1, s2 = definition.state_id("s1"), definition.state_id("s2")
+    data = dump_states(definition, [s2, s1, s2])
+    # one byte per entity
+    assert len(data) == 32 + 3
+    states = load_states(data, definition)
+    assert len(states) == 3
+    assert states.entity_ids is None
+    assert states.state(0) == "s2"
+    assert states.to_dict() == {0: s2, 1: s1, 2: s2}
+
+    machines = [definition.bind(Model()) for _ in range(3)]
+    restore_states(machines, states)
+    assert [m.state for m in machines] == ["s2", "s1", "s2"]
+    assert machines[0].model.calls == []
+
+
+def test_states_by_entity_id(definition, tmp_path):
+    s1, s2 = definition.state_id("s1"), definition.state_id("s2")
+    filename = tmp_path / "fsm.states"
+    write_states(filename, definition, [s1, s2], entity_ids=[10, 2 ** 40])
+    with open_states(filename, definition) as states:
+        assert states.to_dict() == {10: s1, 2 ** 40: s2}
+        machines = {2 ** 40: definition.bind(Model())}
+        restore_states(machines, states)
+        assert machines[2 ** 40].state == "s2"
+
+
+def test_states_mismatch(definition):
+    other = FsmDefinition(
+        states=["x"],
+        transitions=[{"action": "a", "from_state": "x", "to_state": "x"}],
+        start_state="x",
+    )
+    data = dump_states(definition, [0])
+    with pytest.raises(FsmError):
+        load_states(data, other)
+    with pytest.raises(FsmError):
+        load_states(data[:-1], definition)
+    with pytest.raises(ValueError):
+        dump_states(definition, [0, 1], entity_ids=[1])
+
+
+def test_guarded_definition_round_trip():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {
+                "action": "a1",
+                "from_state": "s1",
+                "to_state": "s2",
+                "guard": "count > 1",
+            },
+            {"action": "a1", "from_state": "s1", "to_state": "s3"},
+        ],
+        start_state="s1",
+    )
+    loaded = load_definition(dump_definition(definition))
+    assert [t.guard and t.guard.source for t in loaded.transitions] == [
+        "count > 1",
+        None,
+    ]
+    many = SimpleNamespace(count=2)
+    assert loaded.bind(many).perform("a1").to_state == "s2"
+    few = SimpleNamespace(count=0)
+    assert loaded.bind(few).perform("a1").to_state == "s3"
+
+
+def test_timeout_round_trip():
+    definition = FsmDefinition(
+        states=[{"name": "s1", "timeout": 1.5, "on_timeout": "a1"}, "s2"],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+    s1, s2 = load_definition(dump_definition(definition)).states
+    assert (s1.timeout, s1.on_timeout) == (1.5, "a1")
+    assert (s2.timeout, s2.on_timeout) == (None, None)
+
+
+def test_hierarchical_round_trip():
+    definition = FsmDefinition(
+        states=[
+            {
+                "name": "on",
+                "on_exit": "exit_on",
+                "states": [
+                    "idle",
+                    {"name": "busy", "on_enter": "enter_busy"},
+                ],
+            },
+            "off",
+        ],
+        transitions=[
+            {"action": "work", "from_state": "idle", "to_state": "busy"},
+            {"action": "stop", "from_state": "on", "to_state": "off"},
+            {"action": "start", "from_state": "off", "to_state": "on"},
+        ],
+        start_state="on",
+    )
+    loaded = load_definition(dump_definition(definition))
+    assert loaded.start_state == "idle"
+    assert [s.name for s in loaded.composite_states] == ["on"]
+    idle, busy, off = loaded.states
+    assert idle.parent is busy.parent is loaded.composite_states[0]
+    assert off.parent is None
+    assert loaded.composite_states[0].initial == "idle"
+
+    model = Model()
+    machine = loaded.bind(model)
+    machine.perform("work")
+    machine.perform("stop")
+    assert model.calls == ["enter_busy", "exit_on"]
+    machine.perform("start")
+    assert machine.state == "idle"
+
+
+def test_multi_source_round_trip():
+    definition = FsmDefinition(
+        states=["s1", "s2", "s3"],
+        transitions=[
+            {"action": "a1", "from_state": "*", "to_state": "s1"},
+            {"action": "a2", "from_state": ["s1", "s2"], "to_state": "s3"},
+            {"action": "a1", "from_state": "s3", "to_state": "s2"},
+        ],
+        start_state="s1",
+    )
+    loaded = load_definition(dump_definition(definition))
+    assert [(t.from_state, t.to_state) for t in loaded.transitions] == [
+        ("*", "s1"),
+        (("s1", "s2"), "s3"),
+        ("s3", "s2"),
+    ]
+    assert len(loaded.table._transitions) == 3
@@ -0,0 +1,97 @@
+"""Test fsm.stream"""
+import io
+
+import pytest
+
+from fsm import FsmDefinition, FsmError
+from fsm.stream import EventPipeline, read_events
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", "s2"],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+def test_read_events_csv(tmp_path):
+    filename = tmp_path / "events.csv"
+    filename.write_text("1,a1\n\n2 , a2\n")
+    assert list(read_events(str(filename), key_type=int)) == [
+        (1, "a1"),
+        (2, "a2"),
+    ]
+
+
+def test_read_events_jsonl():
+    source = io.StringIO(
+        '{"entity_id": "e1", "action": "a1"}\n'
+        '{"entity_id": "e2", "action": "a2"}\n'
+    )
+    assert list(read_events(source, format="jsonl")) == [
+        ("e1", "a1"),
+        ("e2", "a2"),
+    ]
+
+
+def test_read_events_is_lazy():
+    def lines():
+        yield "1,a1"
+        raise AssertionError("read too far")
+
+    events = read_events(lines())
+    assert next(events) == ("1", "a1")
+
+
+def test_read_events_invalid_format():
+    with pytest.raises(ValueError):
+        list(read_events([], format="xml"))
+
+
+def test_pipeline_run(definition):
+    machines = {key: definition.bind() for key in ("e1", "e2")}
+    pipeline = EventPipeline(machines, chunk_size=2)
+    events = [("e1", "a1"), ("e2", "a2"), ("e3", "a1"), ("e1", "a2")]
+    results = list(pipeline.run(events))
+    assert [(r.entity, r.state) for r in results] == [
+        ("e1", "s2"),
+        ("e2", "s1"),
+        ("e3", None),
+        ("e1", "s1"),
+    ]
+    assert results[0].error is None
+    assert isinstance(results[1].error, FsmError)
+    assert isinstance(results[2].error, FsmError)
+    assert pipeline.stats.events == 4
+    assert pipeline.stats.errors == 2
+    assert pipeline.stats.report()["events"] == 4
+
+
+def test_pipeline_binds_on_first_use(definition):
+    machines = {}
+
+    def lookup(key):
+        machine = machines.get(key)
+        if machine is None:
+            machine = machines[key] = definition.bind()
+        return machine
+
+    stats = EventPipeline(lookup).consume(
+        read_events(["1,a1", "2,a1", "1,a2"], key_type=int)
+    )
+    assert stats.errors == 0
+    assert machines[1].state == "s1" and machines[2].state == "s2"
+
+
+def test_pipeline_errors_only(definition):
+    machines = {"e1": definition.bind()}
+    pipeline = EventPipeline(machines)
+    results = list(
+        pipeline.run([("e1", "a1"), ("e1", "a1")], errors_only=True)
+    )
+    assert len(results) == 1 and results[0].error is not None
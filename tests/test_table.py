@@ -0,0 +1,51 @@
+"""Test fsm.table"""
+from fsm import State, Transition
+from fsm.table import NO_TRANSITION, TransitionTable
+
+
+def test_intern_state():
+    table = TransitionTable()
+    assert table.intern_state("s1") == 0
+    assert table.intern_state("s2") == 1
+    assert table.intern_state("s1") == 0
+    assert table.state_names == ("s1", "s2")
+    assert table.state_id("s2") == 1
+    assert table.state_id("unknown") is None
+
+
+def test_intern_action_widens_table():
+    table = TransitionTable()
+    table.add_state(State("s1"))
+    table.add_state(State("s2"))
+    table.add_transition(Transition("a1", "s1", "s2"))
+    table.add_transition(Transition("a2", "s2", "s1"))
+    table.add_transition(Transition("a3", "s2", "s2"))
+    assert table.action_names == ("a1", "a2", "a3")
+    assert table.stride >= 3
+    assert table.lookup(0, 0) == (1, 0)
+    assert table.lookup(1, 1) == (0, 1)
+    assert table.lookup(1, 2) == (1, 2)
+    assert table.lookup(0, 1) == (NO_TRANSITION, NO_TRANSITION)
+
+
+def test_lookup_out_of_range_action():
+    table = TransitionTable()
+    table.add_transition(Transition("a1", "s1", "s2"))
+    assert table.lookup(0, -1) == (NO_TRANSITION, NO_TRANSITION)
+    assert table.lookup(0, 10) == (NO_TRANSITION, NO_TRANSITION)
+
+
+def test_add_transition_replaces():
+    table = TransitionTable()
+    table.add_transition(Transition("a1", "s1", "s2"))
+    tid = table.add_transition(Transition("a1", "s1", "s3"))
+    assert table.lookup(0, 0) == (table.state_id("s3"), tid)
+
+
+def test_add_transition_to_several_states():
+    table = TransitionTable()
+    t = Transition("a1", ("s1", "s2"), "s3")
+    tid = table.add_transition(t, ("s1", "s2"))
+    assert table.state_names == ("s1", "s2", "s3")
+    assert table.lookup(0, 0) == table.lookup(1, 0) == (2, tid)
+    assert table._transitions == [t]
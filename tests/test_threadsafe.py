@@ -0,0 +1,109 @@
+"""Test fsm.threadsafe"""
+from threading import Thread
+
+import pytest
+
+from fsm import FsmDefinition, FsmError
+from fsm.threadsafe import (
+    ThreadSafeBoundFsm,
+    ThreadSafeDescriptorBoundFsm,
+    ThreadSafeFsm,
+)
+from fsm.model import MACHINE_ATTR
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=["s1", {"name": "s2", "on_enter": "on_enter"}],
+        transitions=[
+            {"action": "a1", "from_state": "s1", "to_state": "s2"},
+            {"action": "a2", "from_state": "s2", "to_state": "s1"},
+        ],
+        start_state="s1",
+    )
+
+
+class Model:
+    __slots__ = ("state", "enters")
+
+    def __init__(self):
+        self.enters = 0
+
+    def on_enter(self):
+        self.enters += 1
+
+
+class DescriptorModel:
+    __slots__ = (MACHINE_ATTR,)
+
+
+def test_bind_thread_safe(definition):
+    assert isinstance(definition.bind(thread_safe=True), ThreadSafeBoundFsm)
+    assert isinstance(
+        definition.bind(DescriptorModel(), descriptors=True, thread_safe=True),
+        ThreadSafeDescriptorBoundFsm,
+    )
+
+
+def test_perform_if(definition):
+    machine = definition.bind(thread_safe=True)
+    assert machine.perform_if("s2", "a2") is None
+    assert machine.state == "s1"
+    assert machine.perform_if("s1", "a1").to_state == "s2"
+    with pytest.raises(FsmError):
+        machine.perform_if("s2", "a1")
+
+
+def test_perform_many_concurrent(definition):
+    model = Model()
+    machine = definition.bind(model, thread_safe=True)
+
+    def run():
+        for _ in range(200):
+            machine.perform_many(["a1", "a2"])
+
+    threads = [Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert model.enters == 800 and machine.state == "s1"
+
+
+def test_perform_if_concurrent(definition):
+    model = Model()
+    machine = definition.bind(model, thread_safe=True)
+    performed = []
+
+    def worker():
+        for _ in range(1000):
+            if machine.perform_if("s1", "a1"):
+                performed.append("a1")
+            if machine.perform_if("s2", "a2"):
+                performed.append("a2")
+
+    threads = [Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # every a1 entered s2 exactly once and transitions strictly alternate
+    assert model.enters == performed.count("a1")
+    assert abs(performed.count("a1") - performed.count("a2")) <= 1
+
+
+def test_thread_safe_fsm(definition):
+    model = DescriptorModel()
+    fsm = ThreadSafeFsm(
+        model=model,
+        states=definition.states,
+        transitions=definition.transitions,
+        start_state="s1",
+        feedback=False,
+        descriptors=True,
+    )
+    model.a1()
+    assert fsm.perform_if("s2", "a2").to_state == "s1"
+    assert model.is_s1()
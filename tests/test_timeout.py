@@ -0,0 +1,241 @@
+"""Test fsm.timeout"""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import voluptuous as vol
+
+from fsm import FsmDefinition, FsmError, State, STATE_SCHEMA
+from fsm.aio import AsyncFsm
+from fsm.observer import Observer
+from fsm.timeout import TimeoutScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(name="definition")
+def fixture_definition():
+    return FsmDefinition(
+        states=[
+            {"name": "pending", "timeout": 30, "on_timeout": "expire"},
+            "paid",
+            "expired",
+        ],
+        transitions=[
+            {"action": "pay", "from_state": "pending", "to_state": "paid"},
+            {
+                "action": "expire",
+                "from_state": "pending",
+                "to_state": "expired",
+            },
+            {"action": "poke", "from_state": "pending", "to_state": "pending"},
+            {"action": "reopen", "from_state": "paid", "to_state": "pending"},
+        ],
+        start_state="pending",
+    )
+
+
+def test_state_timeout_validation():
+    assert State("s1", timeout=1, on_timeout="a1").timeout == 1.0
+    with pytest.raises(ValueError):
+        State("s1", timeout=1)
+    with pytest.raises(ValueError):
+        State("s1", timeout=0, on_timeout="a1")
+
+    STATE_SCHEMA({"name": "s1", "timeout": "1.5", "on_timeout": "a1"})
+    for data in (
+        {"name": "s1", "timeout": 1},
+        {"name": "s1", "on_timeout": "a1"},
+        {"name": "s1", "timeout": -1, "on_timeout": "a1"},
+    ):
+        with pytest.raises(vol.MultipleInvalid):
+            STATE_SCHEMA(data)
+
+
+def test_timeouts_fire_when_due(definition):
+    clock = Clock()
+    scheduler = TimeoutScheduler(clock)
+    machines = [definition.bind() for _ in range(3)]
+    for machine in machines:
+        scheduler.attach(machine)
+        clock.now += 10
+    assert len(scheduler) == 3
+    assert scheduler.next_deadline() == 30
+
+    assert scheduler.run_due(now=29) == []
+    clock.now = 45
+    performed = scheduler.run_due()
+    assert [t.action for t in performed] == ["expire", "expire"]
+    assert [m.state for m in machines] == ["expired", "expired", "pending"]
+    assert len(scheduler) == 1
+    assert scheduler.deadline(machines[2]) == 50
+
+
+def test_leaving_state_cancels(definition):
+    clock = Clock()
+    scheduler = TimeoutScheduler(clock)
+    machine = definition.bind()
+    scheduler.attach(machine)
+
+    # self transitions do not leave the state
+    clock.now = 20
+    machine.perform("poke")
+    assert scheduler.deadline(machine) == 30
+
+    machine.perform("pay")
+    assert scheduler.deadline(machine) is None
+    assert scheduler.next_deadline() is None
+
+    # entering again schedules a new timeout
+    machine.perform("reopen")
+    assert scheduler.deadline(machine) == 50
+    clock.now = 40
+    assert scheduler.run_due() == []
+    clock.now = 50
+    scheduler.run_due()
+    assert machine.state == "expired"
+
+
+def test_attach_detach(definition):
+    scheduler = TimeoutScheduler(Clock())
+    machine = definition.bind()
+    scheduler.attach(machine)
+    scheduler.attach(machine)
+    assert len(scheduler) == 1
+    with pytest.raises(FsmError):
+        TimeoutScheduler().attach(machine)
+    scheduler.detach(machine)
+    assert len(scheduler) == 0
+    assert scheduler.run_due(now=100) == []
+    with pytest.raises(FsmError):
+        scheduler.detach(machine)
+
+
+def test_cancelled_entries_compacted(definition):
+    clock = Clock()
+    scheduler = TimeoutScheduler(clock)
+    machine = definition.bind()
+    scheduler.attach(machine)
+    for _ in range(5000):
+        machine.perform("pay")
+        machine.perform("reopen")
+    assert len(scheduler) == 1
+    assert len(scheduler._heap) < 2100
+    clock.now = 30
+    assert len(scheduler.run_due()) == 1
+
+
+def test_sync_driver():
+    scheduler = TimeoutScheduler()
+    definition = FsmDefinition(
+        states=[
+            {"name": "s1", "timeout": 0.01, "on_timeout": "a1"},
+            {"name": "s2", "on_enter": "on_enter"},
+        ],
+        transitions=[{"action": "a1", "from_state": "s1", "to_state": "s2"}],
+        start_state="s1",
+    )
+
+    class Model:
+        def on_enter(self):
+            scheduler.stop()
+
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    machine = definition.bind(Model())
+    scheduler.attach(machine)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert machine.state == "s2"
+
+
+def test_async_driver():
+    fsm_data = {
+        "start_state": "s1",
+        "states": [
+            {"name": "s1", "timeout": 0.01, "on_timeout": "a1"},
+            {"name": "s2", "on_enter": "on_enter"},
+        ],
+        "transitions": [
+            {"action": "a1", "from_state": "s1", "to_state": "s2"}
+        ],
+    }
+
+    class Model:
+        def __init__(self):
+            self.entered = asyncio.Event()
+
+        async def on_enter(self):
+            self.entered.set()
+
+    async def main():
+        scheduler = TimeoutScheduler()
+        task = asyncio.ensure_future(scheduler.arun())
+        model = Model()
+        machine = AsyncFsm(model=model, feedback=False, **fsm_data)
+        scheduler.attach(machine)
+        await asyncio.wait_for(model.entered.wait(), 5)
+        scheduler.stop()
+        await asyncio.wait_for(task, 5)
+        return machine.state
+
+    assert asyncio.run(main()) == "s2"
+
+
+def test_failed_timeout_actions_do_not_stop_others():
+    definition = FsmDefinition(
+        states=[{"name": "p", "timeout": 1, "on_timeout": "go"}, "q"],
+        transitions=[
+            {
+                "action": "go",
+                "from_state": "p",
+                "to_state": "q",
+                "guard": "allowed",
+            }
+        ],
+        start_state="p",
+    )
+
+    class Errors(Observer):
+        def __init__(self):
+            self.errors = []
+
+        def invalid_action(self, machine, action, error):
+            self.errors.append(action)
+
+    scheduler = TimeoutScheduler(Clock())
+    observer = Errors()
+    machines = []
+    for allowed in (False, True, True):
+        machine = definition.bind(SimpleNamespace(allowed=allowed))
+        machine.add_observer(observer)
+        scheduler.attach(machine)
+        machines.append(machine)
+    performed = scheduler.run_due(now=1)
+    assert len(performed) == 2
+    assert [m.state for m in machines] == ["p", "q", "q"]
+    assert observer.errors == ["go"]
+
+    async def main():
+        machine = definition.bind(SimpleNamespace(allowed=False))
+        scheduler.attach(machine)
+        return await scheduler.arun_due(now=10)
+
+    assert asyncio.run(main()) == []
+
+
+def test_timeout_action_needs_transition():
+    with pytest.raises(ValueError):
+        FsmDefinition(
+            states=[{"name": "p", "timeout": 1, "on_timeout": "go"}, "q"],
+            transitions=[{"action": "go", "from_state": "q", "to_state": "p"}],
+            start_state="p",
+        )
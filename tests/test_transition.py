@@ -40,3 +40,11 @@ def test_state_add_on_exit():
     t.on_after.add(cb1)
     assert t.on_after.callbacks == [cb1]
 
+
+
+def test_multi_source_transition():
+    assert not Transition("action", "from", "to").multi_source
+    t = Transition("action", ["from1", "from2"], "to")
+    assert t.from_state == ("from1", "from2")
+    assert t.multi_source
+    assert Transition("action", "*", "to").multi_source
@@ -2,7 +2,12 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from fsm.util import as_cb_list, CallbackManager
+from fsm.util import (
+    as_cb_list,
+    CallbackManager,
+    InstanceCallback,
+    resolve_callback,
+)
 
 
 def test_as_list_with_valids():
@@ -44,3 +49,34 @@ def test_callback_manager_call_on():
     cbm.call_on(model)
     assert model.cb1.called
     assert model.cb2.called
+
+
+def test_callback_manager_resolve():
+    class Model:
+        def cb1(self):
+            pass
+
+    model = Model()
+    model.cb2 = MagicMock(name="cb2")
+    cbm = CallbackManager(["cb1", "cb2", "missing"])
+    cb1, cb2, missing = cbm.resolve(Model, model)
+    assert cb1 is Model.cb1
+    assert isinstance(cb2, InstanceCallback)
+    assert isinstance(missing, InstanceCallback)
+    cb2(model)
+    missing(model)
+    assert model.cb2.called
+    assert CallbackManager().resolve(Model) == ()
+
+
+def test_resolve_callback_instance_override():
+    class Model:
+        def cb1(self):
+            pass
+
+    model = Model()
+    model.cb1 = MagicMock(name="cb1")
+    assert resolve_callback("cb1", Model) is Model.cb1
+    cb = resolve_callback("cb1", Model, model)
+    cb(model)
+    assert model.cb1.called